@@ -0,0 +1,6 @@
+import sys
+
+from pyexec.mining.resultStore import main
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -2,7 +2,7 @@ from pathlib import Path
 from timeit import default_timer as time
 from typing import List, Optional
 
-from plumbum.cmd import find, sed, timeout, v2
+from plumbum import local
 
 from pyexec.util.dependencies import Dependencies
 from pyexec.util.exceptions import (
@@ -11,6 +11,9 @@ from pyexec.util.exceptions import (
     TimeoutException,
 )
 from pyexec.util.logging import get_logger
+from pyexec.util.process import run_with_timeout
+from pyexec.util.resources import ResourceUsage
+from pyexec.util.trace import span
 
 
 class InferDockerfile:
@@ -32,7 +35,7 @@ class InferDockerfile:
             self.__project_path = project_path
             self.__project_name = project_name
             self.__python_path = (
-                find[
+                local["find"][
                     self.__project_path,
                     "-type",
                     "d",
@@ -51,11 +54,14 @@ class InferDockerfile:
                     "-printf",
                     ":%p",
                 ]
-                | sed["s|{}|/mnt/projectdir|g".format(self.__project_path)]
+                | local["sed"]["s|{}|/mnt/projectdir|g".format(self.__project_path)]
             )()
             self.__logger = get_logger("Pyexec::InferDockerfile", logfile)
 
-    def infer_dockerfile(self, timeout: Optional[int] = None) -> Dependencies:
+    def infer_dockerfile(
+        self, timeout: Optional[float] = None, usage: Optional[ResourceUsage] = None
+    ) -> Dependencies:
+        """Runs V2 on every file, adding the resources it uses to usage."""
         self.__logger.info(
             "Start inferring dependencies for package {}".format(
                 self.__project_path.name
@@ -79,7 +85,7 @@ class InferDockerfile:
             if timeout is not None:
                 runtime = time() - startTime
                 if runtime < timeout:
-                    df = self.__execute_v2(f, int(timeout - runtime))
+                    df = self.__execute_v2(f, timeout - runtime, usage)
                 else:
                     self.__logger.debug("Timed out on file {}".format(f))
                     self.__logger.info(
@@ -87,7 +93,7 @@ class InferDockerfile:
                     )
                     raise TimeoutException("Timed out on file {}".format(f))
             else:
-                df = self.__execute_v2(f)
+                df = self.__execute_v2(f, usage=usage)
 
             if df is None:
                 self.__logger.debug("No environment found for file {}".format(f))
@@ -111,7 +117,7 @@ class InferDockerfile:
             raise e
 
     def __find_python_files(self) -> List[Path]:
-        command = find[
+        command = local["find"][
             self.__project_path,
             "-type",
             "f",
@@ -139,40 +145,30 @@ class InferDockerfile:
         return [Path(line) for line in command().splitlines()]
 
     def __execute_v2(
-        self, file_path: Path, tout: Optional[int] = None
+        self,
+        file_path: Path,
+        tout: Optional[float] = None,
+        usage: Optional[ResourceUsage] = None,
     ) -> Optional[Dependencies]:
-        if tout is not None:
-            command = timeout[
-                tout,
-                "v2",
-                "run",
-                "--projectdir",
-                self.__project_path,
-                "--environment",
-                "PYTHONPATH={}".format(self.__python_path),
-                "--exclude",
-                self.__project_path.name.lower(),
-                file_path,
-            ]
-        else:
-            command = v2[
-                "run",
-                "--projectdir",
-                self.__project_path,
-                "--environment",
-                "PYTHONPATH={}".format(self.__python_path),
-                "--exclude",
-                self.__project_name,
-                file_path,
-            ]
+        command = local["v2"][
+            "run",
+            "--projectdir",
+            self.__project_path,
+            "--environment",
+            "PYTHONPATH={}".format(self.__python_path),
+            "--exclude",
+            self.__project_name,
+            file_path,
+        ]
 
         try:
-            ret, out, _ = command.run(retcode=None)
+            # V2 and everything it started is killed on timeout
+            with span("v2", "inference", file=file_path.name):
+                ret, out, _ = run_with_timeout(command, tout, usage=usage)
         except OSError:
             self.__logger.warning("Caught OSError")
             return None  # Reason this can be thrown: Too long argument list
-
-        if tout is not None and ret == 124:  # Timeout triggered, see 'man timeout'
+        except TimeoutException:
             self.__logger.debug("Timed out on file {}".format(file_path))
             self.__logger.info("Timed out on project {}".format(self.__project_name))
             raise TimeoutException("V2 timed out on file {}".format(file_path.name))
@@ -0,0 +1,718 @@
+import http.client
+import json
+import re
+import socket
+import struct
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from subprocess import PIPE, Popen, TimeoutExpired
+from threading import Thread
+from timeit import default_timer as time
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from plumbum import local
+
+from pyexec.dockerTools.buildContext import BuildContext
+from pyexec.util.capture import OutputCapture, SpillLog
+from pyexec.util.logging import get_logger
+from pyexec.util.resources import (
+    ContainerSampler,
+    ResourceUsage,
+    cgroup_usage,
+    engine_usage,
+)
+
+
+@dataclass
+class BuildResult:
+    success: bool
+    image_id: Optional[str]
+    duration: float
+    bytes_transferred: int
+    log: str  # The tail of the build output
+    timed_out: bool = False
+
+
+@dataclass
+class RunResult:
+    exit_code: Optional[int]  # None if the container was killed on timeout
+    stdout: str  # The tail of the output, the complete output goes to the spill log
+    stderr: str
+    duration: float
+    bytes_transferred: int
+    usage: Optional[ResourceUsage] = None  # None if it could not be measured
+
+    @property
+    def timed_out(self) -> bool:
+        return self.exit_code is None
+
+
+@dataclass
+class ContainerSpec:
+    image: str
+    name: str
+    command: Optional[List[str]] = None
+    workdir: Optional[str] = None
+    volumes: List[str] = field(default_factory=list)  # host:container[:ro]
+    tmpfs: Dict[str, str] = field(default_factory=dict)  # path -> mount options
+    cpus: Optional[float] = None
+    memory: Optional[int] = None  # in bytes
+    user: Optional[str] = None  # uid:gid
+    log: Optional[SpillLog] = None
+
+
+@dataclass
+class ImageInfo:
+    id: str
+    tags: List[str]
+    size: int
+    created: float  # seconds since the epoch
+    labels: Dict[str, str] = field(default_factory=dict)
+
+
+class DockerBackend(ABC):
+    """Executes the docker operations pyexec needs."""
+
+    @abstractmethod
+    def build(
+        self,
+        tag: str,
+        context: BuildContext,
+        *,
+        no_cache: bool = True,
+        network: Optional[str] = None,
+        labels: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        log: Optional[SpillLog] = None,
+    ) -> BuildResult:
+        raise NotImplementedError("Implement build()")
+
+    @abstractmethod
+    def run(self, spec: ContainerSpec, timeout: Optional[float] = None) -> RunResult:
+        raise NotImplementedError("Implement run()")
+
+    @abstractmethod
+    def remove_image(self, tag: str, *, force: bool = True) -> bool:
+        raise NotImplementedError("Implement remove_image()")
+
+    @abstractmethod
+    def image_size(self, tag: str) -> Optional[int]:
+        """Returns the size of the image, None if there is no such image."""
+        raise NotImplementedError("Implement image_size()")
+
+    @abstractmethod
+    def list_images(self, label: str) -> List[ImageInfo]:
+        """Returns all images carrying the given label, including untagged ones."""
+        raise NotImplementedError("Implement list_images()")
+
+    @abstractmethod
+    def prune_dangling_images(self, label: Optional[str] = None) -> None:
+        """Removes dangling images, only those carrying label if it is given."""
+        raise NotImplementedError("Implement prune_dangling_images()")
+
+    @abstractmethod
+    def prune_build_cache(self, keep_storage: int) -> int:
+        """
+        Removes the least recently used build cache until at most keep_storage bytes
+        are left. Returns the number of bytes reclaimed.
+        """
+        raise NotImplementedError("Implement prune_build_cache()")
+
+    @abstractmethod
+    def pull_image(self, tag: str) -> bool:
+        """Pulls the image from its registry, returns whether it succeeded."""
+        raise NotImplementedError("Implement pull_image()")
+
+    def image_exists(self, tag: str) -> bool:
+        return self.image_size(tag) is not None
+
+
+class CliBackend(DockerBackend):
+    """Runs the docker command line client for every operation."""
+
+    def __init__(self, logfile: Optional[Path] = None) -> None:
+        self.__logger = get_logger("Pyexec::CliBackend", logfile)
+        self.__docker = local["docker"]
+
+    def build(
+        self,
+        tag: str,
+        context: BuildContext,
+        *,
+        no_cache: bool = True,
+        network: Optional[str] = None,
+        labels: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        log: Optional[SpillLog] = None,
+    ) -> BuildResult:
+        start = time()
+        build = self.__docker["build", "-q", "--force-rm", "-t", tag]
+        if no_cache:
+            build = build["--no-cache"]
+        if network is not None:
+            build = build["--network", network]
+        for key, value in (labels or dict()).items():
+            build = build["--label", "{}={}".format(key, value)]
+
+        size = 0
+        process = Popen(build["-"].formulate(), stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = _pipes(process)
+        out, err = OutputCapture(), OutputCapture(spill=log)
+        readers = [out.drain_in_background(stdout), err.drain_in_background(stderr)]
+        assert process.stdin is not None
+        try:
+            # docker build reads the whole context before it reports anything
+            size = context.write_tarball(process.stdin)
+            process.stdin.close()
+        except BrokenPipeError:
+            self.__logger.debug("docker build stopped reading the build context")
+        timed_out = False
+        try:
+            remaining = None if timeout is None else max(timeout - (time() - start), 0)
+            process.wait(timeout=remaining)
+        except TimeoutExpired:
+            # The daemon cancels the build once the client disconnects
+            process.kill()
+            process.wait()
+            timed_out = True
+        _join(readers)
+        image_id = out.tail().strip()
+        return BuildResult(
+            success=process.returncode == 0 and image_id != "" and not timed_out,
+            image_id=image_id if image_id != "" else None,
+            duration=time() - start,
+            bytes_transferred=size,
+            log=err.tail(),
+            timed_out=timed_out,
+        )
+
+    def run(self, spec: ContainerSpec, timeout: Optional[float] = None) -> RunResult:
+        start = time()
+        arguments = ["run", "--name", spec.name, "--rm"]
+        for volume in spec.volumes:
+            arguments = arguments + ["-v", volume]
+        for path, options in spec.tmpfs.items():
+            arguments = arguments + ["--tmpfs", "{}:{}".format(path, options)]
+        if spec.workdir is not None:
+            arguments = arguments + ["-w", spec.workdir]
+        if spec.user is not None:
+            arguments = arguments + ["--user", spec.user]
+        if spec.cpus is not None:
+            arguments = arguments + ["--cpus", str(spec.cpus)]
+        if spec.memory is not None:
+            arguments = arguments + ["--memory", "{}b".format(spec.memory)]
+        arguments.append(spec.image)
+        if spec.command is not None:
+            arguments = arguments + spec.command
+
+        process = Popen(self.__docker[arguments].formulate(), stdout=PIPE, stderr=PIPE)
+        stdout, stderr = _pipes(process)
+        out, err = OutputCapture(spill=spec.log), OutputCapture(spill=spec.log)
+        readers = [out.drain_in_background(stdout), err.drain_in_background(stderr)]
+        sampler = ContainerSampler(self.__sample(spec.name))
+        exit_code: Optional[int] = None
+        try:
+            exit_code = process.wait(timeout=timeout)
+        except TimeoutExpired:
+            # Killing the client would leave the container running
+            self.__docker["kill", spec.name].run(retcode=None)
+            process.wait()
+        _join(readers)
+        return RunResult(
+            exit_code=exit_code,
+            stdout=out.tail(),
+            stderr=err.tail(),
+            duration=time() - start,
+            bytes_transferred=out.total + err.total,
+            usage=sampler.stop(),
+        )
+
+    def __sample(self, name: str) -> Callable[[], Optional[ResourceUsage]]:
+        """Reads the cgroup of the container, once its main process is known."""
+        pid = 0
+
+        def sample() -> Optional[ResourceUsage]:
+            nonlocal pid
+            if pid == 0:
+                ret, out, _ = self.__docker[
+                    "inspect", "-f", "{{.State.Pid}}", name
+                ].run(retcode=None)
+                if ret != 0 or not out.strip().isdigit():
+                    return None
+                pid = int(out.strip())
+                if pid == 0:  # Not started yet
+                    return None
+            return cgroup_usage(pid)
+
+        return sample
+
+    def remove_image(self, tag: str, *, force: bool = True) -> bool:
+        arguments = ["rmi", "-f", tag] if force else ["rmi", tag]
+        ret, _, _ = self.__docker[arguments].run(retcode=None)
+        return ret == 0
+
+    def image_size(self, tag: str) -> Optional[int]:
+        ret, out, _ = self.__docker["image", "inspect", "-f", "{{.Size}}", tag].run(
+            retcode=None
+        )
+        return int(out.strip()) if ret == 0 else None
+
+    def pull_image(self, tag: str) -> bool:
+        ret, _, _ = self.__docker["pull", "-q", tag].run(retcode=None)
+        return ret == 0
+
+    def list_images(self, label: str) -> List[ImageInfo]:
+        ret, out, _ = self.__docker[
+            "image", "ls", "-aq", "--no-trunc", "--filter", "label={}".format(label)
+        ].run(retcode=None)
+        ids = sorted(set(out.split()))
+        if ret != 0 or len(ids) == 0:
+            return []
+        ret, out, _ = self.__docker["image", "inspect", ids].run(retcode=None)
+        if ret != 0:
+            return []
+        return [_image_info(image) for image in json.loads(out)]
+
+    def prune_dangling_images(self, label: Optional[str] = None) -> None:
+        prune = self.__docker["image", "prune", "-f"]
+        if label is not None:
+            prune = prune["--filter", "label={}".format(label)]
+        prune.run(retcode=None)
+
+    def prune_build_cache(self, keep_storage: int) -> int:
+        ret, out, _ = self.__docker[
+            "builder", "prune", "-f", "--keep-storage", "{}b".format(keep_storage)
+        ].run(retcode=None)
+        if ret != 0:
+            return 0
+        match = re.search(r"Total:\s*([0-9.]+)\s*([kKMGT]?B)", out)
+        if match is None:
+            return 0
+        unit = match.group(2).upper()
+        exponent = ["B", "KB", "MB", "GB", "TB"].index(unit)
+        return int(float(match.group(1)) * 1000 ** exponent)
+
+
+def _join(readers: List[Thread]) -> None:
+    for reader in readers:
+        reader.join()
+
+
+def _pipes(process: "Popen[bytes]") -> Tuple[IO[bytes], IO[bytes]]:
+    """The stdout and stderr of a process started with both piped."""
+    assert process.stdout is not None and process.stderr is not None
+    return process.stdout, process.stderr
+
+
+def _image_info(image: Dict[str, Any]) -> ImageInfo:
+    created = image.get("Created", 0)
+    if isinstance(created, str):
+        # The daemon reports RFC 3339 with nanoseconds, which fromisoformat rejects
+        created = datetime.strptime(created[:19], "%Y-%m-%dT%H:%M:%S")
+        created = created.replace(tzinfo=timezone.utc).timestamp()
+    # docker image inspect nests the labels in the config, the image list does not
+    labels = image.get("Labels") or (image.get("Config") or dict()).get("Labels")
+    return ImageInfo(
+        id=image["Id"],
+        tags=[t for t in image.get("RepoTags") or [] if t != "<none>:<none>"],
+        size=int(image.get("Size", 0)),
+        created=float(created),
+        labels=labels or dict(),
+    )
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.__socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.__socket_path)
+
+
+class _ChunkedWriter:
+    """File-like object sending everything written as chunked request body."""
+
+    def __init__(self, connection: http.client.HTTPConnection) -> None:
+        self.__connection = connection
+
+    def write(self, data: bytes) -> int:
+        if len(data) > 0:
+            self.__connection.send(b"%x\r\n%s\r\n" % (len(data), data))
+        return len(data)
+
+    def close(self) -> None:
+        self.__connection.send(b"0\r\n\r\n")
+
+
+class EngineApiBackend(DockerBackend):
+    """
+    Talks to the Docker Engine API over its unix socket.
+
+    Every thread keeps its connection open between requests. Build progress and
+    container output are read from the daemon as they arrive.
+    """
+
+    api_version = "v1.41"
+    __idempotent = ("GET", "HEAD", "DELETE")
+
+    def __init__(
+        self, socket_path: str = "/var/run/docker.sock", logfile: Optional[Path] = None
+    ) -> None:
+        self.__logger = get_logger("Pyexec::EngineApiBackend", logfile)
+        self.__socket_path = socket_path
+        self.__connections = threading.local()
+
+    def build(
+        self,
+        tag: str,
+        context: BuildContext,
+        *,
+        no_cache: bool = True,
+        network: Optional[str] = None,
+        labels: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        log: Optional[SpillLog] = None,
+    ) -> BuildResult:
+        start = time()
+        query: Dict[str, Any] = {"t": tag, "forcerm": 1, "nocache": int(no_cache)}
+        if network is not None:
+            query["networkmode"] = network
+        if labels:
+            query["labels"] = json.dumps(labels)
+
+        # The context is streamed on a connection of its own, closing it cancels
+        # the build
+        connection = _UnixHTTPConnection(self.__socket_path, timeout=timeout)
+        output = OutputCapture(spill=log)
+        image_id: Optional[str] = None
+        size = 0
+        success = False
+        timed_out = False
+        try:
+            connection.putrequest("POST", self.__url("/build", query))
+            connection.putheader("Content-Type", "application/x-tar")
+            connection.putheader("Transfer-Encoding", "chunked")
+            connection.endheaders()
+            body = _ChunkedWriter(connection)
+            size = context.write_tarball(body)  # type: ignore
+            body.close()
+            response = connection.getresponse()
+
+            success = response.status == 200
+            for message in self.__json_stream(response):
+                if "stream" in message:
+                    output.write(message["stream"].encode())
+                if "aux" in message and "ID" in message["aux"]:
+                    image_id = message["aux"]["ID"]
+                if "error" in message:
+                    output.write(message["error"].encode())
+                    success = False
+                if timeout is not None and time() - start > timeout:
+                    timed_out = True
+                    break
+        except socket.timeout:
+            timed_out = True
+        finally:
+            connection.close()
+        return BuildResult(
+            success=success and image_id is not None and not timed_out,
+            image_id=image_id,
+            duration=time() - start,
+            bytes_transferred=size,
+            log=output.tail(),
+            timed_out=timed_out,
+        )
+
+    def run(self, spec: ContainerSpec, timeout: Optional[float] = None) -> RunResult:
+        start = time()
+        host_config: Dict[str, Any] = {"Binds": spec.volumes, "Tmpfs": spec.tmpfs}
+        if spec.cpus is not None:
+            host_config["NanoCpus"] = int(spec.cpus * 1e9)
+        if spec.memory is not None:
+            host_config["Memory"] = spec.memory
+        create: Dict[str, Any] = {"Image": spec.image, "HostConfig": host_config}
+        if spec.command is not None:
+            create["Cmd"] = spec.command
+        if spec.workdir is not None:
+            create["WorkingDir"] = spec.workdir
+        if spec.user is not None:
+            create["User"] = spec.user
+
+        status, created = self.__request(
+            "POST", "/containers/create", {"name": spec.name}, create
+        )
+        if status != 201:
+            raise RuntimeError(
+                "Could not create container {}: {}".format(spec.name, created)
+            )
+        container = created["Id"]
+        try:
+            self.__request("POST", "/containers/{}/start".format(container))
+            stdout = OutputCapture(spill=spec.log)
+            stderr = OutputCapture(spill=spec.log)
+            sampler = ContainerSampler(lambda: self.__stats(container))
+            try:
+                killed = self.__follow_logs(container, timeout, stdout, stderr)
+            finally:
+                usage = sampler.stop()
+            if killed:
+                self.__request("POST", "/containers/{}/kill".format(container))
+            _, waited = self.__request("POST", "/containers/{}/wait".format(container))
+            return RunResult(
+                exit_code=None if killed else waited.get("StatusCode"),
+                stdout=stdout.tail(),
+                stderr=stderr.tail(),
+                duration=time() - start,
+                bytes_transferred=stdout.total + stderr.total,
+                usage=usage,
+            )
+        finally:
+            self.__request(
+                "DELETE", "/containers/{}".format(container), {"force": "true"}
+            )
+
+    def remove_image(self, tag: str, *, force: bool = True) -> bool:
+        status, _ = self.__request(
+            "DELETE", "/images/{}".format(quote(tag, safe="")), {"force": int(force)}
+        )
+        return status == 200
+
+    def image_size(self, tag: str) -> Optional[int]:
+        status, image = self.__request(
+            "GET", "/images/{}/json".format(quote(tag, safe=""))
+        )
+        return int(image["Size"]) if status == 200 else None
+
+    def pull_image(self, tag: str) -> bool:
+        image, _, version = tag.rpartition(":")
+        if image == "" or "/" in version:  # No tag, the colon is part of a registry
+            image, version = tag, "latest"
+        status, progress = self.__request(
+            "POST", "/images/create", {"fromImage": image, "tag": version}
+        )
+        # Errors during the pull are reported in the progress stream
+        return status == 200 and '"error"' not in str(progress)
+
+    def list_images(self, label: str) -> List[ImageInfo]:
+        status, images = self.__request(
+            "GET",
+            "/images/json",
+            {"all": 1, "filters": json.dumps({"label": [label]})},
+        )
+        if status != 200:
+            return []
+        return [_image_info(image) for image in images]
+
+    def prune_dangling_images(self, label: Optional[str] = None) -> None:
+        filters: Dict[str, List[str]] = {"dangling": ["true"]}
+        if label is not None:
+            filters["label"] = [label]
+        self.__request("POST", "/images/prune", {"filters": json.dumps(filters)})
+
+    def prune_build_cache(self, keep_storage: int) -> int:
+        status, pruned = self.__request(
+            "POST", "/build/prune", {"keep-storage": keep_storage}
+        )
+        if status != 200 or not isinstance(pruned, dict):
+            return 0
+        return int(pruned.get("SpaceReclaimed", 0))
+
+    def __follow_logs(
+        self,
+        container: str,
+        timeout: Optional[float],
+        stdout: OutputCapture,
+        stderr: OutputCapture,
+    ) -> bool:
+        """Writes the output of the container to the captures, True on timeout."""
+        # Streaming needs its own connection, the socket timeout bounds the run
+        connection = _UnixHTTPConnection(self.__socket_path, timeout=timeout)
+        start = time()
+        try:
+            connection.request(
+                "GET",
+                self.__url(
+                    "/containers/{}/logs".format(container),
+                    {"follow": 1, "stdout": 1, "stderr": 1},
+                ),
+            )
+            response = connection.getresponse()
+            while True:
+                if timeout is not None and connection.sock is not None:
+                    remaining = timeout - (time() - start)
+                    if remaining <= 0:
+                        return True
+                    connection.sock.settimeout(remaining)
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                stream, length = struct.unpack(">BxxxL", header)
+                capture = stderr if stream == 2 else stdout
+                while length > 0:
+                    data = response.read(min(length, OutputCapture.chunk_size))
+                    if not data:
+                        break
+                    capture.write(data)
+                    length -= len(data)
+        except socket.timeout:
+            return True
+        finally:
+            connection.close()
+        return False
+
+    def __request(
+        self,
+        method: str,
+        path: str,
+        query: Optional[Dict[str, Any]] = None,
+        body: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[int, Any]:
+        connection = self.__connection()
+        reused = connection.sock is not None
+        sent = False
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            connection.request(
+                method,
+                self.__url(path, query),
+                None if body is None else json.dumps(body),
+                headers,
+            )
+            sent = True
+            response = connection.getresponse()
+            content = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            # The daemon may have acted on a request it received, so only requests
+            # that can run twice are repeated. Others only if sending them failed
+            # because the daemon had closed the kept-alive connection.
+            if method not in self.__idempotent and (sent or not reused):
+                raise
+            connection.request(
+                method,
+                self.__url(path, query),
+                None if body is None else json.dumps(body),
+                headers,
+            )
+            response = connection.getresponse()
+            content = response.read()
+        try:
+            return response.status, json.loads(content) if content else None
+        except ValueError:
+            return response.status, content.decode(errors="replace")
+
+    def __stats(self, container: str) -> Optional[ResourceUsage]:
+        status, stats = self.__request(
+            "GET",
+            "/containers/{}/stats".format(container),
+            {"stream": "false", "one-shot": "true"},
+        )
+        if status != 200 or not isinstance(stats, dict):
+            return None
+        usage = engine_usage(stats)
+        # A stopped container reports all counters as zero
+        return usage if usage.cpu_time > 0 else None
+
+    def __connection(self) -> _UnixHTTPConnection:
+        connection = getattr(self.__connections, "connection", None)
+        if connection is None:
+            connection = _UnixHTTPConnection(self.__socket_path)
+            self.__connections.connection = connection
+        return connection
+
+    def __url(self, path: str, query: Optional[Dict[str, Any]] = None) -> str:
+        url = "/{}{}".format(self.api_version, path)
+        return url if not query else "{}?{}".format(url, urlencode(query))
+
+    @staticmethod
+    def __json_stream(response: IO[bytes]) -> Iterator[Dict[str, Any]]:
+        for line in response:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class FakeBackend(DockerBackend):
+    """
+    A backend that does not talk to docker at all, for tests.
+
+    Builds succeed unless their tag is in failing_builds. Runs return run_result.
+    All operations are recorded in calls.
+    """
+
+    def __init__(
+        self,
+        *,
+        failing_builds: Optional[List[str]] = None,
+        run_result: Optional[RunResult] = None,
+        image_size: int = 0,
+    ) -> None:
+        self.failing_builds = failing_builds if failing_builds is not None else []
+        self.run_result = (
+            run_result if run_result is not None else RunResult(0, "", "", 0.0, 0)
+        )
+        self.images: Dict[str, int] = dict()
+        self.labels: Dict[str, Dict[str, str]] = dict()
+        self.calls: List[Tuple[str, Any]] = []
+        self.__image_size = image_size
+
+    def build(
+        self,
+        tag: str,
+        context: BuildContext,
+        *,
+        no_cache: bool = True,
+        network: Optional[str] = None,
+        labels: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        log: Optional[SpillLog] = None,
+    ) -> BuildResult:
+        self.calls.append(("build", tag))
+        size = sum(p.stat().st_size for p, _ in context.files() if p.is_file())
+        if tag in self.failing_builds:
+            return BuildResult(False, None, 0.0, size, "Build failed")
+        self.images[tag] = self.__image_size
+        self.labels[tag] = dict(labels or dict())
+        return BuildResult(True, "sha256:{}".format(tag), 0.0, size, "")
+
+    def run(self, spec: ContainerSpec, timeout: Optional[float] = None) -> RunResult:
+        self.calls.append(("run", spec))
+        return self.run_result
+
+    def remove_image(self, tag: str, *, force: bool = True) -> bool:
+        self.calls.append(("remove_image", tag))
+        self.labels.pop(tag, None)
+        return self.images.pop(tag, None) is not None
+
+    def image_size(self, tag: str) -> Optional[int]:
+        return self.images.get(tag)
+
+    def pull_image(self, tag: str) -> bool:
+        self.calls.append(("pull_image", tag))
+        self.images[tag] = self.__image_size
+        return True
+
+    def list_images(self, label: str) -> List[ImageInfo]:
+        key = label.split("=", 1)[0]
+        return [
+            ImageInfo("sha256:{}".format(tag), [tag], size, 0.0, self.labels[tag])
+            for tag, size in self.images.items()
+            if key in self.labels.get(tag, dict())
+        ]
+
+    def prune_dangling_images(self, label: Optional[str] = None) -> None:
+        self.calls.append(("prune_dangling_images", label))
+
+    def prune_build_cache(self, keep_storage: int) -> int:
+        self.calls.append(("prune_build_cache", keep_storage))
+        return 0
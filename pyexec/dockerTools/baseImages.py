@@ -0,0 +1,186 @@
+import json
+import re
+import sys
+from collections import Counter
+from dataclasses import asdict
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict, Iterable, List, Optional
+
+from configargparse import ArgParser
+
+from pyexec.dockerTools.backend import CliBackend, DockerBackend
+from pyexec.dockerTools.buildContext import BuildContext
+from pyexec.dockerTools.imageCache import ImageCollector
+from pyexec.mining.records import RecordReader
+from pyexec.util.dependencies import BaseImage, Dependencies
+from pyexec.util.logging import get_logger
+
+
+def load_base_images(manifest: Path) -> List[BaseImage]:
+    with open(manifest, "r") as f:
+        return [BaseImage(**image) for image in json.load(f)]
+
+
+def store_base_images(images: List[BaseImage], manifest: Path) -> None:
+    with open(manifest, "w") as f:
+        json.dump([asdict(image) for image in images], f, indent=2)
+
+
+class BaseImageSynthesizer:
+    """
+    Derives pre-baked base images from the dependencies of already mined packages.
+
+    Every base image contains the test tooling. Further images are synthesized from
+    well-known package stacks and from the packages used most often in the corpus.
+    """
+
+    __dockerfile_regex = re.compile(
+        r"dockerfile=(FROM python:.*?), dockerfile_source=", re.DOTALL
+    )
+
+    test_tooling: List[str] = ["pytest", "coverage"]
+    stacks: Dict[str, List[str]] = {
+        "scientific": ["numpy", "scipy", "pandas", "matplotlib"],
+    }
+
+    def __init__(
+        self,
+        logfile: Optional[Path] = None,
+        *,
+        min_share: float = 0.05,
+        max_packages: int = 25,
+        backend: Optional[DockerBackend] = None,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::BaseImageSynthesizer", logfile)
+        self.__backend = backend if backend is not None else CliBackend(logfile)
+        self.__min_share = min_share
+        self.__max_packages = max_packages
+
+    def load_dependencies(self, output_dirs: Iterable[Path]) -> List[Dependencies]:
+        """
+        Reads the dependencies recorded by previous runs, from the records of the
+        packages or, for older runs, from their output.txt.
+        """
+        result: List[Dependencies] = []
+        for output_dir in output_dirs:
+            dockerfiles = self.__load_dockerfiles(output_dir)
+            if dockerfiles is None:
+                self.__logger.warning("No results found in {}".format(output_dir))
+                continue
+            for dockerfile in dockerfiles:
+                try:
+                    result.append(Dependencies.from_dockerfile(dockerfile))
+                except Dependencies.InvalidFormatException:
+                    self.__logger.debug("Skipping unparsable dockerfile")
+        self.__logger.info("Loaded dependencies of {} packages".format(len(result)))
+        return result
+
+    def __load_dockerfiles(self, output_dir: Path) -> Optional[List[str]]:
+        for name in ["records.jsonl", "records.jsonl.zst"]:
+            records = output_dir.joinpath(name)
+            if records.is_file():
+                return [
+                    record["dockerfile"]["text"]
+                    for record in RecordReader(records)
+                    if record.get("dockerfile") is not None
+                ]
+        output_file = output_dir.joinpath("output.txt")
+        if output_file.is_file():
+            with open(output_file, "r") as f:
+                content = f.read()
+            return [m.group(1) for m in self.__dockerfile_regex.finditer(content)]
+        return None
+
+    def synthesize(self, corpus: List[Dependencies]) -> List[BaseImage]:
+        by_version: Dict[str, List[Dependencies]] = dict()
+        for deps in corpus:
+            by_version.setdefault(deps.python_version, []).append(deps)
+
+        images: List[BaseImage] = []
+        for version, projects in sorted(by_version.items()):
+            counts: Counter = Counter(
+                name.lower() for deps in projects for name in deps.pip_dependencies()
+            )
+            images.append(self.__image("pytest", version, []))
+            for stack, packages in self.stacks.items():
+                if any(counts[p] >= self.__min_share * len(projects) for p in packages):
+                    images.append(self.__image(stack, version, packages))
+
+            popular = [
+                name
+                for name, count in counts.most_common(self.__max_packages)
+                if count >= self.__min_share * len(projects)
+                and name not in self.test_tooling
+            ]
+            if popular:
+                images.append(self.__image("popular", version, popular))
+        return images
+
+    def build(self, images: List[BaseImage]) -> List[BaseImage]:
+        """Builds the given images and returns those that were built successfully."""
+        built: List[BaseImage] = []
+        for image in images:
+            deps = Dependencies("FROM python:{}".format(image.python_version))
+            for package in image.pip_packages:
+                deps.add_pip_dependency(package)
+
+            self.__logger.info("Building base image {}".format(image.tag))
+            with TemporaryDirectory(prefix="pyexec-base-") as d:
+                dockerfile = Path(d).joinpath("Dockerfile")
+                with open(dockerfile, "w") as f:
+                    f.write(deps.to_dockerfile())
+                result = self.__backend.build(
+                    image.tag,
+                    BuildContext(dockerfile),
+                    no_cache=False,
+                    labels=ImageCollector.labels("base"),
+                )
+            if result.success:
+                built.append(image)
+            else:
+                self.__logger.error(
+                    "Could not build base image {}:\n{}".format(image.tag, result.log)
+                )
+        return built
+
+    def __image(self, name: str, version: str, packages: List[str]) -> BaseImage:
+        return BaseImage(
+            tag="pyexec-base:{}-py{}".format(name, version),
+            python_version=version,
+            pip_packages=self.test_tooling + packages,
+        )
+
+
+def main(argv: List[str]) -> None:
+    parser = ArgParser()
+    parser.add_argument(
+        "output_dirs",
+        nargs="+",
+        help="Output directories of previous runs of pyexec-miner",
+    )
+    parser.add_argument(
+        "-o",
+        "--manifest",
+        dest="manifest",
+        default=str(Path.home().joinpath("pyexec-output", "base-images.json")),
+        help="File the list of built base images is written to. "
+        "Pass it to pyexec-miner with --base-images",
+    )
+    parser.add_argument(
+        "--min-share",
+        dest="min_share",
+        type=float,
+        default=0.05,
+        help="Minimal share of projects a package has to be used by to be "
+        "included in a base image (default: 0.05)",
+    )
+    config = parser.parse_args(argv[1:])
+
+    synthesizer = BaseImageSynthesizer(min_share=config.min_share)
+    corpus = synthesizer.load_dependencies(Path(d) for d in config.output_dirs)
+    if len(corpus) == 0:
+        print("No dependencies found in the given output directories")
+        sys.exit(1)
+    images = synthesizer.build(synthesizer.synthesize(corpus))
+    store_base_images(images, Path(config.manifest))
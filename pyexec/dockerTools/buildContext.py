@@ -0,0 +1,78 @@
+import tarfile
+from pathlib import Path
+from typing import IO, Iterator, Optional, Tuple
+
+from pyexec.util.logging import get_logger
+
+
+class BuildContext:
+    """
+    The minimal build context of a project image.
+
+    The context only contains the Dockerfile and the project without its version
+    control history and caches. Documentation and large files are only left out on
+    request, as test suites may read them. It is written as a tar stream that can be
+    sent to the docker daemon. Images that do not copy the project only get the
+    Dockerfile.
+    """
+
+    excluded_dirs = {".git", ".hg", ".svn", "__pycache__", ".tox", ".eggs"}
+    docs_dirs = {"docs", "doc"}
+    excluded_suffixes = {".pyc", ".pyo"}
+
+    def __init__(
+        self,
+        dockerfile: Path,
+        project_dir: Optional[Path] = None,
+        logfile: Optional[Path] = None,
+        *,
+        exclude_docs: bool = False,
+        max_file_size: Optional[int] = None,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::BuildContext", logfile)
+        self.__dockerfile = dockerfile
+        self.__project_dir = project_dir
+        self.__excluded_dirs = self.excluded_dirs | (
+            self.docs_dirs if exclude_docs else set()
+        )
+        self.__max_file_size = max_file_size
+
+    def files(self) -> Iterator[Tuple[Path, str]]:
+        """Yields the files of the context with their name inside the context."""
+        yield self.__dockerfile, "Dockerfile"
+        if self.__project_dir is not None:
+            yield from self.__walk(self.__project_dir, self.__project_dir.name)
+
+    def write_tarball(self, fileobj: IO[bytes]) -> int:
+        """Writes the context as uncompressed tar stream, returns its size in bytes."""
+        size = 0
+        with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+            for path, name in self.files():
+                info = tar.gettarinfo(str(path), arcname=name)
+                if info.isfile():
+                    with open(path, "rb") as content:
+                        tar.addfile(info, content)
+                    size = size + info.size
+                else:
+                    tar.addfile(info)
+        self.__logger.debug("Build context has {} bytes".format(size))
+        return size
+
+    def __walk(self, directory: Path, name: str) -> Iterator[Tuple[Path, str]]:
+        yield directory, name
+        for entry in sorted(directory.iterdir()):
+            relative = "{}/{}".format(name, entry.name)
+            if entry.is_symlink():
+                yield entry, relative
+            elif entry.is_dir():
+                if entry.name not in self.__excluded_dirs:
+                    yield from self.__walk(entry, relative)
+            elif entry.suffix in self.excluded_suffixes:
+                continue
+            elif (
+                self.__max_file_size is not None
+                and entry.stat().st_size > self.__max_file_size
+            ):
+                self.__logger.debug("Excluding large file {}".format(relative))
+            else:
+                yield entry, relative
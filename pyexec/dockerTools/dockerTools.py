@@ -1,18 +1,48 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Tuple
+from threading import Lock
+from timeit import default_timer as time
+from typing import ContextManager, Iterator, List, Optional, Sequence, Tuple
 
-from plumbum.cmd import docker, timeout
-
-from pyexec.util.dependencies import Dependencies
+from pyexec.dockerTools.backend import CliBackend, ContainerSpec, DockerBackend
+from pyexec.dockerTools.buildContext import BuildContext
+from pyexec.dockerTools.imageCache import EnvironmentCache, ImageCollector
+from pyexec.dockerTools.scheduler import Scheduler
+from pyexec.dockerTools.wheelhouse import Wheelhouse
+from pyexec.util.capture import SpillLog
+from pyexec.util.dependencies import BaseImage, Dependencies
 from pyexec.util.exceptions import TimeoutException
 from pyexec.util.logging import get_logger
+from pyexec.util.resources import ResourceUsage
+from pyexec.util.trace import add_span, span
 
 
 class BuildFailedException(Exception):
     pass
 
 
+@dataclass
+class DockerConfig:
+    clear_dangling_images: bool = False
+    wheelhouse: Optional[Wheelhouse] = None
+    base_images: Optional[List[BaseImage]] = None
+    environment_cache: Optional[EnvironmentCache] = None
+    mount_source: bool = False
+    backend: DockerBackend = field(default_factory=CliBackend)
+    scheduler: Optional[Scheduler] = None
+    image_collector: Optional[ImageCollector] = None
+    output_logs: Optional[Path] = None  # Directory for the output of every package
+    output_log_size: Optional[int] = None  # Compressed bytes kept per package
+    context_exclude_docs: bool = False  # Leave docs/ and doc/ out of build contexts
+    context_max_file_size: Optional[int] = None  # Leave larger files out, in bytes
+
+
 class DockerTools:
+    results_mount = "/tmp/pyexec-results"
+
     def __init__(
         self,
         dependencies: Dependencies,
@@ -20,66 +50,338 @@ class DockerTools:
         project_name: str,
         logfile: Optional[Path] = None,
         *,
-        clear_dangling_images: bool = False
+        config: Optional[DockerConfig] = None
     ) -> None:
         self.__logger = get_logger("Pyexec::DockerTools", logfile)
         self.__dependencies = dependencies
         self.__project_name = project_name.lower()
+        self.__project_dir = context.joinpath(project_name)
         self.__tag = "pyexec:" + self.__project_name
         self.__context = context
-        self.__clear_dangling_images = clear_dangling_images
+        self.__config = config if config is not None else DockerConfig()
+        self.__logfile = logfile
+        self.__context_size: Optional[int] = None
+        self.__queue_wait_time = 0.0
+        self.__build_time = 0.0
+        self.__output_size = 0
+        self.__resource_usage = ResourceUsage()
+        self.__lock = Lock()
+        self.__build_deadline: Optional[float] = None
+        self.__spill: Optional[SpillLog] = None
+        if self.__config.output_logs is not None:
+            self.__spill = SpillLog(
+                self.__config.output_logs.joinpath(
+                    "{}.log.gz".format(self.__project_name)
+                ),
+                self.__config.output_log_size,
+            )
         if not self.__context.exists() or not self.__context.is_dir():
             raise ValueError("Context is not a directory")
 
+    @property
+    def context_size(self) -> Optional[int]:
+        """Size of the build context sent by the last build, None if not built."""
+        return self.__context_size
+
+    @property
+    def queue_wait_time(self) -> float:
+        """Seconds builds and containers waited for the scheduler to admit them."""
+        return self.__queue_wait_time
+
+    @property
+    def build_time(self) -> float:
+        """Seconds spent building images, without waiting for the scheduler."""
+        return self.__build_time
+
+    @property
+    def output_size(self) -> int:
+        """Bytes written to stdout and stderr by the containers run."""
+        return self.__output_size
+
+    @property
+    def resource_usage(self) -> ResourceUsage:
+        """Resources used by the containers run, as far as they could be measured."""
+        return self.__resource_usage
+
+    @property
+    def image(self) -> str:
+        """The image containers are run from."""
+        cache = self.__config.environment_cache
+        if self.__config.mount_source and cache is not None:
+            return cache.tag(self.__dependencies)
+        return self.__tag
+
     def write_dockerfile(self) -> None:
         self.__logger.debug("Writing Dockerfile")
+        cache = self.__config.environment_cache
+        if cache is not None and self.__config.mount_source:
+            return  # The cached environment image is all that is needed
         with open(self.__context.joinpath("Dockerfile"), "w") as f:
-            f.write(self.__dependencies.to_dockerfile())
+            if cache is not None:
+                f.write(
+                    self.__dependencies.to_source_dockerfile(
+                        cache.tag(self.__dependencies)
+                    )
+                )
+            else:
+                f.write(
+                    self.__environment_dockerfile(
+                        environment_only=self.__config.mount_source
+                    )
+                )
 
-    def build_image(self) -> None:
+    def build_image(self, timeout: Optional[float] = None) -> None:
         self.__logger.debug("Building docker image")
-        _, out, err = docker[
-            "build", "-q", "--force-rm", "--no-cache", "-t", self.__tag, self.__context
-        ].run(retcode=None)
-        self.__logger.debug(out)
-        self.__logger.debug(err)
-        if out != "":
-            self.__logger.debug("Successfully build image")
+        collector = self.__config.image_collector
+        self.__build_deadline = None if timeout is None else time() + timeout
+        try:
+            self.__build_image()
+        finally:
+            if collector is not None:
+                collector.collect(keep=[self.image, self.__tag])
+
+    def __build_image(self) -> None:
+        cache = self.__config.environment_cache
+        dockerfile = self.__context.joinpath("Dockerfile")
+        if cache is not None:
+            self.__build_environment(cache)
+            if not self.__config.mount_source:
+                # Only the project is added on top of the cached environment
+                self.__build(
+                    self.__tag, self.__project_context(dockerfile), no_cache=False
+                )
+            else:
+                self.__context_size = 0
+            cache.enforce_budget(keep=self.image)
+        elif self.__config.mount_source:
+            # The image only contains the environment and needs no project
+            self.__build(
+                self.__tag,
+                BuildContext(dockerfile, None, self.__logfile),
+                kind="environment",
+            )
+        else:
+            self.__build(self.__tag, self.__project_context(dockerfile))
+
+    def __project_context(self, dockerfile: Path) -> BuildContext:
+        return BuildContext(
+            dockerfile,
+            self.__project_dir,
+            self.__logfile,
+            exclude_docs=self.__config.context_exclude_docs,
+            max_file_size=self.__config.context_max_file_size,
+        )
+
+    def __build_environment(self, cache: EnvironmentCache) -> None:
+        tag = cache.tag(self.__dependencies)
+        with cache.build_lock(tag):
+            if not cache.contains(tag):
+                self.__logger.debug("Building environment image {}".format(tag))
+                dockerfile = self.__context.joinpath("Dockerfile.env")
+                with open(dockerfile, "w") as f:
+                    f.write(self.__environment_dockerfile(environment_only=True))
+                self.__build(
+                    tag,
+                    BuildContext(dockerfile, None, self.__logfile),
+                    kind="environment",
+                )
+            cache.touch(tag)
+
+    def __environment_dockerfile(self, *, environment_only: bool) -> str:
+        wheelhouse = self.__config.wheelhouse
+        return self.__dependencies.to_dockerfile(
+            index_url=None if wheelhouse is None else wheelhouse.index_url,
+            extra_index_url=None if wheelhouse is None else wheelhouse.extra_index_url,
+            base_images=self.__config.base_images,
+            environment_only=environment_only,
+        )
+
+    def __build(
+        self,
+        tag: str,
+        context: BuildContext,
+        *,
+        no_cache: bool = True,
+        kind: str = "project",
+    ) -> None:
+        scheduler = self.__config.scheduler
+        slot = scheduler.build_slot() if scheduler else nullcontext(0.0)
+        with slot as waited, self.__spill_session("docker build {}".format(tag)) as log:
+            self.__queue_wait_time += waited
+            add_span("wait for build slot", "scheduler", time() - waited, waited)
+            deadline = self.__build_deadline
+            with span("docker build", "docker", tag=tag, kind=kind):
+                result = self.__config.backend.build(
+                    tag,
+                    context,
+                    no_cache=no_cache,
+                    # The wheelhouse index listens on the loopback interface of the host
+                    network="host" if self.__config.wheelhouse is not None else None,
+                    labels=ImageCollector.labels(kind),
+                    timeout=None if deadline is None else max(deadline - time(), 0.0),
+                    log=log,
+                )
+        self.__context_size = result.bytes_transferred
+        self.__build_time += result.duration
+        if result.log:
+            self.__logger.debug(result.log)
+        if result.timed_out:
+            self.__logger.warning("Timeout during docker build")
+            raise TimeoutException("Timeout during docker build", "build")
+        if result.success:
+            self.__logger.debug(
+                "Successfully build image {} in {:.1f}s".format(
+                    result.image_id, result.duration
+                )
+            )
+            if self.__config.image_collector is not None:
+                self.__config.image_collector.touch(tag)
         else:
             self.__logger.debug("Error building image")
-            if self.__clear_dangling_images:
-                docker["image", "prune", "-f"].run(retcode=None)
+            if self.__config.clear_dangling_images:
+                self.__config.backend.prune_dangling_images(ImageCollector.label)
             raise BuildFailedException("docker build command failed")
 
-    def run_container(self, tout: Optional[int]) -> Tuple[str, str]:
-        self.__logger.debug("Running container")
-        if tout is not None:
-            run_command = timeout[
-                tout,
-                "docker",
-                "run",
-                "--name",
-                self.__project_name,
-                "--rm",
-                self.__tag,
+    def run_container(
+        self,
+        tout: Optional[float],
+        *,
+        command: Optional[List[str]] = None,
+        results_dir: Optional[Path] = None
+    ) -> Tuple[str, str]:
+        """
+        Runs a container of the image, optionally with a command other than its CMD.
+        The results directory is mounted to results_mount for the container to
+        write to.
+        """
+        with self.__run_slot():
+            return self.__run_container(tout, command, None, results_dir)
+
+    def run_containers(
+        self,
+        tout: Optional[float],
+        commands: Sequence[Optional[List[str]]],
+        results_dirs: Sequence[Path],
+    ) -> List[Tuple[str, str]]:
+        """
+        Runs a container for every command, each writing to its own results
+        directory. Every container is admitted by the scheduler on its own, so they
+        run at the same time as far as the limit of concurrent runs allows.
+        """
+        with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+            futures = [
+                executor.submit(self.__run_shard, tout, command, shard, results_dir)
+                for shard, (command, results_dir) in enumerate(
+                    zip(commands, results_dirs)
+                )
             ]
+            return [future.result() for future in futures]
+
+    def __run_shard(
+        self,
+        tout: Optional[float],
+        command: Optional[List[str]],
+        shard: int,
+        results_dir: Path,
+    ) -> Tuple[str, str]:
+        with self.__run_slot():
+            return self.__run_container(tout, command, shard, results_dir)
+
+    @contextmanager
+    def __run_slot(self) -> Iterator[None]:
+        scheduler = self.__config.scheduler
+        slot = scheduler.run_slot() if scheduler else nullcontext(0.0)
+        with slot as waited:
+            with self.__lock:  # Shards wait concurrently
+                self.__queue_wait_time += waited
+            add_span("wait for run slot", "scheduler", time() - waited, waited)
+            yield
+
+    def __run_container(
+        self,
+        tout: Optional[float],
+        command: Optional[List[str]],
+        shard: Optional[int],
+        results_dir: Optional[Path],
+    ) -> Tuple[str, str]:
+        self.__logger.debug("Running container")
+        name = self.__project_name
+        if shard is not None:
+            name = "{}-shard{}".format(name, shard)
+        if self.__config.mount_source:
+            spec = self.__mounted_container(name, command)
         else:
-            run_command = docker[
-                "run", "--name", self.__project_name, "--rm", self.__tag
-            ]
+            # The project is copied into the image owned by the host user, see
+            # host_user(), so the tests can write to their working directory.
+            spec = ContainerSpec(
+                image=self.__tag, name=name, command=command, user=self.host_user()
+            )
+        if results_dir is not None:
+            spec.volumes.append("{}:{}".format(results_dir, self.results_mount))
 
-        ret, out, err = run_command.run(retcode=None)
-        self.__logger.debug(out)
-        self.__logger.debug(err)
-        if (
-            timeout is not None and ret == 124
-        ):  # Timeout was triggered, see 'man timeout'
+        scheduler = self.__config.scheduler
+        if scheduler is not None:
+            spec.cpus = scheduler.cpus
+            spec.memory = scheduler.memory
+        if self.__config.image_collector is not None:
+            self.__config.image_collector.touch(spec.image)
+        with self.__spill_session("docker run {}".format(name)) as log:
+            spec.log = log
+            with span("docker run", "docker", container=name):
+                result = self.__config.backend.run(spec, tout)
+        with self.__lock:  # Shards finish concurrently
+            self.__output_size += result.bytes_transferred
+            if result.usage is not None:
+                self.__resource_usage.add(result.usage)
+        self.__logger.debug(result.stdout)
+        self.__logger.debug(result.stderr)
+        if result.timed_out:
             self.__logger.warning("Timeout during test case execution")
-            raise TimeoutException("Timeout during test case execution")
+            raise TimeoutException("Timeout during test case execution", "test")
         else:
-            self.__logger.debug("Successfully run container")
-            return out, err
+            self.__logger.debug(
+                "Successfully run container in {:.1f}s, exit code {}".format(
+                    result.duration, result.exit_code
+                )
+            )
+            return result.stdout, result.stderr
+
+    def __spill_session(self, header: str) -> ContextManager[Optional[SpillLog]]:
+        if self.__spill is None:
+            return nullcontext(None)
+        return self.__spill.session(header)
+
+    def __mounted_container(
+        self, name: str, command: Optional[List[str]]
+    ) -> ContainerSpec:
+        # The checkout is mounted read-only and copied to a tmpfs on start, so tests
+        # can write to their working directory without touching the checkout. Tests
+        # run with the uid of the host user so nothing they create is owned by root.
+        source = "/mnt/{}".format(self.__project_dir.name)
+        workdir = "/tmp/{}".format(self.__project_dir.name)
+        uid, gid = os.getuid(), os.getgid()
+        spec = ContainerSpec(
+            image=self.image,
+            name=name,
+            workdir=workdir,
+            volumes=["{}:{}:ro".format(self.__project_dir, source)],
+            tmpfs={workdir: "exec,uid={},gid={}".format(uid, gid)},
+            user=self.host_user(),
+        )
+        cmd = command if command is not None else self.__dependencies.cmd_arguments()
+        if cmd is not None:
+            copy = 'cp -a {}/. . && exec "$@"'.format(source)
+            spec.command = ["sh", "-c", copy, "sh"] + cmd
+        return spec
+
+    @staticmethod
+    def host_user() -> str:
+        """
+        The uid:gid test containers run as, so the files they create in the results
+        directory and the workspace are not owned by root.
+        """
+        return "{}:{}".format(os.getuid(), os.getgid())
 
     def remove_image(self) -> None:
         self.__logger.debug("Remove docker image")
-        docker["rmi", "-f", self.__tag].run(retcode=None)
+        self.__config.backend.remove_image(self.__tag)
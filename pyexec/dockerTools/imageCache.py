@@ -0,0 +1,196 @@
+import json
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Optional, Set
+
+from pyexec.dockerTools.backend import DockerBackend, ImageInfo
+from pyexec.util.dependencies import Dependencies
+from pyexec.util.logging import get_logger
+
+
+class EnvironmentCache:
+    """
+    Keeps environment images, i.e. everything of an image before the project is
+    copied into it, keyed by the hash of their dependencies.
+
+    Images are kept until the sum of their sizes exceeds the disk budget. Then the
+    least recently used images are removed. Layers shared between images are counted
+    for every image, so the budget is an upper bound.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        state_file: Path,
+        backend: DockerBackend,
+        logfile: Optional[Path] = None,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::EnvironmentCache", logfile)
+        self.__budget = budget
+        self.__backend = backend
+        self.__state_file = state_file
+        self.__lock = Lock()
+        self.__build_locks: Dict[str, Lock] = dict()
+        self.__last_used: Dict[str, float] = dict()
+        if self.__state_file.exists():
+            with open(self.__state_file, "r") as f:
+                self.__last_used = json.load(f)
+
+    @staticmethod
+    def tag(dependencies: Dependencies) -> str:
+        return "pyexec-env:{}".format(dependencies.environment_hash()[:32])
+
+    def build_lock(self, tag: str) -> Lock:
+        """Returns a lock that serializes builds of the same environment."""
+        with self.__lock:
+            return self.__build_locks.setdefault(tag, Lock())
+
+    def contains(self, tag: str) -> bool:
+        if tag not in self.__last_used:
+            return False
+        if not self.__backend.image_exists(tag):
+            with self.__lock:
+                self.__last_used.pop(tag, None)
+            return False
+        return True
+
+    def touch(self, tag: str) -> None:
+        with self.__lock:
+            self.__last_used[tag] = time.time()
+            self.__store()
+
+    def enforce_budget(self, *, keep: Optional[str] = None) -> None:
+        with self.__lock:
+            sizes: Dict[str, int] = dict()
+            for tag in self.__last_used.keys():
+                size = self.__backend.image_size(tag)
+                if size is not None:
+                    sizes[tag] = size
+
+            total = sum(sizes.values())
+            for tag in sorted(sizes.keys(), key=lambda t: self.__last_used[t]):
+                if total <= self.__budget:
+                    break
+                if tag == keep:
+                    continue
+                self.__logger.debug("Evicting environment image {}".format(tag))
+                if not self.__backend.remove_image(tag, force=False):
+                    # Still in use by another image or container
+                    continue
+                total -= sizes[tag]
+                del sizes[tag]
+            self.__last_used = {t: self.__last_used[t] for t in sizes.keys()}
+            self.__store()
+
+    def __store(self) -> None:
+        with open(self.__state_file, "w") as f:
+            json.dump(self.__last_used, f)
+
+
+class ImageCollector:
+    """
+    Removes the least recently used images built by pyexec once the images exceed a
+    disk budget.
+
+    Every image pyexec builds carries the managed label, images without it are never
+    touched. Base images are counted towards the budget but never removed, so the
+    layers most images share stay available. Optionally the build cache is kept
+    below a budget of its own. The build cache is shared by all users of the docker
+    daemon, so this is not enabled by default.
+    """
+
+    label = "pyexec.managed"
+    kind_label = "pyexec.kind"
+
+    def __init__(
+        self,
+        budget: int,
+        state_file: Path,
+        backend: DockerBackend,
+        logfile: Optional[Path] = None,
+        *,
+        build_cache_budget: Optional[int] = None,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::ImageCollector", logfile)
+        self.__budget = budget
+        self.__build_cache_budget = build_cache_budget
+        self.__backend = backend
+        self.__state_file = state_file
+        self.__lock = Lock()
+        self.__collecting = Lock()
+        self.__last_used: Dict[str, float] = dict()
+        if self.__state_file.exists():
+            with open(self.__state_file, "r") as f:
+                self.__last_used = json.load(f)
+
+    @classmethod
+    def labels(cls, kind: str) -> Dict[str, str]:
+        """The labels of an image of the given kind: project, environment or base."""
+        return {cls.label: "true", cls.kind_label: kind}
+
+    def touch(self, tag: str) -> None:
+        with self.__lock:
+            self.__last_used[tag] = time.time()
+            self.__store()
+
+    def collect(self, *, keep: Iterable[str] = ()) -> int:
+        """
+        Removes images until the budget is met, except those tagged with any of keep.
+        Returns the number of bytes freed.
+        """
+        if not self.__collecting.acquire(blocking=False):
+            return 0  # Another thread is already collecting
+        try:
+            return self.__collect(set(keep))
+        finally:
+            self.__collecting.release()
+
+    def __collect(self, keep: Set[str]) -> int:
+        images = self.__backend.list_images(self.label)
+        total = sum(image.size for image in images)
+        freed = 0
+        evicted: Set[str] = set()
+        for image in sorted(images, key=self.__last_use):
+            if total <= self.__budget:
+                break
+            if image.labels.get(self.kind_label) == "base":
+                continue
+            if keep.intersection(image.tags):
+                continue
+            self.__logger.debug(
+                "Evicting image {}".format(", ".join(image.tags) or image.id)
+            )
+            # Images still used by a container or another image are not removed
+            removed = [
+                self.__backend.remove_image(reference, force=False)
+                for reference in (image.tags or [image.id])
+            ]
+            if all(removed):
+                total -= image.size
+                freed += image.size
+                evicted.update(image.tags)
+
+        self.__backend.prune_dangling_images(self.label)
+        if self.__build_cache_budget is not None:
+            freed += self.__backend.prune_build_cache(self.__build_cache_budget)
+        if freed > 0:
+            self.__logger.info("Freed {} MB of disk space".format(freed // 2 ** 20))
+
+        with self.__lock:
+            remaining = {tag for image in images for tag in image.tags} - evicted
+            self.__last_used = {
+                t: u for t, u in self.__last_used.items() if t in remaining | keep
+            }
+            self.__store()
+        return freed
+
+    def __last_use(self, image: ImageInfo) -> float:
+        # Images never used since pyexec started tracking them count from creation
+        return max(
+            [self.__last_used.get(tag, 0.0) for tag in image.tags] + [image.created]
+        )
+
+    def __store(self) -> None:
+        with open(self.__state_file, "w") as f:
+            json.dump(self.__last_used, f)
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Condition
+from timeit import default_timer as time
+from typing import Dict, Iterator, Optional
+
+from pyexec.util.logging import get_logger
+
+
+class Scheduler:
+    """
+    Admits docker builds and test containers based on the host's resources.
+
+    At most max_builds builds and max_runs containers run at the same time. New work
+    is only admitted while the host load, its free memory and its free disk space
+    are within the configured limits. If nothing of the same kind is running, work
+    is admitted anyway so that load from other programs cannot stall pyexec.
+    """
+
+    def __init__(
+        self,
+        max_builds: int = 1,
+        max_runs: int = 1,
+        logfile: Optional[Path] = None,
+        *,
+        cpus: Optional[float] = None,
+        memory: Optional[int] = None,
+        max_load: Optional[float] = None,
+        min_free_memory: int = 0,
+        min_free_disk: int = 0,
+        disk_path: Path = Path(tempfile.gettempdir()),
+        poll_interval: float = 1.0,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::Scheduler", logfile)
+        self.__limits = {"build": max_builds, "run": max_runs}
+        self.__active = {"build": 0, "run": 0}
+        self.__waited = {"build": 0.0, "run": 0.0}
+        self.__admitted = {"build": 0, "run": 0}
+        self.__cpus = cpus
+        self.__memory = memory
+        self.__max_load = max_load if max_load is not None else os.cpu_count()
+        self.__min_free_memory = min_free_memory
+        self.__min_free_disk = min_free_disk
+        self.__disk_path = disk_path
+        self.__poll_interval = poll_interval
+        self.__condition = Condition()
+
+    @property
+    def cpus(self) -> Optional[float]:
+        """CPUs available to every test container, None if unlimited."""
+        return self.__cpus
+
+    @property
+    def memory(self) -> Optional[int]:
+        """Memory in bytes available to every test container, None if unlimited."""
+        return self.__memory
+
+    @contextmanager
+    def build_slot(self) -> Iterator[float]:
+        """Waits for a build to be admitted, yields the time waited in seconds."""
+        with self.__slot("build") as waited:
+            yield waited
+
+    @contextmanager
+    def run_slot(self) -> Iterator[float]:
+        """Waits for a container to be admitted, yields the time waited in seconds."""
+        with self.__slot("run") as waited:
+            yield waited
+
+    def summary(self) -> Dict[str, float]:
+        with self.__condition:
+            return {
+                "{}_{}".format(kind, key): value
+                for kind in self.__limits.keys()
+                for key, value in [
+                    ("admitted", self.__admitted[kind]),
+                    ("waited", self.__waited[kind]),
+                ]
+            }
+
+    @contextmanager
+    def __slot(self, kind: str) -> Iterator[float]:
+        start = time()
+        with self.__condition:
+            while self.__active[kind] >= self.__limits[kind] or (
+                self.__active[kind] > 0 and not self.__host_has_capacity()
+            ):
+                self.__condition.wait(self.__poll_interval)
+            self.__active[kind] += 1
+            waited = time() - start
+            self.__admitted[kind] += 1
+            self.__waited[kind] += waited
+        if waited >= self.__poll_interval:
+            self.__logger.debug("Waited {:.1f}s for a {} slot".format(waited, kind))
+        try:
+            yield waited
+        finally:
+            with self.__condition:
+                self.__active[kind] -= 1
+                self.__condition.notify_all()
+
+    def __host_has_capacity(self) -> bool:
+        if self.__max_load is not None and os.getloadavg()[0] > self.__max_load:
+            return False
+        if self.__min_free_disk > 0:
+            if shutil.disk_usage(self.__disk_path).free < self.__min_free_disk:
+                return False
+        if self.__min_free_memory > 0:
+            available = self.__available_memory()
+            if available is not None and available < self.__min_free_memory:
+                return False
+        return True
+
+    @staticmethod
+    def __available_memory() -> Optional[int]:
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
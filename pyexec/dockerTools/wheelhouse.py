@@ -0,0 +1,337 @@
+import json
+import os
+import re
+import shutil
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set, Tuple
+
+from plumbum import local
+
+from pyexec.util.dependencies import Dependencies
+from pyexec.util.logging import get_logger
+
+
+class Wheelhouse:
+    """
+    A local package store shared by all container builds.
+
+    Distributions are downloaded from PyPI once and served to the builds through a
+    PEP 503 simple index on localhost. The store is capped in size and evicts the
+    least recently served files first. Wheels are fetched for the Python version of
+    the image they are installed into; python_version is only used for popular
+    projects until the versions the images use are known.
+    """
+
+    __filename_regex = re.compile(r"^(?P<name>.+?)-(?P<version>\d[^-]*)")
+    # name-version(-build)?-python-abi-platform.whl
+    __wheel_regex = re.compile(r"-(?P<python>[^-]+)-(?P<abi>[^-]+)-[^-]+\.whl$")
+    __extensions = (".whl", ".tar.gz", ".zip", ".tar.bz2")
+
+    def __init__(
+        self,
+        path: Path,
+        max_size: int,
+        logfile: Optional[Path] = None,
+        *,
+        port: int = 0,
+        offline: bool = False,
+        prefetch_count: int = 50,
+        python_version: str = "3.8",
+    ) -> None:
+        self.__logger = get_logger("Pyexec::Wheelhouse", logfile)
+        self.__path = path
+        self.__files = path.joinpath("files")
+        self.__popularity_file = path.joinpath("popularity.json")
+        self.__python_versions_file = path.joinpath("python-versions.json")
+        self.__max_size = max_size
+        self.__port = port
+        self.__offline = offline
+        self.__prefetch_count = prefetch_count
+        self.__python_version = python_version
+        self.__lock = Lock()
+        self.__pending: Set[Tuple[str, str]] = set()
+        self.__popularity: Counter = Counter()
+        self.__python_versions: Counter = Counter()
+        self.__server: Optional[ThreadingHTTPServer] = None
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__files.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def index_url(self) -> str:
+        if self.__server is None:
+            raise RuntimeError("Wheelhouse server is not running")
+        return "http://127.0.0.1:{}/simple/".format(self.__server.server_address[1])
+
+    @property
+    def extra_index_url(self) -> Optional[str]:
+        return None if self.__offline else "https://pypi.org/simple/"
+
+    def start(self) -> None:
+        if self.__server is not None:
+            return
+        self.__load_popularity()
+        self.__executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="pyexec-wheelhouse"
+        )
+        self.__server = ThreadingHTTPServer(
+            ("127.0.0.1", self.__port), self.__create_handler()
+        )
+        self.__server.daemon_threads = True
+        Thread(target=self.__server.serve_forever, daemon=True).start()
+        self.__logger.info("Serving wheelhouse at {}".format(self.index_url))
+
+        if not self.__offline:
+            popular = self.__popularity.most_common(self.__prefetch_count)
+            versions = [v for v, _ in self.__python_versions.most_common(3)]
+            for version in versions or [self.__python_version]:
+                missing = [n for n, _ in popular if not self.__has_project(n, version)]
+                self.prefetch(missing, version)
+
+    def stop(self) -> None:
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+        self.__store_popularity()
+
+    def prefetch(
+        self, requirements: Iterable[str], python_version: Optional[str] = None
+    ) -> None:
+        """
+        Download the given requirements for a Python version, as major.minor, into
+        the wheelhouse in the background.
+        """
+        if self.__offline or self.__executor is None:
+            return
+        version = self.__python_version if python_version is None else python_version
+        for requirement in requirements:
+            with self.__lock:
+                if (requirement, version) in self.__pending:
+                    continue
+                self.__pending.add((requirement, version))
+            self.__executor.submit(self.__download, requirement, version)
+
+    def prefetch_dependencies(self, dependencies: Dependencies) -> None:
+        version = self.__minor_version(dependencies.python_version)
+        with self.__lock:
+            self.__python_versions[version] += 1
+        self.prefetch(
+            (
+                name if pinned is None else "{}=={}".format(name, pinned)
+                for name, pinned in dependencies.pip_dependencies().items()
+                if not self.__has_project(name, version)
+            ),
+            version,
+        )
+
+    def size(self) -> int:
+        return sum(f.stat().st_size for f in self.__files.iterdir() if f.is_file())
+
+    def evict(self) -> None:
+        """Remove the least recently served files until the size cap is met."""
+        with self.__lock:
+            files = [f for f in self.__files.iterdir() if f.is_file()]
+            total = sum(f.stat().st_size for f in files)
+            for f in sorted(files, key=lambda f: f.stat().st_atime):
+                if total <= self.__max_size:
+                    break
+                total -= f.stat().st_size
+                self.__logger.debug("Evicting {} from wheelhouse".format(f.name))
+                f.unlink()
+
+    def __download(self, requirement: str, python_version: str) -> None:
+        pip = local[sys.executable]["-m", "pip", "download", "--no-deps", "--quiet"]
+        # Prefer wheels matching the Python of the containers, fall back to sdists
+        ret, _, _ = pip[
+            "--dest",
+            self.__files,
+            "--only-binary=:all:",
+            "--python-version",
+            python_version,
+            "--platform",
+            "manylinux2014_x86_64",
+            requirement,
+        ].run(retcode=None)
+        if ret != 0:
+            ret, _, _ = pip["--dest", self.__files, requirement].run(retcode=None)
+        if ret != 0:
+            message = "Could not prefetch {} for Python {}"
+        else:
+            message = "Prefetched {} for Python {}"
+            self.evict()
+        self.__logger.debug(message.format(requirement, python_version))
+        with self.__lock:
+            self.__pending.discard((requirement, python_version))
+
+    def __project_files(self) -> Dict[str, List[Path]]:
+        projects: Dict[str, List[Path]] = dict()
+        for f in self.__files.iterdir():
+            project = self.__project_of(f.name)
+            if project is not None:
+                projects.setdefault(project, []).append(f)
+        return projects
+
+    def __has_project(self, name: str, python_version: str) -> bool:
+        """Whether a file of the project can be installed on the Python version."""
+        files = self.__project_files().get(self.__normalize(name), [])
+        return any(self.__supports(f.name, python_version) for f in files)
+
+    @classmethod
+    def __supports(cls, filename: str, python_version: str) -> bool:
+        match = cls.__wheel_regex.search(filename)
+        if match is None:
+            return True  # An sdist
+        digits = python_version.replace(".", "")
+        for tag in match.group("python").split("."):
+            if tag in ("py3", "py{}".format(digits), "cp{}".format(digits)):
+                return True
+            # Stable ABI wheels are built for their version and all later ones
+            if match.group("abi") == "abi3" and tag.startswith("cp3"):
+                if int(tag[3:] or 0) <= int(digits[1:] or 0):
+                    return True
+        return False
+
+    @staticmethod
+    def __minor_version(version: str) -> str:
+        return ".".join(version.split(".")[:2])
+
+    @classmethod
+    def _python_version_of(cls, user_agent: Optional[str]) -> Optional[str]:
+        """The Python version pip reports in its user agent, as major.minor."""
+        if user_agent is None or "{" not in user_agent:
+            return None
+        try:
+            version = json.loads(user_agent[user_agent.index("{") :]).get("python")
+        except (ValueError, AttributeError):
+            return None
+        return None if not version else cls.__minor_version(str(version))
+
+    @classmethod
+    def __project_of(cls, filename: str) -> Optional[str]:
+        if not filename.endswith(cls.__extensions):
+            return None
+        match = cls.__filename_regex.match(filename)
+        return None if match is None else cls.__normalize(match.group("name"))
+
+    @staticmethod
+    def __normalize(name: str) -> str:
+        return re.sub(r"[-_.]+", "-", name).lower()
+
+    def __load_popularity(self) -> None:
+        if self.__popularity_file.exists():
+            with open(self.__popularity_file, "r") as f:
+                self.__popularity = Counter(json.load(f))
+        if self.__python_versions_file.exists():
+            with open(self.__python_versions_file, "r") as f:
+                self.__python_versions = Counter(json.load(f))
+
+    def __store_popularity(self) -> None:
+        with open(self.__popularity_file, "w") as f:
+            json.dump(dict(self.__popularity), f)
+        with open(self.__python_versions_file, "w") as f:
+            json.dump(dict(self.__python_versions), f)
+
+    def _serve_index(self) -> Tuple[int, str]:
+        links = [
+            '<a href="/simple/{0}/">{0}</a>'.format(p)
+            for p in sorted(self.__project_files().keys())
+        ]
+        return 200, self.__html(links)
+
+    def _serve_project(
+        self, name: str, python_version: Optional[str] = None
+    ) -> Tuple[int, str]:
+        project = self.__normalize(name)
+        version = self.__python_version if python_version is None else python_version
+        with self.__lock:
+            self.__popularity[project] += 1
+            if python_version is not None:
+                self.__python_versions[python_version] += 1
+        files = self.__project_files().get(project)
+        if not self.__has_project(project, version):
+            # Nothing for the Python of the build: pip continues with the extra
+            # index, we fetch the project so the next build finds it locally.
+            self.prefetch([project], version)
+        if not files:
+            return 404, self.__html([])
+        links = [
+            '<a href="/files/{0}">{0}</a>'.format(f.name)
+            for f in sorted(files, key=lambda f: f.name)
+        ]
+        return 200, self.__html(links)
+
+    def _serve_file(self, filename: str) -> Optional[BinaryIO]:
+        """
+        Opens the file for streaming it to a build. The file is opened under the lock
+        evict() holds, an open file stays readable if it is evicted meanwhile.
+        """
+        path = self.__files.joinpath(filename)
+        if "/" in filename:
+            return None
+        with self.__lock:
+            try:
+                f = open(path, "rb")
+            except (FileNotFoundError, IsADirectoryError):
+                return None
+            stat = os.fstat(f.fileno())
+            os.utime(path, (max(stat.st_atime, stat.st_mtime) + 1, stat.st_mtime))
+        return f
+
+    def _log_request(self, message: str) -> None:
+        self.__logger.debug(message)
+
+    @staticmethod
+    def __html(links: List[str]) -> str:
+        return "<!DOCTYPE html><html><body>\n{}\n</body></html>\n".format(
+            "<br/>\n".join(links)
+        )
+
+    def __create_handler(self) -> type:
+        wheelhouse = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                parts = [p for p in self.path.split("?", 1)[0].split("/") if p]
+                if parts == ["simple"]:
+                    self.__send_html(*wheelhouse._serve_index())
+                elif len(parts) == 2 and parts[0] == "simple":
+                    version = wheelhouse._python_version_of(
+                        self.headers.get("User-Agent")
+                    )
+                    self.__send_html(*wheelhouse._serve_project(parts[1], version))
+                elif len(parts) == 2 and parts[0] == "files":
+                    f = wheelhouse._serve_file(parts[1])
+                    if f is None:
+                        self.send_error(404)
+                        return
+                    with f:
+                        self.send_response(200)
+                        self.send_header("Content-Type", "application/octet-stream")
+                        self.send_header(
+                            "Content-Length", str(os.fstat(f.fileno()).st_size)
+                        )
+                        self.end_headers()
+                        shutil.copyfileobj(f, self.wfile)
+                else:
+                    self.send_error(404)
+
+            def __send_html(self, code: int, body: str) -> None:
+                content = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format: str, *args) -> None:
+                wheelhouse._log_request(format % args)
+
+        return Handler
@@ -2,16 +2,15 @@ import time
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
-
-from github.GithubException import GithubException
-from github.MainClass import Github
-from github.Rate import Rate
-from github.RateLimit import RateLimit
-from github.Repository import Repository
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 from pyexec.util.logging import get_logger
 
+if TYPE_CHECKING:
+    from github.Rate import Rate
+    from github.RateLimit import RateLimit
+    from github.Repository import Repository
+
 
 @dataclass
 class GitHubInfo:
@@ -38,11 +37,15 @@ class GitHubRequest:
         repo_name: str,
         logfile: Optional[Path] = None,
     ) -> None:
+        # PyGithub is slow to import and only needed with a GitHub token
+        from github.GithubException import GithubException
+        from github.MainClass import Github
+
         self.__logger = get_logger("Pyexec:GitHubRequest", logfile)
         self.__github = Github(access_token)
         self.wait_if_necessary()
         try:
-            self.__repo: Repository = self.__github.get_repo(
+            self.__repo: "Repository" = self.__github.get_repo(
                 "{}/{}".format(repo_user, repo_name)
             )
         except GithubException:
@@ -69,8 +72,8 @@ class GitHubRequest:
             time.sleep(seconds)
             self.__logger.info("Done waiting")
 
-        rate_limit: RateLimit = self.__github.get_rate_limit()
-        rate: Rate = rate_limit.core
+        rate_limit: "RateLimit" = self.__github.get_rate_limit()
+        rate: "Rate" = rate_limit.core
 
         if rate.remaining <= 10:
             reset_time: datetime = rate.reset
@@ -1,13 +1,18 @@
 import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from timeit import default_timer as time
+from typing import Optional, Tuple
 
-from git import Repo
-from git.exc import GitCommandError
-from plumbum.cmd import awk, cloc, find, grep, radon, tail, tr, wc
+from plumbum import local
+from plumbum.commands.base import BaseCommand
+from plumbum.commands.processes import ProcessTimedOut
 
+from pyexec.util.exceptions import TimeoutException
 from pyexec.util.logging import get_logger
+from pyexec.util.process import run_with_timeout
+from pyexec.util.resources import ResourceUsage
+from pyexec.util.trace import span
 
 
 @dataclass
@@ -53,17 +58,40 @@ class GitRequest:
         self.__has_setuppy = False
         self.__has_requiremetnstxt = False
         self.__hasmakefile = False
+        self.__deadline: Optional[float] = None
+        self.__usage: Optional[ResourceUsage] = None
 
     def grab(self, tmp_dir: Path) -> RepoInfo:
+        return self.analyze(self.clone(tmp_dir))
+
+    def clone(
+        self,
+        tmp_dir: Path,
+        timeout: Optional[float] = None,
+        usage: Optional[ResourceUsage] = None,
+    ) -> Path:
         path = tmp_dir.joinpath(self.__repo_name)
         url = "git@github.com:{}/{}".format(self.__repo_user, self.__repo_name)
 
-        try:
-            _ = Repo.clone_from(url, path)
-        except GitCommandError:
+        with span("git clone", "clone"):
+            ret, _, err = run_with_timeout(
+                local["git"]["clone", "--quiet", url, path], timeout, usage=usage
+            )
+        if ret != 0:
+            self.__logger.debug(err)
             self.__logger.info("GitHub repository {} is not accessible".format(url))
             raise GitRequest.GitRepoNotFoundException("{} is inaccessible".format(url))
+        return path
 
+    def analyze(
+        self,
+        path: Path,
+        timeout: Optional[float] = None,
+        usage: Optional[ResourceUsage] = None,
+    ) -> RepoInfo:
+        """Adds the resources used by cloc and radon to usage."""
+        self.__deadline = None if timeout is None else time() + timeout
+        self.__usage = usage
         cloc_stats = self.__get_cloc_stats(path)
         if cloc_stats is not None:
             self.__num_lines = cloc_stats
@@ -109,35 +137,33 @@ class GitRequest:
         return None
 
     def __get_cloc_stats(self, path: Path) -> Optional[int]:
-        chain = cloc["--include-lang=Python", "--quiet", path] | grep["Python"]
-        _, result, _ = chain.run(retcode=None)
-        if result is not None:
-            results = result.split()
+        command = local["cloc"]["--include-lang=Python", "--quiet", path]
+        with span("cloc", "analysis"):
+            _, result, _ = self.__run_measured(command)
+        for line in result.splitlines():
+            results = line.split()
             # results looks like:
             # ['Python', <#files>, <#black lines>, <#comment lines>, <#LOC>]
             # We are interested in #LOC
-            if len(results) >= 5:
+            if len(results) >= 5 and results[0] == "Python":
                 return int(results[4])
         self.__logger.error("Unable to obtaion cloc stats")
         return None
 
     def __average_complexity(self, project_dir: Path) -> Optional[float]:
-        cmd = (
-            radon["cc", "-a", project_dir]
-            | tail["-n", 1]
-            | awk["{print $4}"]
-            | tr["-d", r"'()'"]
-        )
-        _, out, _ = cmd.run(retcode=None)
+        with span("radon", "analysis"):
+            _, out, _ = self.__run_measured(local["radon"]["cc", "-a", project_dir])
+        # The last line looks like: Average complexity: A (1.2345)
+        lines = out.strip().splitlines()
         try:
-            return float(out)
-        except ValueError:
+            return float(lines[-1].split()[3].strip("()"))
+        except (IndexError, ValueError):
             self.__logger.error("Error computing average cyclomatic complexity")
             return None
 
     def __impl_files(self, project_dir: Path) -> Optional[int]:
         command = (
-            find[
+            local["find"][
                 project_dir,
                 "-type",
                 "f",
@@ -171,9 +197,9 @@ class GitRequest:
                 "-name",
                 "*_test.py",
             ]
-            | wc["-l"]
+            | local["wc"]["-l"]
         )
-        _, out, _ = command.run(retcode=None)
+        _, out, _ = self.__run(command)
         try:
             return int(out)
         except ValueError:
@@ -181,7 +207,7 @@ class GitRequest:
 
     def __test_files(self, project_dir: Path) -> Optional[int]:
         command = (
-            find[
+            local["find"][
                 project_dir,
                 "-type",
                 "f",
@@ -213,10 +239,29 @@ class GitRequest:
                 "*_test.py",
                 ")",
             ]
-            | wc["-l"]
+            | local["wc"]["-l"]
         )
-        _, out, _ = command.run(retcode=None)
+        _, out, _ = self.__run(command)
         try:
             return int(out)
         except ValueError:
             return 0
+
+    def __run_measured(self, command: BaseCommand) -> Tuple[int, str, str]:
+        """Like __run for a single command, whose resource usage is recorded."""
+        timeout = None if self.__deadline is None else self.__deadline - time()
+        if timeout is not None and timeout <= 0:
+            raise TimeoutException("Analysis of {} timed out".format(self.__repo_name))
+        try:
+            return run_with_timeout(command, timeout, usage=self.__usage)
+        except TimeoutException:
+            raise TimeoutException("Analysis of {} timed out".format(self.__repo_name))
+
+    def __run(self, command: BaseCommand) -> Tuple[int, str, str]:
+        timeout = None if self.__deadline is None else self.__deadline - time()
+        if timeout is not None and timeout <= 0:
+            raise TimeoutException("Analysis of {} timed out".format(self.__repo_name))
+        try:
+            return command.run(retcode=None, timeout=timeout)
+        except ProcessTimedOut:
+            raise TimeoutException("Analysis of {} timed out".format(self.__repo_name))
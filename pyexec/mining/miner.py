@@ -1,29 +1,47 @@
 import re
+import sqlite3
 import sys
 import time
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import Dict, Iterator, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
-import requests
-from bs4 import BeautifulSoup
 from configargparse import ArgParser
-from plumbum.cmd import grep, sed, shuf, wget
+from plumbum import local
 
 from pyexec.dependencyInference.extraDependencies import ExtraDependencies
 from pyexec.dependencyInference.inferDependencys import InferDockerfile
-from pyexec.dockerTools.dockerTools import BuildFailedException, DockerTools
+from pyexec.dockerTools.backend import CliBackend, DockerBackend, EngineApiBackend
+from pyexec.dockerTools.baseImages import load_base_images
+from pyexec.dockerTools.dockerTools import (
+    BuildFailedException,
+    DockerConfig,
+    DockerTools,
+)
+from pyexec.dockerTools.imageCache import EnvironmentCache, ImageCollector
+from pyexec.dockerTools.scheduler import Scheduler
+from pyexec.dockerTools.wheelhouse import Wheelhouse
 from pyexec.mining.githubrequest import GitHubRequest, GitHubRequestException
 from pyexec.mining.gitrequest import GitRequest
 from pyexec.mining.packageInfo import PackageInfo
 from pyexec.mining.pypirequest import PyPIRequest
-from pyexec.testrunner.runner import AbstractRunner
+from pyexec.mining.records import RecordWriter, compression_available
+from pyexec.mining.resultStore import ResultStore
+from pyexec.mining.workspace import WorkspaceManager
+from pyexec.testrunner.runner import AbstractRunner, RunnerConfig
 from pyexec.testrunner.runners.pytestrunner import PytestRunner
-from pyexec.util.csv import CSV
+from pyexec.util.csv import CSV, StatsWriter
 from pyexec.util.dependencies import Dependencies
 from pyexec.util.exceptions import TimeoutException
-from pyexec.util.logging import get_logger
+from pyexec.util.logging import configure_logging, get_logger, stop_logging
+from pyexec.util.metrics import Metrics, MetricsExporter
+from pyexec.util.parquet import ParquetStatsWriter
+from pyexec.util.profiling import PackageProfiler, ProfileConfig
+from pyexec.util.resources import own_usage
+from pyexec.util.trace import add_span, start_tracing, stop_tracing
+from pyexec.util.watchdog import Deadlines, Watchdog
 
 
 class Miner:
@@ -33,194 +51,304 @@ class Miner:
         github_token: Optional[str],
         logfile: Optional[Path] = None,
         *,
-        clear_dangling_images: bool = False,
+        docker_config: Optional[DockerConfig] = None,
+        workers: int = 1,
+        workspaces: Optional[WorkspaceManager] = None,
+        deadlines: Optional[Deadlines] = None,
+        runner_config: Optional[RunnerConfig] = None,
+        profiler: Optional[PackageProfiler] = None,
     ):
         self.__packages = packages
+        self.__workers = workers
         self.__github_token = github_token
         self.__logfile = logfile
         self.__logger = get_logger("Pyexec::Miner", logfile)
-        self.__clear_dangling_images = clear_dangling_images
+        self.__docker_config = (
+            docker_config if docker_config is not None else DockerConfig()
+        )
+        self.__deadlines = deadlines if deadlines is not None else Deadlines()
+        self.__runner_config = runner_config
+        self.__profiler = profiler
+        self.__workspaces = (
+            workspaces
+            if workspaces is not None
+            else WorkspaceManager(self.__docker_config.backend, logfile)
+        )
         self.__github_regex = re.compile(
             r"(http[s]?://)?(www.)?github.com/([^/]*)/(.*)", re.IGNORECASE
         )
 
     def mine(self) -> Iterator[PackageInfo]:
         self.__logger.info("Starting to mine")
+        self.__workspaces.prepare()
 
-        try:
-            with TemporaryDirectory(prefix="pyexec-cache-") as d:
-                tmpdir = Path(d)
+        if self.__workers == 1:
+            for count, p in enumerate(self.__packages):
+                try:
+                    yield self.__mine_package(count, p)
+                except KeyboardInterrupt:
+                    self.__logger.info(
+                        "Caught keyboard interrupt. Stopped mining. Returning already mined results"
+                    )
+                    break
+        else:
+            yield from self.__mine_concurrently()
+        return None
 
-                for count, p in enumerate(self.__packages):
+    def __mine_concurrently(self) -> Iterator[PackageInfo]:
+        with ThreadPoolExecutor(
+            max_workers=self.__workers, thread_name_prefix="pyexec-miner"
+        ) as executor:
+            futures = [
+                executor.submit(self.__mine_package, count, p)
+                for count, p in enumerate(self.__packages)
+            ]
+            done: Set[Future] = set()
+            try:
+                for future in as_completed(futures):
+                    done.add(future)
+                    yield future.result()
+            except KeyboardInterrupt:
+                self.__logger.info(
+                    "Caught keyboard interrupt. Stopped mining. "
+                    "Waiting for running packages"
+                )
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if future.cancelled() or future in done:
+                        continue
                     try:
-                        self.__logger.info(
-                            "Mining package {} (Number {} of  {})".format(
-                                p, count + 1, len(self.__packages)
-                            )
+                        yield future.result()
+                    except Exception as e:
+                        self.__logger.warning(
+                            "Mining a package failed after the interrupt: {}".format(e)
                         )
-                        info = PackageInfo(name=p)
-                        pypirequest = PyPIRequest(p, self.__logfile)
-                        pypi_info = pypirequest.get_result_from_url()
-                        if pypi_info is None:
-                            self.__logger.warning(
-                                "No PyPI information found for package {}".format(p)
-                            )
-                            yield info
-                            continue
-
-                        info.project_on_pypi = True
-                        info.github_repo = self.__extract_repository_path(pypi_info)
-                        if info.github_repo is None:
-                            self.__logger.info(
-                                "No Github link found for package {}".format(p)
-                            )
-                            yield info
-                            continue
-
-                        if self.__github_token is not None:
-                            self.__logger.debug("Getting information from GitHub")
-                            try:
-                                github_request = GitHubRequest(
-                                    self.__github_token,
-                                    info.github_repo[0],
-                                    info.github_repo[1],
-                                    self.__logfile,
-                                )
-                                info.github_info = github_request.get_github_info()
-                            except GitHubRequestException:
-                                pass
-                            except Exception as e:
-                                self.__logger.error(
-                                    "Unknown exxeption from GitHubRequest: {}".format(e)
-                                )
-
-                        try:
-                            gitrequest = GitRequest(
-                                info.github_repo[0], info.github_repo[1], self.__logfile
-                            )
-                        except Exception as e:
-                            self.__logger.error(
-                                "Unknown exception from GitRequest: {}".format(e)
-                            )
 
-                        self.__checkout(tmpdir, gitrequest, info)
-                        yield info
-                    except KeyboardInterrupt:
-                        self.__logger.info(
-                            "Caught keyboard interrupt. Stopped mining. Returning already mined results"
-                        )
-                        break
-                    except Exception as e:
-                        self.__logger.error("Caught unknown exception: {}".format(e))
-                        traceback.print_exception(type(e), e, e.__traceback__)
-                        yield info
-                        continue
-        except PermissionError:
-            self.__logger.error(
-                "Could not delete temporary directory {}. Requires root permission. Please do this cleanup manually!".format(
-                    tmpdir
+    def __mine_package(self, count: int, p: str) -> PackageInfo:
+        info = PackageInfo(name=p)
+        watchdog = Watchdog(self.__deadlines, self.__logfile)
+        start = time.perf_counter()  # The clock of the tracer
+        try:
+            self.__logger.info(
+                "Mining package {} (Number {} of  {})".format(
+                    p, count + 1, len(self.__packages)
                 )
             )
-        return None
+            pypirequest = PyPIRequest(p, self.__logfile)
+            with watchdog.stage("pypi"):
+                pypi_info = pypirequest.get_result_from_url()
+            watchdog.add_bytes("pypi", pypirequest.response_size)
+            if pypi_info is None:
+                watchdog.set_outcome("pypi", "failure")
+                self.__logger.warning(
+                    "No PyPI information found for package {}".format(p)
+                )
+                return info
 
-    def __checkout(self, basedir: Path, request: GitRequest, info: PackageInfo):
-        try:
-            with TemporaryDirectory(dir=basedir) as d:
-                tmpdir = Path(d)
+            info.project_on_pypi = True
+            info.github_repo = self.__extract_repository_path(pypi_info)
+            if info.github_repo is None:
+                self.__logger.info("No Github link found for package {}".format(p))
+                return info
+
+            if self.__github_token is not None:
+                self.__logger.debug("Getting information from GitHub")
                 try:
-                    info.github_repo_exists = True
-                    info.repo_info = request.grab(tmpdir)
-                except GitRequest.GitRepoNotFoundException:
-                    info.github_repo_exists = False
-                    self.__logger.info(
-                        "Cound not clone package {} from GitHub".format(info.name)
-                    )
-                    return
-                tmp_content = list(tmpdir.iterdir())
-                if len(tmp_content) != 1:
-                    self.__logger.error(
-                        "Check out of repository for packages {} did not work".format(
-                            info.name
+                    with watchdog.stage("github"):
+                        github_request = GitHubRequest(
+                            self.__github_token,
+                            info.github_repo[0],
+                            info.github_repo[1],
+                            self.__logfile,
                         )
+                        info.github_info = github_request.get_github_info()
+                except GitHubRequestException:
+                    pass
+                except TimeoutException:
+                    raise
+                except Exception as e:
+                    self.__logger.error(
+                        "Unknown exxeption from GitHubRequest: {}".format(e)
                     )
-                    return
-                projectdir = tmp_content[0]
-                count_runner = PytestRunner(
-                    tmpdir,
-                    projectdir.name,
-                    Dependencies("FROM python:3.8"),
-                    self.__logfile,
+
+            try:
+                gitrequest = GitRequest(
+                    info.github_repo[0], info.github_repo[1], self.__logfile
                 )
-                if count_runner.is_used_in_project():
-                    self.__logger.debug("Pytest is used!")
-                    info.testcase_count = count_runner.get_test_count()
-
-                info.dockerfile = self._run_v2(projectdir, info.name)
-                if info.dockerfile is not None:
-                    info.dockerfile_source = "v2"
-                else:
-                    deps = self._get_extra_dependencies(projectdir, info.name)
-                    if deps is not None:
-                        info.dockerfile_source = deps[1]
-                        info.dockerfile = deps[0]
-
-                if not info.dockerfile:
-                    return
-                self.__logger.debug("Found dependencies")
-                runner: AbstractRunner = PytestRunner(
-                    tmpdir,
-                    projectdir.name,
-                    info.dockerfile,
-                    self.__logfile,
-                    clear_dangling_images=self.__clear_dangling_images,
+            except Exception as e:
+                self.__logger.error("Unknown exception from GitRequest: {}".format(e))
+
+            profile = self.__profiler.profile(p) if self.__profiler else nullcontext()
+            with profile:
+                self.__checkout(gitrequest, info, watchdog)
+            return info
+        except TimeoutException as e:
+            self.__logger.warning("Mining package {} timed out: {}".format(p, e))
+            return info
+        except Exception as e:
+            self.__logger.error("Caught unknown exception: {}".format(e))
+            traceback.print_exception(type(e), e, e.__traceback__)
+            return info
+        finally:
+            info.timed_out_stage = watchdog.timed_out_stage
+            info.stage_durations = watchdog.durations
+            info.stage_outcomes = watchdog.outcomes
+            info.stage_bytes = watchdog.bytes
+            info.resource_usage = watchdog.resource_usage
+            add_span(p, "package", start, time.perf_counter() - start)
+
+    def __checkout(self, request: GitRequest, info: PackageInfo, watchdog: Watchdog):
+        with self.__workspaces.workspace(info.name) as tmpdir:
+            try:
+                info.github_repo_exists = True
+                with watchdog.stage("clone") as timeout:
+                    path = request.clone(tmpdir, timeout, watchdog.usage("clone"))
+            except GitRequest.GitRepoNotFoundException:
+                info.github_repo_exists = False
+                self.__logger.info(
+                    "Cound not clone package {} from GitHub".format(info.name)
                 )
-                if runner.is_used_in_project():
-                    try:
-                        info.dockerimage_build = True
-                        info.test_result = runner.run()
-                    except BuildFailedException:
-                        info.dockerimage_build = False
-                    except ValueError:
-                        self.__logger.error("Cound not parse test execution results")
-                else:
-                    info.dockerimage_build = self.__test_dockerfile_builds(
-                        info.dockerfile, tmpdir, projectdir.name
+                return
+            try:
+                with watchdog.stage("analysis") as timeout:
+                    info.repo_info = request.analyze(
+                        path, timeout, watchdog.usage("analysis")
+                    )
+            except TimeoutException:
+                # The repository statistics are not needed for the later stages
+                self.__logger.info("Analysis of package {} timed out".format(info.name))
+            checkout_size = self.__workspaces.size(tmpdir)
+            watchdog.add_bytes("clone", checkout_size)
+            if self.__workspaces.exceeds_size(checkout_size):
+                self.__logger.warning(
+                    "Checkout of package {} exceeds the workspace size".format(
+                        info.name
+                    )
+                )
+                return
+            tmp_content = list(tmpdir.iterdir())
+            if len(tmp_content) != 1:
+                self.__logger.error(
+                    "Check out of repository for packages {} did not work".format(
+                        info.name
                     )
+                )
+                return
+            projectdir = tmp_content[0]
+            count_runner = PytestRunner(
+                tmpdir,
+                projectdir.name,
+                Dependencies("FROM python:3.8"),
+                self.__logfile,
+            )
+            if count_runner.is_used_in_project():
+                self.__logger.debug("Pytest is used!")
+                info.testcase_count = count_runner.get_test_count()
+
+            info.dockerfile = self._run_v2(projectdir, info.name, watchdog)
+            if info.dockerfile is not None:
+                info.dockerfile_source = "v2"
+            else:
+                deps = self._get_extra_dependencies(projectdir, info.name)
+                if deps is not None:
+                    info.dockerfile_source = deps[1]
+                    info.dockerfile = deps[0]
 
-        except PermissionError:
-            pass
-            """
-            Found repositories on GitHub which have a __pycache__ sub-directory with root permission.
-            Trying to delete such a directory causes a PermissonError.
-            The temporary directories are placed in $TMPDIR, which defaults to /tmp so they will
-            be eventually cleaned up when shutting down the computer.
-            Note: Creating a temporary directory in the (user owned) home folder does not solve
-            this problem.
-            """
+            if not info.dockerfile:
+                return
+            self.__logger.debug("Found dependencies")
+            if self.__docker_config.wheelhouse is not None:
+                self.__docker_config.wheelhouse.prefetch_dependencies(info.dockerfile)
+            runner: AbstractRunner = PytestRunner(
+                tmpdir,
+                projectdir.name,
+                info.dockerfile,
+                self.__logfile,
+                docker_config=self.__docker_config,
+                runner_config=self.__runner_config,
+            )
+            if runner.is_used_in_project():
+                try:
+                    info.dockerimage_build = True
+                    with watchdog.stage("test") as timeout:
+                        info.test_result = runner.run(
+                            timeout,
+                            watchdog.timeout("build"),
+                            deadline=watchdog.deadline,
+                        )
+                except BuildFailedException:
+                    info.dockerimage_build = False
+                except TimeoutException as e:
+                    info.dockerimage_build = (
+                        e.stage == "test" and runner.docker is not None
+                    )
+                except ValueError:
+                    self.__logger.error("Cound not parse test execution results")
+                finally:
+                    info.coverage_mode = runner.coverage_mode
+                    info.test_cases = runner.test_cases
+                    info.file_coverage = runner.file_coverage
+                    info.slowest_tests = runner.slowest_tests()
+                    info.hung_tests = runner.hung_tests
+                    if runner.docker is not None:
+                        info.build_context_size = runner.docker.context_size
+                        info.queue_wait_time = runner.docker.queue_wait_time
+                        watchdog.split("test", "build", runner.docker.build_time)
+                        watchdog.add_bytes("build", runner.docker.context_size or 0)
+                        watchdog.add_bytes("test", runner.docker.output_size)
+                        watchdog.usage("test").add(runner.docker.resource_usage)
+                        if watchdog.timed_out_stage == "build":
+                            watchdog.set_outcome("build", "timeout")
+                        elif info.dockerimage_build:
+                            watchdog.set_outcome("build", "success")
+                        else:
+                            watchdog.set_outcome("build", "failure")
+                        if not info.dockerimage_build:
+                            # The tests never ran
+                            watchdog.set_outcome("test", "skipped")
+            else:
+                info.dockerimage_build = self.__test_dockerfile_builds(
+                    info, tmpdir, projectdir.name, watchdog
+                )
 
     def __test_dockerfile_builds(
-        self, dependencies: Dependencies, tmp_dir: Path, project_name: str
+        self, info: PackageInfo, tmp_dir: Path, project_name: str, watchdog: Watchdog
     ) -> bool:
+        if info.dockerfile is None:
+            return False
         docker = DockerTools(
-            dependencies,
+            info.dockerfile,
             tmp_dir,
             project_name,
             self.__logfile,
-            clear_dangling_images=self.__clear_dangling_images,
+            config=self.__docker_config,
         )
         docker.remove_image()
         docker.write_dockerfile()
         try:
-            docker.build_image()
+            # With a mounted source and a cache this builds only the environment
+            # image, which is kept for later test runs
+            with watchdog.stage("build") as timeout:
+                docker.build_image(timeout)
             docker.remove_image()
             return True
-        except BuildFailedException:
+        except (BuildFailedException, TimeoutException):
             return False
+        finally:
+            info.build_context_size = docker.context_size
+            info.queue_wait_time = docker.queue_wait_time
+            watchdog.add_bytes("build", docker.context_size or 0)
 
-    def _run_v2(self, projectdir: Path, project_name: str) -> Optional[Dependencies]:
+    def _run_v2(
+        self, projectdir: Path, project_name: str, watchdog: Watchdog
+    ) -> Optional[Dependencies]:
         inferdockerfile = InferDockerfile(projectdir, project_name, self.__logfile)
         try:
-            return inferdockerfile.infer_dockerfile()
+            with watchdog.stage("inference") as timeout:
+                return inferdockerfile.infer_dockerfile(
+                    timeout, watchdog.usage("inference")
+                )
         except InferDockerfile.NoEnvironmentFoundException:
             self.__logger.info(
                 "V2: No environment found for package {}".format(projectdir.name)
@@ -260,6 +388,10 @@ class Miner:
 
         for field in fields:
             if "readthedocs" in repo_info[field]:
+                # Imported here as only few packages link to their documentation
+                import requests
+                from bs4 import BeautifulSoup
+
                 content = BeautifulSoup(
                     requests.get(url=repo_info[field], stream=True).content,
                     "html.parser",
@@ -287,6 +419,60 @@ class PyexecMiner:
         self.__config = self.__parser.parse_args(argv[1:])
         self.__github_token: Optional[str] = self.__config.github_token
         self.__clear_dangling_images = self.__config.clear_dangling_images
+        self.__wheelhouse_path: Optional[str] = self.__config.wheelhouse
+        self.__offline = self.__config.offline
+        self.__base_images: Optional[str] = self.__config.base_images
+        self.__mount_source = self.__config.mount_source
+        self.__docker_socket: Optional[str] = self.__config.docker_socket
+        self.__workers: int = self.__config.workers
+        if self.__workers <= 0:
+            print("--workers requires a positive integer")
+            sys.exit(0)
+        self.__test_shards: int = self.__config.test_shards
+        if self.__test_shards <= 0:
+            print("--test-shards requires a positive integer")
+            sys.exit(0)
+        self.__environment_cache_size: Optional[int] = None
+        if self.__config.environment_cache_size is not None:
+            self.__environment_cache_size = self.__str_to_int(
+                self.__config.environment_cache_size
+            )
+            if (
+                self.__environment_cache_size is None
+                or self.__environment_cache_size <= 0
+            ):
+                print("--environment-cache requires a positive integer")
+                sys.exit(0)
+        self.__workspace_size = self.__optional_size(
+            "--workspace-size", "workspace_size"
+        )
+        self.__disk_budget = self.__optional_size("--disk-budget", "disk_budget")
+        self.__context_max_file_size = self.__optional_size(
+            "--context-max-file-size", "context_max_file_size"
+        )
+        self.__build_cache_budget = self.__optional_size(
+            "--build-cache-budget", "build_cache_budget"
+        )
+        wheelhouse_size = self.__str_to_int(self.__config.wheelhouse_size)
+        if wheelhouse_size is None or wheelhouse_size <= 0:
+            print("--wheelhouse-size requires a positive integer")
+            sys.exit(0)
+        self.__wheelhouse_size: int = wheelhouse_size
+        if self.__config.compress_records and not compression_available():
+            print("--compress-records requires zstandard to be installed")
+            sys.exit(0)
+        if self.__config.profile_every <= 0:
+            print("--profile-every requires a positive integer")
+            sys.exit(0)
+        if self.__config.metrics_interval <= 0:
+            print("--metrics-interval requires a positive number")
+            sys.exit(0)
+        if self.__config.log_rate_limit < 0:
+            print("--log-rate-limit requires a non-negative integer")
+            sys.exit(0)
+        if self.__config.parquet and not ParquetStatsWriter.available():
+            print("--parquet requires pyarrow to be installed")
+            sys.exit(0)
 
         if self.__config.package_list is not None:
             self.__package_list = self.__packages_from_file(
@@ -303,14 +489,24 @@ class PyexecMiner:
             self.__parser.format_help()
             sys.exit(0)
 
+    def __optional_size(self, option: str, dest: str) -> Optional[int]:
+        value = getattr(self.__config, dest)
+        if value is None:
+            return None
+        size = self.__str_to_int(value)
+        if size is None or size <= 0:
+            print("{} requires a positive integer".format(option))
+            sys.exit(0)
+        return size
+
     @staticmethod
     def __random_pypi_packages(n: int) -> List[str]:
         cmd = (
-            wget["-q", "-O-", "pypi.org/simple"]
-            | grep["/simple/"]
-            | sed['s|    <a href="/simple/||g']
-            | sed["s|/.*||g"]
-            | shuf["-n", n]
+            local["wget"]["-q", "-O-", "pypi.org/simple"]
+            | local["grep"]["/simple/"]
+            | local["sed"]['s|    <a href="/simple/||g']
+            | local["sed"]["s|/.*||g"]
+            | local["shuf"]["-n", n]
         )
         return cmd().splitlines()
 
@@ -335,22 +531,198 @@ class PyexecMiner:
 
     def mine(self) -> None:
         output_dir = self.__create_output_dir()
+        logfile = output_dir.joinpath("log.txt")
+        configure_logging(
+            console_level=self.__config.console_log_level,
+            file_level=self.__config.file_log_level,
+            json_format=self.__config.log_format == "json",
+            rate_limit=self.__config.log_rate_limit or None,
+        )
+        if self.__config.trace is not None:
+            start_tracing(Path(self.__config.trace).expanduser())
+        backend: DockerBackend = (
+            CliBackend(logfile)
+            if self.__docker_socket is None
+            else EngineApiBackend(self.__docker_socket, logfile)
+        )
+        wheelhouse = None
+        if self.__wheelhouse_path is not None:
+            wheelhouse = Wheelhouse(
+                Path(self.__wheelhouse_path).expanduser(),
+                self.__wheelhouse_size * 1024 * 1024,
+                logfile,
+                offline=self.__offline,
+            )
+            wheelhouse.start()
+        scheduler = Scheduler(
+            self.__config.max_builds,
+            self.__config.max_runs,
+            logfile,
+            cpus=self.__config.container_cpus,
+            memory=None
+            if self.__config.container_memory is None
+            else self.__config.container_memory * 1024 * 1024,
+            max_load=self.__config.max_load,
+            min_free_memory=self.__config.min_free_memory * 1024 * 1024,
+            min_free_disk=self.__config.min_free_disk * 1024 * 1024,
+        )
+        environment_cache = None
+        if self.__environment_cache_size is not None:
+            environment_cache = EnvironmentCache(
+                self.__environment_cache_size * 1024 * 1024,
+                output_dir.parent.joinpath("environment-cache.json"),
+                backend,
+                logfile,
+            )
+        image_collector = None
+        if self.__disk_budget is not None:
+            image_collector = ImageCollector(
+                self.__disk_budget * 1024 * 1024,
+                output_dir.parent.joinpath("images.json"),
+                backend,
+                logfile,
+                build_cache_budget=None
+                if self.__build_cache_budget is None
+                else self.__build_cache_budget * 1024 * 1024,
+            )
         miner = Miner(
             self.__package_list,
             self.__github_token,
-            output_dir.joinpath("log.txt"),
-            clear_dangling_images=self.__clear_dangling_images,
+            logfile,
+            docker_config=DockerConfig(
+                clear_dangling_images=self.__clear_dangling_images,
+                wheelhouse=wheelhouse,
+                base_images=None
+                if self.__base_images is None
+                else load_base_images(Path(self.__base_images)),
+                environment_cache=environment_cache,
+                mount_source=self.__mount_source,
+                backend=backend,
+                scheduler=scheduler,
+                image_collector=image_collector,
+                output_logs=None
+                if self.__config.output_log_size <= 0
+                else output_dir.joinpath("logs"),
+                output_log_size=self.__config.output_log_size * 1024 * 1024,
+                context_exclude_docs=self.__config.context_exclude_docs,
+                context_max_file_size=None
+                if self.__context_max_file_size is None
+                else self.__context_max_file_size * 1024 * 1024,
+            ),
+            workers=self.__workers,
+            runner_config=RunnerConfig(
+                parallel=self.__config.parallel_tests,
+                shards=self.__test_shards,
+                coverage=self.__config.coverage,
+                coverage_sample_rate=self.__config.coverage_sample_rate,
+                time_without_coverage=self.__config.time_without_coverage,
+                test_case_timeout=self.__config.test_case_timeout,
+            ),
+            deadlines=Deadlines(
+                clone=self.__config.clone_timeout,
+                analysis=self.__config.analysis_timeout,
+                inference=self.__config.inference_timeout,
+                build=self.__config.build_timeout,
+                test=self.__config.test_timeout,
+                package=self.__config.package_timeout,
+            ),
+            workspaces=WorkspaceManager(
+                backend,
+                logfile,
+                root=None
+                if self.__config.workspace_dir is None
+                else Path(self.__config.workspace_dir).expanduser(),
+                max_size=None
+                if self.__workspace_size is None
+                else self.__workspace_size * 1024 * 1024,
+            ),
+            profiler=None
+            if not self.__config.profile
+            else PackageProfiler(
+                ProfileConfig(
+                    output_dir.joinpath("profiles"),
+                    every=self.__config.profile_every,
+                    memory=self.__config.profile_memory,
+                    min_time=self.__config.profile_min_time,
+                    min_memory=self.__config.profile_min_memory * 1024 * 1024,
+                ),
+                logfile,
+            ),
         )
 
         stats_file_path = output_dir.joinpath("stats.csv")
-        output_file_path = output_dir.joinpath("output.txt")
+        records_path = output_dir.joinpath(
+            "records.jsonl.zst" if self.__config.compress_records else "records.jsonl"
+        )
         csv = CSV()
-        write_header = True
-        for info in miner.mine():
-            csv.append(csv.to_stats(info), stats_file_path, write_header=write_header)
-            write_header = False
-            with open(output_file_path, "a") as f:
-                f.write(str(info) + "\n\n")
+        stats_writer = StatsWriter(stats_file_path, logfile)
+        logger = get_logger("Pyexec::Miner", logfile)
+        store: Optional[ResultStore] = None
+        try:
+            store = ResultStore(Path(self.__config.database).expanduser(), logfile)
+            run_id = store.start_run(output_dir)
+        except sqlite3.Error as e:
+            logger.error(
+                "Could not open the database, not storing results in it: {}".format(e)
+            )
+            if store is not None:
+                store.close()
+                store = None
+        record_writer = RecordWriter(
+            records_path, compress=self.__config.compress_records
+        )
+        parquet_writer = (
+            ParquetStatsWriter(output_dir.joinpath("stats.parquet"), logfile)
+            if self.__config.parquet
+            else None
+        )
+        metrics = Metrics()
+        exporter = MetricsExporter(
+            metrics,
+            Path(self.__config.metrics_file).expanduser()
+            if self.__config.metrics_file is not None
+            else output_dir.joinpath("metrics.prom"),
+            logfile,
+            interval=self.__config.metrics_interval,
+        )
+        exporter.start()
+        try:
+            for info in miner.mine():
+                metrics.record(info)
+                stats = csv.to_stats(info)
+                stats_writer.write(stats)
+                if store is not None:
+                    try:
+                        store.add(run_id, info, stats)
+                    except sqlite3.Error as e:
+                        logger.error(
+                            "Could not store {} in the database: {}".format(
+                                info.name, e
+                            )
+                        )
+                if parquet_writer is not None:
+                    parquet_writer.write(stats)
+                record_writer.write(info)
+        finally:
+            exporter.stop()
+            stop_tracing()
+            stats_writer.close()
+            record_writer.close()
+            if store is not None:
+                store.close()
+            if parquet_writer is not None:
+                parquet_writer.close()
+            if wheelhouse is not None:
+                wheelhouse.stop()
+            logger.info("Scheduler: {}".format(scheduler.summary()))
+            logger.info("Resources: {}".format(metrics.resource_summary()))
+            own = own_usage()
+            logger.info(
+                "Pyexec itself: {:.1f} CPU s, {:.0f} MB peak".format(
+                    own.cpu_time, own.max_memory / 2 ** 20
+                )
+            )
+            stop_logging()
 
     @staticmethod
     def __create_parser() -> ArgParser:
@@ -376,7 +748,349 @@ class PyexecMiner:
             "--clear-dangling-images",
             action="store_true",
             dest="clear_dangling_images",
-            help="This can affect other programs! Repeadatly clears all dangling images (not just the ones created by pyexec) to save disk space",
+            help="Repeatedly clears the dangling images created by pyexec after failed builds to save disk space",
+        )
+        parser.add_argument(
+            "--wheelhouse",
+            dest="wheelhouse",
+            help="Directory of a local wheelhouse. Packages are served to all docker "
+            "builds from a package index on localhost and kept for later builds",
+        )
+        parser.add_argument(
+            "--wheelhouse-size",
+            dest="wheelhouse_size",
+            default="10240",
+            help="Maximal size of the wheelhouse in MB (default: 10240)",
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            dest="offline",
+            help="Install packages from the wheelhouse only, without falling back "
+            "to PyPI. Requires a seeded wheelhouse",
+        )
+        parser.add_argument(
+            "--base-images",
+            dest="base_images",
+            help="Manifest of pre-built base images created by pyexec-base-images. "
+            "Every image is built on top of the base image covering most of its "
+            "dependencies",
+        )
+        parser.add_argument(
+            "--environment-cache",
+            dest="environment_cache_size",
+            help="Keep environment images of up to the given size in MB. "
+            "Projects with the same dependencies share one environment image",
+        )
+        parser.add_argument(
+            "--database",
+            dest="database",
+            default=str(Path.home().joinpath("pyexec-output", "results.db")),
+            help="SQLite database the results of all runs are added to, query it "
+            "with pyexec-query.py (default: ~/pyexec-output/results.db)",
+        )
+        parser.add_argument(
+            "--compress-records",
+            action="store_true",
+            dest="compress_records",
+            help="Compress the records of the packages with zstd. Requires zstandard",
+        )
+        parser.add_argument(
+            "--parquet",
+            action="store_true",
+            dest="parquet",
+            help="Also write the stats to stats.parquet, with null instead of -1 for "
+            "missing values. Requires pyarrow",
+        )
+        parser.add_argument(
+            "--metrics-file",
+            dest="metrics_file",
+            help="Prometheus text file the durations, outcomes and bytes of all "
+            "stages are written to, e.g. in the directory of the textfile collector "
+            "of node_exporter (default: metrics.prom in the output folder)",
+        )
+        parser.add_argument(
+            "--trace",
+            dest="trace",
+            help="Write a timeline of all packages, stages, V2 runs and docker calls "
+            "to the given file in the Chrome Trace Event format, which Perfetto and "
+            "chrome://tracing display",
+        )
+        parser.add_argument(
+            "--metrics-interval",
+            dest="metrics_interval",
+            type=float,
+            default=15.0,
+            help="Seconds between updates of the metrics file (default: 15)",
+        )
+        parser.add_argument(
+            "--mount-source",
+            action="store_true",
+            dest="mount_source",
+            help="Build images containing only the environment and mount the "
+            "checkout read-only into the test container. Combined with "
+            "--environment-cache, the image built to check the environment is "
+            "reused for running the tests",
+        )
+        parser.add_argument(
+            "--context-exclude-docs",
+            action="store_true",
+            dest="context_exclude_docs",
+            help="Leave docs and doc directories out of the build context. Test "
+            "suites reading them, e.g. doctests, fail then",
+        )
+        parser.add_argument(
+            "--context-max-file-size",
+            dest="context_max_file_size",
+            help="Leave files larger than the given size in MB out of the build "
+            "context (default: no limit)",
+        )
+        parser.add_argument(
+            "--docker-socket",
+            dest="docker_socket",
+            help="Talk to the Docker Engine API over this unix socket, e.g. "
+            "/var/run/docker.sock, instead of running the docker command line client",
+        )
+        parser.add_argument(
+            "--parallel-tests",
+            action="store_true",
+            dest="parallel_tests",
+            help="Run the tests of every container on all its CPUs with pytest-xdist",
+        )
+        parser.add_argument(
+            "--test-shards",
+            dest="test_shards",
+            type=int,
+            default=1,
+            help="Split the test files of a project across up to this many containers "
+            "running at the same time (default: 1)",
+        )
+        parser.add_argument(
+            "--coverage",
+            dest="coverage",
+            choices=RunnerConfig.coverage_modes,
+            default="full",
+            help="How coverage is measured: not at all, with the low-overhead "
+            "sys.monitoring backend of Python 3.12+, in full for a sample of the "
+            "projects only, or in full (default: full)",
+        )
+        parser.add_argument(
+            "--coverage-sample-rate",
+            dest="coverage_sample_rate",
+            type=float,
+            default=0.1,
+            help="Share of the projects coverage is measured for with --coverage "
+            "sampling (default: 0.1)",
+        )
+        parser.add_argument(
+            "--time-without-coverage",
+            action="store_true",
+            dest="time_without_coverage",
+            help="Time the tests in a run without coverage before running them again "
+            "to measure coverage",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            dest="profile",
+            help="Profile mining every package with cProfile and write the profiles "
+            "to <package>.prof in the profiles folder of the output",
+        )
+        parser.add_argument(
+            "--profile-memory",
+            action="store_true",
+            dest="profile_memory",
+            help="With --profile, also trace allocations with tracemalloc and write "
+            "the top allocation sites to <package>.allocations.txt",
+        )
+        parser.add_argument(
+            "--profile-every",
+            dest="profile_every",
+            type=int,
+            default=1,
+            help="With --profile, profile only every nth package (default: 1)",
+        )
+        parser.add_argument(
+            "--profile-min-time",
+            dest="profile_min_time",
+            type=float,
+            default=0.0,
+            help="With --profile, only keep the profiles of packages taking at least "
+            "this many seconds (default: 0)",
+        )
+        parser.add_argument(
+            "--profile-min-memory",
+            dest="profile_min_memory",
+            type=int,
+            default=0,
+            help="With --profile-memory, only keep the allocations of packages whose "
+            "traced memory peaked above this many MB (default: 0)",
+        )
+        parser.add_argument(
+            "--test-case-timeout",
+            dest="test_case_timeout",
+            type=float,
+            help="Seconds a single test may take before it fails and the traceback "
+            "of all its threads is logged",
+        )
+        parser.add_argument(
+            "--clone-timeout",
+            dest="clone_timeout",
+            type=float,
+            default=600,
+            help="Seconds cloning a repository may take (default: 600)",
+        )
+        parser.add_argument(
+            "--analysis-timeout",
+            dest="analysis_timeout",
+            type=float,
+            default=600,
+            help="Seconds computing the repository statistics may take (default: 600)",
+        )
+        parser.add_argument(
+            "--inference-timeout",
+            dest="inference_timeout",
+            type=float,
+            default=1800,
+            help="Seconds inferring the dependencies may take (default: 1800)",
+        )
+        parser.add_argument(
+            "--build-timeout",
+            dest="build_timeout",
+            type=float,
+            default=1800,
+            help="Seconds building the docker image may take (default: 1800)",
+        )
+        parser.add_argument(
+            "--test-timeout",
+            dest="test_timeout",
+            type=float,
+            default=1800,
+            help="Seconds running the test suite may take (default: 1800)",
+        )
+        parser.add_argument(
+            "--package-timeout",
+            dest="package_timeout",
+            type=float,
+            help="Seconds mining a single package may take in total",
+        )
+        parser.add_argument(
+            "--workspace-dir",
+            dest="workspace_dir",
+            help="Directory the repositories are checked out to, e.g. a size-limited "
+            "tmpfs like /dev/shm (default: the temporary directory)",
+        )
+        parser.add_argument(
+            "--workspace-size",
+            dest="workspace_size",
+            help="Skip packages whose checkout is larger than the given size in MB",
+        )
+        parser.add_argument(
+            "--output-log-size",
+            dest="output_log_size",
+            type=int,
+            default=16,
+            help="Size in MB of the compressed build and test output kept per "
+            "package, 0 to keep none (default: 16)",
+        )
+        parser.add_argument(
+            "--log-level",
+            "--console-log-level",
+            dest="console_log_level",
+            choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+            default="INFO",
+            help="Lowest level of the messages printed to the console (default: INFO)",
+        )
+        parser.add_argument(
+            "--file-log-level",
+            dest="file_log_level",
+            choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+            default="DEBUG",
+            help="Lowest level of the messages written to log.txt (default: DEBUG)",
+        )
+        parser.add_argument(
+            "--log-format",
+            dest="log_format",
+            choices=["text", "json"],
+            default="text",
+            help="Write log.txt as plain text or as one JSON object per line "
+            "(default: text)",
+        )
+        parser.add_argument(
+            "--log-rate-limit",
+            dest="log_rate_limit",
+            type=int,
+            default=100,
+            help="Maximal number of messages below WARNING a worker prints to the "
+            "console per second, 0 for no limit (default: 100)",
+        )
+        parser.add_argument(
+            "--disk-budget",
+            dest="disk_budget",
+            help="Keep the images built by pyexec below the given size in MB by "
+            "removing the least recently used ones. Other images are never removed",
+        )
+        parser.add_argument(
+            "--build-cache-budget",
+            dest="build_cache_budget",
+            help="This can affect other programs! Together with --disk-budget, keep "
+            "the docker build cache below the given size in MB",
+        )
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            type=int,
+            default=1,
+            help="Number of packages mined concurrently (default: 1)",
+        )
+        parser.add_argument(
+            "--max-builds",
+            dest="max_builds",
+            type=int,
+            default=1,
+            help="Maximal number of concurrent docker builds (default: 1)",
+        )
+        parser.add_argument(
+            "--max-runs",
+            dest="max_runs",
+            type=int,
+            default=1,
+            help="Maximal number of concurrently running test containers (default: 1)",
+        )
+        parser.add_argument(
+            "--container-cpus",
+            dest="container_cpus",
+            type=float,
+            help="Number of CPUs available to every test container",
+        )
+        parser.add_argument(
+            "--container-memory",
+            dest="container_memory",
+            type=int,
+            help="Memory in MB available to every test container",
+        )
+        parser.add_argument(
+            "--max-load",
+            dest="max_load",
+            type=float,
+            help="Do not start further builds or containers while the load average "
+            "of the host is above this value (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "--min-free-memory",
+            dest="min_free_memory",
+            type=int,
+            default=0,
+            help="Do not start further builds or containers while less memory in MB "
+            "is available",
+        )
+        parser.add_argument(
+            "--min-free-disk",
+            dest="min_free_disk",
+            type=int,
+            default=0,
+            help="Do not start further builds or containers while less disk space in "
+            "MB is free",
         )
         return parser
 
@@ -1,10 +1,11 @@
-from dataclasses import dataclass
-from typing import Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 
 from pyexec.mining.githubrequest import GitHubInfo
 from pyexec.mining.gitrequest import RepoInfo
-from pyexec.testrunner.runresult import CoverageResult, TestResult
+from pyexec.testrunner.runresult import CoverageResult, TestCaseResult, TestResult
 from pyexec.util.dependencies import Dependencies
+from pyexec.util.resources import ResourceUsage
 
 
 @dataclass
@@ -16,10 +17,31 @@ class PackageInfo:
     dockerfile: Optional[Dependencies] = None
     dockerfile_source: Optional[str] = None
     dockerimage_build: bool = False
+    build_context_size: Optional[int] = None
+    queue_wait_time: Optional[float] = None
     testcase_count: Optional[int] = None
-    test_result: Optional[Tuple[TestResult, CoverageResult]] = None
+    test_result: Optional[Tuple[TestResult, Optional[CoverageResult]]] = None
+    coverage_mode: Optional[str] = None
+    test_cases: List[TestCaseResult] = field(default_factory=list, repr=False)
+    file_coverage: Dict[str, CoverageResult] = field(
+        default_factory=dict, repr=False
+    )
+    slowest_tests: List[str] = field(default_factory=list)
+    hung_tests: List[str] = field(default_factory=list)
     github_info: Optional[GitHubInfo] = None
     repo_info: Optional[RepoInfo] = None
+    timed_out_stage: Optional[str] = None
+    stage_durations: Dict[str, float] = field(default_factory=dict)
+    stage_outcomes: Dict[str, str] = field(default_factory=dict)
+    stage_bytes: Dict[str, int] = field(default_factory=dict)
+    resource_usage: Dict[str, ResourceUsage] = field(default_factory=dict)
+
+    @property
+    def total_resource_usage(self) -> ResourceUsage:
+        total = ResourceUsage()
+        for usage in self.resource_usage.values():
+            total.add(usage)
+        return total
 
     @property
     def has_testsuit(self) -> bool:
@@ -1,8 +1,6 @@
 from pathlib import Path
 from typing import Dict, Optional, cast
 
-import requests
-
 from pyexec.util.logging import get_logger
 
 
@@ -11,6 +9,7 @@ class PyPIRequest:
         self.__packageName = packageName
         self.__logger = get_logger("Pyexec::PyPIRequest", logfile)
         self.__url = "https://pypi.python.org/pypi/{}/json".format(packageName)
+        self.__response_size = 0
         self.__fields = [
             "author",
             "classifiers",
@@ -25,6 +24,11 @@ class PyPIRequest:
             "version",
         ]
 
+    @property
+    def response_size(self) -> int:
+        """Bytes of the JSON received from PyPI."""
+        return self.__response_size
+
     def get_result_from_url(self) -> Optional[Dict[str, str]]:
         data = self.__get_json()
         if data is not None:
@@ -33,6 +37,8 @@ class PyPIRequest:
             return None
 
     def __get_json(self) -> Optional[Dict[str, str]]:
+        import requests  # Slow to import, not needed before mining starts
+
         try:
             response = requests.get(url=self.__url, stream=True)
         except requests.exceptions.ConnectionError:
@@ -43,6 +49,7 @@ class PyPIRequest:
             )
             return None
 
+        self.__response_size = len(response.content)
         try:
             return response.json()
         except ValueError:  # Is probably a JSONDecodeError, however the doc for response.json() only promises a ValueError
@@ -0,0 +1,176 @@
+import io
+import json
+from dataclasses import asdict, fields
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from pyexec.mining.githubrequest import GitHubInfo
+from pyexec.mining.gitrequest import RepoInfo
+from pyexec.mining.packageInfo import PackageInfo
+from pyexec.testrunner.runresult import CoverageResult, TestCaseResult, TestResult
+from pyexec.util.dependencies import Dependencies
+from pyexec.util.resources import ResourceUsage
+
+try:
+    import zstandard
+except ImportError:  # zstandard is only needed for compressed records
+    zstandard = None
+
+SCHEMA_VERSION = 1
+
+
+def to_record(info: PackageInfo) -> Dict[str, Any]:
+    """Converts the info to an object that can be serialized as JSON."""
+    record: Dict[str, Any] = {"schema": SCHEMA_VERSION}
+    record.update(asdict(info))
+    if info.dockerfile is not None:
+        record["dockerfile"] = {
+            "text": info.dockerfile.to_dockerfile(),
+            "python_version": info.dockerfile.python_version,
+            "pip_dependencies": info.dockerfile.pip_dependencies(),
+        }
+    if info.github_info is not None:
+        record["github_info"] = {
+            key: value.isoformat() for key, value in asdict(info.github_info).items()
+        }
+    return record
+
+
+def from_record(record: Dict[str, Any]) -> PackageInfo:
+    if record.get("schema") != SCHEMA_VERSION:
+        raise ValueError("Unsupported record schema {}".format(record.get("schema")))
+    names = {f.name for f in fields(PackageInfo)}
+    info = PackageInfo(**{k: v for k, v in record.items() if k in names})
+    if record["github_repo"] is not None:
+        info.github_repo = (record["github_repo"][0], record["github_repo"][1])
+    if record["dockerfile"] is not None:
+        info.dockerfile = Dependencies.from_dockerfile(
+            record["dockerfile"]["text"], drop_non_run_command=False
+        )
+    if record["github_info"] is not None:
+        info.github_info = GitHubInfo(
+            **{
+                key: datetime.fromisoformat(value)
+                for key, value in record["github_info"].items()
+            }
+        )
+    if record["repo_info"] is not None:
+        info.repo_info = RepoInfo(**record["repo_info"])
+    if record["test_result"] is not None:
+        test_result, coverage = record["test_result"]
+        info.test_result = (
+            TestResult(**test_result),
+            None if coverage is None else CoverageResult(**coverage),
+        )
+    info.test_cases = [TestCaseResult(**case) for case in record["test_cases"]]
+    info.file_coverage = {
+        path: CoverageResult(**coverage)
+        for path, coverage in record["file_coverage"].items()
+    }
+    info.resource_usage = {
+        stage: ResourceUsage(**usage)
+        for stage, usage in record.get("resource_usage", dict()).items()
+    }
+    return info
+
+
+def compression_available() -> bool:
+    return zstandard is not None
+
+
+class RecordWriter:
+    """
+    Appends one JSON object per package to a JSON Lines file, optionally as zstd
+    compressed frames of their own.
+
+    Every record is written at once, so a file cut off by a crash loses at most the
+    last record. The offset and length of every record are written to an index next
+    to the file, which RecordReader uses for random access.
+    """
+
+    def __init__(self, path: Path, *, compress: bool = False) -> None:
+        if compress and zstandard is None:
+            raise RuntimeError("Compressing records requires zstandard")
+        self.__compressor = zstandard.ZstdCompressor() if compress else None
+        self.__file = open(path, "ab")
+        self.__index = open(_index_path(path), "a")
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(self, info: PackageInfo) -> None:
+        data = json.dumps(to_record(info), separators=(",", ":")).encode() + b"\n"
+        if self.__compressor is not None:
+            data = self.__compressor.compress(data)
+        offset = self.__file.tell()
+        self.__file.write(data)
+        self.__file.flush()
+        self.__index.write("{}\t{}\t{}\n".format(offset, len(data), info.name))
+        self.__index.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+        self.__index.close()
+
+
+class RecordReader:
+    """Reads the records written by RecordWriter, zstd compressed if named .zst."""
+
+    def __init__(self, path: Path) -> None:
+        self.__path = path
+        self.__compressed = path.suffix == ".zst"
+        if self.__compressed and zstandard is None:
+            raise RuntimeError("Reading compressed records requires zstandard")
+        self.__index: Optional[Dict[str, List[Tuple[int, int]]]] = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with open(self.__path, "rb") as f:
+            stream: IO[bytes] = f
+            if self.__compressed:
+                stream = zstandard.ZstdDecompressor().stream_reader(
+                    f, read_across_frames=True
+                )
+            for line in io.TextIOWrapper(stream, encoding="utf-8"):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # Cut off by a crash
+
+    def packages(self) -> Iterator[PackageInfo]:
+        for record in self:
+            yield from_record(record)
+
+    def names(self) -> List[str]:
+        return list(self.__load_index().keys())
+
+    def get(self, name: str) -> List[Dict[str, Any]]:
+        """Returns all records of the package, usually one, read through the index."""
+        records = []
+        with open(self.__path, "rb") as f:
+            for offset, length in self.__load_index().get(name, []):
+                f.seek(offset)
+                data = f.read(length)
+                if self.__compressed:
+                    data = zstandard.ZstdDecompressor().decompress(data)
+                records.append(json.loads(data))
+        return records
+
+    def __load_index(self) -> Dict[str, List[Tuple[int, int]]]:
+        if self.__index is None:
+            self.__index = dict()
+            with open(_index_path(self.__path), "r") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t", 2)
+                    if len(parts) == 3:
+                        self.__index.setdefault(parts[2], []).append(
+                            (int(parts[0]), int(parts[1]))
+                        )
+        return self.__index
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_name(path.name + ".idx")
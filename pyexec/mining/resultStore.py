@@ -0,0 +1,343 @@
+import csv
+import sqlite3
+import sys
+from contextlib import contextmanager
+from dataclasses import asdict, fields
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterator, List, Optional, Sequence, get_type_hints
+
+from configargparse import ArgParser
+
+from pyexec.mining.packageInfo import PackageInfo
+from pyexec.util.csv import PyexecStats
+from pyexec.util.logging import get_logger
+
+
+class ResultStore:
+    """
+    Stores the results of all runs of pyexec in a SQLite database.
+
+    The packages table holds the same columns as stats.csv, so a run can be exported
+    as before. Stages, Dockerfiles and test results are kept in tables of their own.
+    The database is opened in WAL mode and every package is written in a single
+    transaction, so several threads and several instances of pyexec can write to it
+    while it is queried. Opened read_only, the database is only queried and neither
+    created nor migrated.
+    """
+
+    __types = {bool: "INTEGER", int: "INTEGER", float: "REAL", str: "TEXT"}
+
+    def __init__(
+        self,
+        path: Path,
+        logfile: Optional[Path] = None,
+        *,
+        timeout: float = 60.0,
+        read_only: bool = False,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::ResultStore", logfile)
+        self.__lock = Lock()
+        if read_only:
+            self.__connection = sqlite3.connect(
+                "{}?mode=ro".format(path.resolve().as_uri()),
+                uri=True,
+                timeout=timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            self.__connection.row_factory = sqlite3.Row
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.__connection = sqlite3.connect(
+            str(path), timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self.__connection.row_factory = sqlite3.Row
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute("PRAGMA foreign_keys=ON")
+        # Instances starting at the same time create and migrate the schema one
+        # after another, the second one finds the tables and columns in place
+        with self.__transaction() as cursor:
+            for statement in self.__schema().split(";"):
+                if statement.strip() != "":
+                    cursor.execute(statement)
+            self.__add_missing_columns(cursor)
+
+    @classmethod
+    def __schema(cls) -> str:
+        hints = get_type_hints(PyexecStats)
+        columns = ",\n".join(
+            "    {} {}".format(f.name, cls.__types.get(hints[f.name], "TEXT"))
+            for f in fields(PyexecStats)
+        )
+        return """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    output_dir TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+{}
+);
+CREATE INDEX IF NOT EXISTS packages_name ON packages(name);
+CREATE INDEX IF NOT EXISTS packages_run ON packages(run_id);
+CREATE TABLE IF NOT EXISTS stages (
+    package_id INTEGER NOT NULL REFERENCES packages(id),
+    stage TEXT NOT NULL,
+    duration REAL,
+    timed_out INTEGER NOT NULL,
+    outcome TEXT
+);
+CREATE INDEX IF NOT EXISTS stages_package ON stages(package_id);
+CREATE TABLE IF NOT EXISTS dockerfiles (
+    package_id INTEGER NOT NULL REFERENCES packages(id),
+    source TEXT,
+    dockerfile TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dockerfiles_package ON dockerfiles(package_id);
+CREATE TABLE IF NOT EXISTS tests (
+    package_id INTEGER NOT NULL REFERENCES packages(id),
+    nodeid TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL NOT NULL,
+    timed_out INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tests_package ON tests(package_id);
+""".format(
+            columns
+        )
+
+    def __add_missing_columns(self, cursor: sqlite3.Cursor) -> None:
+        """Adds the columns added since the database was created."""
+        hints = get_type_hints(PyexecStats)
+        columns = {
+            "packages": {
+                f.name: self.__types.get(hints[f.name], "TEXT")
+                for f in fields(PyexecStats)
+            },
+            "stages": {"outcome": "TEXT"},
+        }
+        for table, types in columns.items():
+            existing = {
+                row["name"]
+                for row in cursor.execute("PRAGMA table_info({})".format(table))
+            }
+            for name, kind in types.items():
+                if name not in existing:
+                    self.__logger.debug("Adding column {}.{}".format(table, name))
+                    cursor.execute(
+                        "ALTER TABLE {} ADD COLUMN {} {}".format(table, name, kind)
+                    )
+
+    def start_run(self, output_dir: Path) -> int:
+        with self.__transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO runs (started_at, output_dir) VALUES (?, ?)",
+                (datetime.now().isoformat(timespec="seconds"), str(output_dir)),
+            )
+            assert cursor.lastrowid is not None
+            return cursor.lastrowid
+
+    def add(self, run_id: int, info: PackageInfo, stats: PyexecStats) -> None:
+        values = {k: self.__value(v) for k, v in asdict(stats).items()}
+        with self.__transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO packages (run_id, {}) VALUES (?, {})".format(
+                    ", ".join(values.keys()), ", ".join("?" * len(values))
+                ),
+                [run_id] + list(values.values()),
+            )
+            package_id = cursor.lastrowid
+            stages = list(info.stage_durations.keys())
+            stages += [s for s in info.stage_outcomes.keys() if s not in stages]
+            if info.timed_out_stage is not None and info.timed_out_stage not in stages:
+                stages.append(info.timed_out_stage)
+            cursor.executemany(
+                "INSERT INTO stages (package_id, stage, duration, timed_out, outcome) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        package_id,
+                        stage,
+                        info.stage_durations.get(stage),
+                        stage == info.timed_out_stage,
+                        info.stage_outcomes.get(stage),
+                    )
+                    for stage in stages
+                ],
+            )
+            if info.dockerfile is not None:
+                cursor.execute(
+                    "INSERT INTO dockerfiles VALUES (?, ?, ?)",
+                    (package_id, info.dockerfile_source, str(info.dockerfile)),
+                )
+            cursor.executemany(
+                "INSERT INTO tests VALUES (?, ?, ?, ?, ?)",
+                [
+                    (package_id, c.nodeid, c.outcome, c.duration, c.timed_out)
+                    for c in info.test_cases
+                ],
+            )
+
+    def query(self, sql: str, parameters: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        with self.__lock:
+            return self.__connection.execute(sql, parameters).fetchall()
+
+    def runs(self) -> List[sqlite3.Row]:
+        return self.query(
+            "SELECT runs.id, started_at, output_dir, COUNT(packages.id) AS packages "
+            "FROM runs LEFT JOIN packages ON packages.run_id = runs.id "
+            "GROUP BY runs.id ORDER BY runs.id"
+        )
+
+    def package(self, name: str) -> List[sqlite3.Row]:
+        return self.query(
+            "SELECT run_id, dockerfile_found, dockerfile_source, "
+            "dockerimage_build_success, timed_out_stage, failed, passed, errors, "
+            "percentage_covered FROM packages WHERE name = ? ORDER BY run_id",
+            (name,),
+        )
+
+    def failed_builds(self, runs: int = 3) -> List[sqlite3.Row]:
+        """Packages with a Dockerfile that did not build in any of the last runs."""
+        return self.query(
+            "SELECT name, COUNT(*) AS failures FROM packages "
+            "WHERE run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?) "
+            "AND dockerfile_found AND NOT dockerimage_build_success "
+            "GROUP BY name ORDER BY failures DESC, name",
+            (runs,),
+        )
+
+    def timeouts(self, stage: Optional[str] = None) -> List[sqlite3.Row]:
+        return self.query(
+            "SELECT packages.name, packages.run_id, stages.stage, stages.duration "
+            "FROM stages JOIN packages ON packages.id = stages.package_id "
+            "WHERE stages.timed_out AND (? IS NULL OR stages.stage = ?) "
+            "ORDER BY packages.run_id, packages.name",
+            (stage, stage),
+        )
+
+    def stages(
+        self, stage: Optional[str] = None, outcome: Optional[str] = None
+    ) -> List[sqlite3.Row]:
+        """The stages of all packages, optionally only a stage or an outcome."""
+        return self.query(
+            "SELECT packages.name, packages.run_id, stages.stage, stages.outcome, "
+            "stages.duration "
+            "FROM stages JOIN packages ON packages.id = stages.package_id "
+            "WHERE (? IS NULL OR stages.stage = ?) "
+            "AND (? IS NULL OR stages.outcome = ?) "
+            "ORDER BY packages.run_id, packages.name, stages.rowid",
+            (stage, stage, outcome, outcome),
+        )
+
+    def export_csv(self, run_id: int, csv_file: Path) -> int:
+        """Writes a run in the format of stats.csv, returns the number of rows."""
+        names = [f.name for f in fields(PyexecStats)]
+        # Columns added after the database was last written to are left empty
+        existing = {row["name"] for row in self.query("PRAGMA table_info(packages)")}
+        rows = self.query(
+            "SELECT {} FROM packages WHERE run_id = ? ORDER BY id".format(
+                ", ".join(name if name in existing else "NULL" for name in names)
+            ),
+            (run_id,),
+        )
+        hints = get_type_hints(PyexecStats)
+        with open(csv_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for row in rows:
+                writer.writerow(
+                    bool(value) if hints[name] is bool and value is not None else value
+                    for name, value in zip(names, row)
+                )
+        return len(rows)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__connection.close()
+
+    @contextmanager
+    def __transaction(self) -> Iterator[sqlite3.Cursor]:
+        """Runs the statements of the with block as one write transaction."""
+        with self.__lock:
+            # Taking the write lock up front keeps two instances from deadlocking
+            # when both try to turn a read into a write
+            self.__connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.__connection.cursor()
+            except BaseException:
+                self.__connection.execute("ROLLBACK")
+                raise
+            self.__connection.execute("COMMIT")
+
+    @staticmethod
+    def __value(value: Any) -> Any:
+        return str(value) if isinstance(value, datetime) else value
+
+
+def _print(rows: List[sqlite3.Row]) -> None:
+    if not rows:
+        print("No results")
+        return
+    writer = csv.writer(sys.stdout, delimiter="\t")
+    writer.writerow(rows[0].keys())
+    writer.writerows(rows)
+
+
+def main(argv: List[str]) -> None:
+    parser = ArgParser()
+    parser.add_argument(
+        "--database",
+        dest="database",
+        default=str(Path.home().joinpath("pyexec-output", "results.db")),
+        help="The database pyexec-miner wrote to "
+        "(default: ~/pyexec-output/results.db)",
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("runs", help="List all runs")
+    package = commands.add_parser("package", help="Results of a package in all runs")
+    package.add_argument("name")
+    failed = commands.add_parser(
+        "failed-builds", help="Packages whose image did not build in the last runs"
+    )
+    failed.add_argument("--runs", dest="runs", type=int, default=3)
+    timeouts = commands.add_parser("timeouts", help="Packages that timed out")
+    timeouts.add_argument("--stage", dest="stage")
+    stages = commands.add_parser("stages", help="Outcome and duration of stages")
+    stages.add_argument("--stage", dest="stage")
+    stages.add_argument(
+        "--outcome", dest="outcome", help="success, failure or timeout"
+    )
+    export = commands.add_parser("export", help="Export a run like stats.csv")
+    export.add_argument("run", type=int)
+    export.add_argument("-o", "--output", dest="output", default="stats.csv")
+    config = parser.parse_args(argv[1:])
+
+    database = Path(config.database).expanduser()
+    if not database.is_file():
+        print("No database found at {}".format(database))
+        sys.exit(1)
+    store = ResultStore(database, read_only=True)
+    try:
+        if config.command == "runs":
+            _print(store.runs())
+        elif config.command == "package":
+            _print(store.package(config.name))
+        elif config.command == "failed-builds":
+            _print(store.failed_builds(config.runs))
+        elif config.command == "timeouts":
+            _print(store.timeouts(config.stage))
+        elif config.command == "stages":
+            _print(store.stages(config.stage, config.outcome))
+        elif config.command == "export":
+            count = store.export_csv(config.run, Path(config.output))
+            print("Exported {} packages to {}".format(count, config.output))
+        else:
+            parser.print_help()
+    finally:
+        store.close()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from pyexec.dockerTools.backend import ContainerSpec, DockerBackend
+from pyexec.util.logging import get_logger
+
+
+class WorkspaceManager:
+    """
+    Hands out a scratch directory per package and reclaims it as soon as the
+    package is mined.
+
+    Tools running in containers as root, e.g. V2, leave root-owned files like
+    __pycache__ directories in the checkout. These cannot be deleted by the user
+    running pyexec, so they are deleted from inside a container that mounts the
+    workspace. Pointing root at a size-limited tmpfs, e.g. /dev/shm, keeps
+    checkouts off the disk altogether.
+    """
+
+    reclaim_image = "python:3.8"
+
+    def __init__(
+        self,
+        backend: DockerBackend,
+        logfile: Optional[Path] = None,
+        *,
+        root: Optional[Path] = None,
+        max_size: Optional[int] = None,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::WorkspaceManager", logfile)
+        self.__backend = backend
+        self.__root = root if root is not None else Path(tempfile.gettempdir())
+        self.__max_size = max_size
+        self.__root.mkdir(parents=True, exist_ok=True)
+
+    def prepare(self) -> None:
+        """
+        Pulls the image reclaim() needs unless it exists. The Engine API does not
+        pull missing images when a container is created, unlike docker run.
+        """
+        image = self.reclaim_image
+        try:
+            if self.__backend.image_exists(image) or self.__backend.pull_image(image):
+                return
+            error = "pull failed"
+        except Exception as e:
+            error = str(e)
+        self.__logger.warning(
+            "Could not pull {} ({}), workspaces with root-owned files will be "
+            "left behind".format(image, error)
+        )
+
+    @contextmanager
+    def workspace(self, name: str) -> Iterator[Path]:
+        path = Path(tempfile.mkdtemp(prefix="pyexec-ws-", dir=self.__root))
+        self.__logger.debug("Created workspace {} for {}".format(path, name))
+        try:
+            yield path
+        finally:
+            self.reclaim(path)
+
+    def exceeds_size(self, size: int) -> bool:
+        """Checks whether a workspace of size bytes takes up more than allowed."""
+        return self.__max_size is not None and size > self.__max_size
+
+    @staticmethod
+    def size(path: Path) -> int:
+        """Bytes taken up by the files in the workspace."""
+        size = 0
+        for directory, _, files in os.walk(path):
+            for f in files:
+                try:
+                    size = size + os.lstat(os.path.join(directory, f)).st_size
+                except OSError:
+                    continue
+        return size
+
+    def reclaim(self, path: Path) -> None:
+        try:
+            shutil.rmtree(path)
+            return
+        except FileNotFoundError:
+            return
+        except PermissionError:
+            self.__logger.debug("Removing root-owned files from {}".format(path))
+
+        try:
+            result = self.__backend.run(
+                ContainerSpec(
+                    image=self.reclaim_image,
+                    name="pyexec-reclaim-{}".format(uuid.uuid4().hex[:12]),
+                    command=["find", "/workspace", "-mindepth", "1", "-delete"],
+                    volumes=["{}:/workspace".format(path)],
+                ),
+                timeout=600,
+            )
+        except Exception as e:
+            self.__logger.error("Could not reclaim workspace {}: {}".format(path, e))
+            return
+        try:
+            shutil.rmtree(path)
+        except OSError as e:
+            self.__logger.error(
+                "Could not reclaim workspace {} (exit code {}): {}".format(
+                    path, result.exit_code, e
+                )
+            )
@@ -1,10 +1,13 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Tuple
+from timeit import default_timer as time
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from pyexec.dockerTools.dockerTools import DockerTools
-from pyexec.testrunner.runresult import CoverageResult, TestResult
+from pyexec.dockerTools.dockerTools import DockerConfig, DockerTools
+from pyexec.testrunner.runresult import CoverageResult, TestCaseResult, TestResult
 from pyexec.util.dependencies import Dependencies
+from pyexec.util.exceptions import TimeoutException
 from pyexec.util.logging import get_logger
 
 
@@ -12,6 +15,20 @@ class RunnerNotUsedException(Exception):
     pass
 
 
+@dataclass
+class RunnerConfig:
+    parallel: bool = False  # Run the tests of a container on all its CPUs
+    shards: int = 1  # Number of containers the test files are split across
+    # off, sysmon (low-overhead tracing on Python 3.12+), sampling or full
+    coverage: str = "full"
+    coverage_sample_rate: float = 0.1  # Share of projects measured when sampling
+    test_case_timeout: Optional[float] = None  # Seconds a single test may take
+    # Time the tests in a run without coverage before measuring coverage
+    time_without_coverage: bool = False
+
+    coverage_modes = ["off", "sysmon", "sampling", "full"]
+
+
 class AbstractRunner(ABC):
     def __init__(
         self,
@@ -20,7 +37,8 @@ class AbstractRunner(ABC):
         dependencies: Dependencies,
         logfile: Optional[Path] = None,
         *,
-        clear_dangling_images: bool = False
+        docker_config: Optional[DockerConfig] = None,
+        runner_config: Optional[RunnerConfig] = None
     ) -> None:
         if not tmp_path.exists() or not tmp_path.is_dir():
             raise NotADirectoryError(
@@ -40,10 +58,56 @@ class AbstractRunner(ABC):
         self._project_name = project_name
         self._logfile = logfile
         self._logger = get_logger("Pyexec:AbstractRunner", logfile)
-        self.__clear_dangling_images = clear_dangling_images
+        self._docker_config = docker_config
+        self._runner_config = (
+            runner_config if runner_config is not None else RunnerConfig()
+        )
+        self.__docker: Optional[DockerTools] = None
+        self._test_cases: List[TestCaseResult] = []
+        self._file_coverage: Dict[str, CoverageResult] = dict()
+
+    @property
+    def docker(self) -> Optional[DockerTools]:
+        """The DockerTools used by the last run, None if there was no run."""
+        return self.__docker
+
+    @property
+    def test_cases(self) -> List[TestCaseResult]:
+        """The result of every test of the last run."""
+        return self._test_cases
+
+    @property
+    def file_coverage(self) -> Dict[str, CoverageResult]:
+        """The coverage of every file measured by the last run."""
+        return self._file_coverage
+
+    @property
+    def hung_tests(self) -> List[str]:
+        """The tests of the last run stopped because they exceeded their timeout."""
+        return [case.nodeid for case in self._test_cases if case.timed_out]
+
+    def slowest_tests(self, count: int = 5) -> List[str]:
+        """The count tests of the last run that took the longest."""
+        cases = sorted(self._test_cases, key=lambda case: case.duration, reverse=True)
+        return [case.nodeid for case in cases[:count]]
+
+    @property
+    def coverage_mode(self) -> str:
+        """The coverage mode used for this project."""
+        return self._runner_config.coverage
 
     @abstractmethod
-    def run(self) -> Tuple[TestResult, CoverageResult]:
+    def run(
+        self,
+        timeout: Optional[float] = None,
+        build_timeout: Optional[float] = None,
+        *,
+        deadline: Optional[float] = None
+    ) -> Tuple[TestResult, Optional[CoverageResult]]:
+        """
+        Builds the image within build_timeout and runs the tests within timeout.
+        Neither may last past deadline, given as timeit.default_timer.
+        """
         raise NotImplementedError("Implement run()")
 
     @abstractmethod
@@ -54,28 +118,83 @@ class AbstractRunner(ABC):
     def get_test_count(self) -> Optional[int]:
         raise NotImplementedError("Implement get_test_count()")
 
-    def _run(self, tout: Optional[int] = None) -> Tuple[str, str]:
+    def _run(
+        self,
+        tout: Optional[float] = None,
+        build_timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> Tuple[str, str]:
+        return self._run_commands([None], tout, build_timeout, deadline)[0]
+
+    def _run_commands(
+        self,
+        commands: Sequence[Optional[List[str]]],
+        tout: Optional[float] = None,
+        build_timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> List[Tuple[str, str]]:
+        """
+        Builds the image once and runs a container for every command, concurrently as
+        far as the scheduler admits them. A command of None runs the CMD of the image.
+        Every container writes its results to its own directory, see _results_dir(). The
+        containers get tout, but no more than what is left until deadline once the image
+        is built.
+        """
         self.__add_dependencies()
         docker = DockerTools(
             self._dependencies,
             self._project_path.parent,
             self._project_name,
             self._logfile,
-            clear_dangling_images=self.__clear_dangling_images,
+            config=self._docker_config,
         )
+        self.__docker = docker
         docker.remove_image()
         docker.write_dockerfile()
-        docker.build_image()
+        docker.build_image(build_timeout)
 
+        for shard in range(len(commands)):
+            self._results_dir(shard).mkdir(parents=True, exist_ok=True)
         try:
-            return docker.run_container(tout)
+            if deadline is not None:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise TimeoutException("No time left for test", "test")
+                tout = remaining if tout is None else min(tout, remaining)
+            self._prepare_containers(len(commands), tout)
+            if len(commands) == 1:
+                return [
+                    docker.run_container(
+                        tout, command=commands[0], results_dir=self._results_dir(0)
+                    )
+                ]
+            return docker.run_containers(
+                tout,
+                commands,
+                [self._results_dir(shard) for shard in range(len(commands))],
+            )
         finally:
             docker.remove_image()
 
+    def _prepare_containers(self, count: int, timeout: Optional[float]) -> None:
+        """Called with the timeout of the containers once the image is built."""
+
+    def _results_dir(self, shard: int = 0) -> Path:
+        """
+        Directory on the host the container of a shard writes its results to. It is
+        mounted to DockerTools.results_mount inside the container.
+        """
+        return self._project_path.parent.joinpath("pyexec-results", str(shard))
+
     def __add_dependencies(self) -> None:
-        self._dependencies.set_copy_command(
-            "COPY {} /tmp/{}/".format(self._project_path.name, self._project_path.name)
-        )
+        if self._docker_config is None or not self._docker_config.mount_source:
+            self._dependencies.set_copy_command(
+                "COPY --chown={} {} /tmp/{}/".format(
+                    DockerTools.host_user(),
+                    self._project_path.name,
+                    self._project_path.name,
+                )
+            )
         self._dependencies.set_workdir_command(
             "WORKDIR /tmp/{}".format(self._project_path.name)
         )
@@ -1,40 +1,37 @@
-import re
+import hashlib
+import json
+import shlex
+from collections import Counter
 from pathlib import Path
-from typing import Optional, Pattern, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from plumbum.cmd import grep, sh
-from setuptools import find_packages
+from plumbum import local
 
-from pyexec.testrunner.runner import AbstractRunner, RunnerNotUsedException
-from pyexec.testrunner.runresult import CoverageResult, TestResult
+from pyexec.dockerTools.dockerTools import DockerConfig, DockerTools
+from pyexec.testrunner.runner import (
+    AbstractRunner,
+    RunnerConfig,
+    RunnerNotUsedException,
+)
+from pyexec.testrunner.runresult import CoverageResult, TestCaseResult, TestResult
 from pyexec.util.dependencies import Dependencies
 
 
 class PytestRunner(AbstractRunner):
-
-    _pytest_regex: Pattern = re.compile(
-        r"=+"
-        r"(?:"
-        r"(?: (?P<failed>\d+) failed)?"
-        r"(?:,? (?P<passed>\d+) passed)?"
-        r"(?:,? (?P<skipped>\d+) skipped)?"
-        r"(?:,? (?P<xfailed>\d+) xfailed)?"
-        r"(?:,? (?P<xpassed>\d+) xpassed)?"
-        r"(?:,? (?P<warnings>\d+) warnings?)?"
-        r"(?:,? (?P<errors>\d+) errors?)?"
-        r"|"
-        r" no tests? ran"
-        r")"
-        r" in (?P<time>[\d.]+) ?s(?:econds?)?(?: ?\(\d+:\d+:\d+\))? =+\s*"
-    )
-    _coverage_regex: Pattern = re.compile(
-        r'\s*"totals": \{\s*'
-        r'\s*"covered_lines": (?P<covered>\d+),\s*'
-        r'\s*"num_statements": (?P<stmts>\d+),\s*'
-        r'\s*"percent_covered": (?P<percent>[\d.]+),\s*'
-        r'\s*"missing_lines": (?P<missing>\d+),\s*'
-        r'\s*"excluded_lines": (?P<excluded>\d+)\s*'
-    )
+    # Seconds between the traceback dump of a hanging test and it being stopped
+    hang_grace_period = 5.0
+    # The directories pytest does not look for tests in by default
+    __norecursedirs = [
+        "*.egg",
+        ".*",
+        "_darcs",
+        "build",
+        "CVS",
+        "dist",
+        "node_modules",
+        "venv",
+        "{arch}",
+    ]
 
     def __init__(
         self,
@@ -43,43 +40,228 @@ class PytestRunner(AbstractRunner):
         dependencies: Dependencies,
         logfile: Optional[Path] = None,
         *,
-        clear_dangling_images: bool = False
+        docker_config: Optional[DockerConfig] = None,
+        runner_config: Optional[RunnerConfig] = None
     ) -> None:
         super().__init__(
             tmp_path,
             project_name,
             dependencies,
             logfile,
-            clear_dangling_images=clear_dangling_images,
+            docker_config=docker_config,
+            runner_config=runner_config,
         )
+        self.__timed = False  # Whether the suite has to end before a timeout
+
+    @property
+    def coverage_mode(self) -> str:
+        """
+        The coverage mode used for this project. With sampling, a fixed share of the
+        projects, chosen by the hash of their name, is measured in full. Images with a
+        Python older than 3.12 are measured in full instead of with sysmon, which
+        coverage would silently fall back to.
+        """
+        mode = self._runner_config.coverage
+        if mode == "sysmon":
+            return "sysmon" if self.__supports_sysmon() else "full"
+        if mode != "sampling":
+            return mode
+        digest = hashlib.sha256(self._project_name.lower().encode("utf-8")).digest()
+        sample = int.from_bytes(digest[:4], "big") / 2 ** 32
+        return "full" if sample < self._runner_config.coverage_sample_rate else "off"
 
-    def run(self, timeout: Optional[int] = None) -> Tuple[TestResult, CoverageResult]:
+    def run(
+        self,
+        timeout: Optional[float] = None,
+        build_timeout: Optional[float] = None,
+        *,
+        deadline: Optional[float] = None
+    ) -> Tuple[TestResult, Optional[CoverageResult]]:
         if not self.is_used_in_project():
             raise RunnerNotUsedException(
                 "Pytest is not used in project {}".format(self._project_path.name)
             )
+        self.__timed = timeout is not None or deadline is not None
         self._add_dependencies()
-        out, err = self._run(timeout)
-        if "(no-data-collected)" in err:
-            self._logger.error("Coverage: No data collected")
-            raise ValueError("Coverage: No data collected")
-        return self._extract_run_results(out)
+        shards = self.__shard_test_files()
+        if len(shards) > 1:
+            self._logger.debug("Running tests in {} containers".format(len(shards)))
+            commands = [["sh", "-c", self.__test_script(files)] for files in shards]
+            self._run_commands(commands, timeout, build_timeout, deadline)
+        else:
+            shards = [[]]
+            self._run(timeout, build_timeout, deadline)
+        return self._extract_run_results(len(shards))
+
+    def __supports_sysmon(self) -> bool:
+        try:
+            version = tuple(
+                int(part) for part in self._dependencies.python_version.split(".")[:2]
+            )
+        except ValueError:
+            return False
+        return version >= (3, 12)
+
+    def _prepare_containers(self, count: int, timeout: Optional[float]) -> None:
+        if timeout is None:
+            return
+        # pytest is interrupted before the container is killed, so the tests that
+        # finished are still reported. The image is built by now, so the timeout is
+        # passed through the results directory.
+        suite_timeout = max(timeout - min(60.0, 0.1 * timeout), 1.0)
+        for shard in range(count):
+            with open(self._results_dir(shard).joinpath("suite-timeout"), "w") as f:
+                f.write("{:.0f}\n".format(suite_timeout))
 
     def _add_dependencies(self) -> None:
         self._logger.debug("Adding dependencies")
         self._dependencies.add_pip_dependency("pytest")
-        self._dependencies.add_pip_dependency("coverage")
+        self._dependencies.add_pip_dependency("pytest-reportlog")
+        if self._runner_config.parallel:
+            self._dependencies.add_pip_dependency("pytest-xdist")
+        if self._runner_config.test_case_timeout is not None:
+            self._dependencies.add_pip_dependency("pytest-timeout")
+        if self.coverage_mode != "off":
+            self._dependencies.add_pip_dependency("coverage")
+            if self._runner_config.parallel:
+                # pytest-cov measures the xdist workers and combines their data
+                self._dependencies.add_pip_dependency("pytest-cov")
         self._dependencies.set_cmd_command(
-            r"""CMD ["sh", "-c", "coverage run --source={} -m pytest -rA --tb=no -report=term-missing ; coverage json --pretty-print -o- | sed '/totals/,$!d' | head -n -1"]""".format(
-                ",".join(find_packages(where=self._project_path))
+            "CMD {}".format(json.dumps(["sh", "-c", self.__test_script([])]))
+        )
+
+    def __test_script(self, files: List[str]) -> str:
+        """
+        The tests write a report log and the coverage data to the results directory
+        instead of printing summaries that would have to be parsed. Coverage slows
+        the tests down, with time_without_coverage they are timed without it first
+        and run again to measure coverage.
+        """
+        results = DockerTools.results_mount
+        pytest = "python -m pytest {}-rA --tb=no".format(
+            "-n auto " if self._runner_config.parallel else ""
+        )
+        test_case_timeout = self._runner_config.test_case_timeout
+        if test_case_timeout is not None:
+            # faulthandler dumps the traceback of all threads of a hanging test,
+            # shortly after pytest-timeout fails the test and goes on with the next
+            pytest = "{} -o faulthandler_timeout={:.0f} --timeout={:.0f}".format(
+                pytest, test_case_timeout, test_case_timeout + self.hang_grace_period
+            )
+        arguments = " ".join(shlex.quote(f) for f in files)
+        runs: List[str] = []
+        if self.__timed_run:
+            runs.append(
+                self.__clocked(
+                    self.__limited(
+                        "{} --report-log={}/report.jsonl {}".format(
+                            pytest, results, arguments
+                        )
+                    ),
+                    "report",
+                )
             )
+        if self.coverage_mode != "off":
+            report = "coverage-report" if self.__timed_run else "report"
+            runs.append(self.__coverage_run(pytest, arguments, report))
+        script = " ; ".join(runs)
+        if self.__timed:
+            # All runs have to end before the suite timeout
+            script = "end=$(($(date +%s) + $(cat {}/suite-timeout))) ; {}".format(
+                results, script
+            )
+        return script
+
+    @property
+    def __timed_run(self) -> bool:
+        """Whether the tests are run without coverage to time them."""
+        return self.coverage_mode == "off" or self._runner_config.time_without_coverage
+
+    def __coverage_run(self, pytest: str, arguments: str, report: str) -> str:
+        """Runs the tests measuring coverage, writing <report>.jsonl and the data."""
+        from setuptools import find_packages  # Slow to import
+
+        results = DockerTools.results_mount
+        packages = find_packages(where=self._project_path)
+        pytest = "{} --report-log={}/{}.jsonl".format(pytest, results, report)
+        core = "COVERAGE_CORE=sysmon " if self.coverage_mode == "sysmon" else ""
+        if self._runner_config.parallel:
+            cov = " ".join("--cov={}".format(p) for p in packages) or "--cov"
+            measured = self.__limited(
+                "{} {} --cov-report=json:{}/coverage.json {}".format(
+                    pytest, cov, results, arguments
+                ),
+                core,
+            )
+            return self.__clocked(measured, report)
+        measured = self.__limited(
+            "{} {}".format(
+                pytest.replace(
+                    "python -m pytest",
+                    "coverage run --source={} -m pytest".format(",".join(packages)),
+                ),
+                arguments,
+            ),
+            core,
+        )
+        return "{} ; coverage json -q -o {}/coverage.json".format(
+            self.__clocked(measured, report), results
         )
 
+    @staticmethod
+    def __clocked(command: str, name: str) -> str:
+        """
+        Writes the time before and after the command to <name>.start and <name>.stop
+        in the results directory, the wall time of the whole pytest session.
+        """
+        return "date +%s.%N > {0}/{1}.start ; {2} ; date +%s.%N > {0}/{1}.stop".format(
+            DockerTools.results_mount, name, command
+        )
+
+    def __limited(self, command: str, variables: str = "") -> str:
+        """
+        Runs command with the environment variables, interrupting it at the end of
+        the suite timeout if there is one.
+        """
+        if not self.__timed:
+            return variables + command.rstrip()
+        return (
+            'left=$((end - $(date +%s))) ; [ "$left" -gt 0 ] && '
+            '{}timeout -s INT "$left" {}'.format(variables, command.rstrip())
+        )
+
+    def __shard_test_files(self) -> List[List[str]]:
+        """
+        Splits the test files into shards with about the same number of tests. Files
+        passed to pytest are collected whatever their name, so only those matching
+        the default python_files patterns outside of norecursedirs are considered.
+        """
+        if self._runner_config.shards <= 1:
+            return []
+        grep = local["grep"]["-rc", "--include=test_*.py", "--include=*_test.py"]
+        for directory in self.__norecursedirs:
+            grep = grep["--exclude-dir={}".format(directory)]
+        _, out, _ = grep[r"def test_", self._project_path].run(retcode=None)
+        counts: Dict[str, int] = dict()
+        for line in out.splitlines():
+            path, _, count = line.rpartition(":")
+            if count.isdigit() and int(count) > 0:
+                relative = Path(path).relative_to(self._project_path)
+                counts[str(relative)] = int(count)
+
+        shards: List[List[str]] = [[] for _ in range(self._runner_config.shards)]
+        loads = [0] * len(shards)
+        for name in sorted(counts.keys(), key=lambda n: -counts[n]):
+            smallest = loads.index(min(loads))
+            shards[smallest].append(name)
+            loads[smallest] += counts[name]
+        return [shard for shard in shards if len(shard) > 0]
+
     def is_used_in_project(self) -> bool:
         setup_path = self._project_path.joinpath("setup.py")
         if setup_path.exists() and setup_path.is_file():
             for file in ["pytest", "py.test"]:
-                _, r, _ = grep["test_suite={}".format(file), setup_path].run(
+                _, r, _ = local["grep"]["test_suite={}".format(file), setup_path].run(
                     retcode=None
                 )
                 if len(r) > 0:
@@ -90,14 +272,14 @@ class PytestRunner(AbstractRunner):
             return True
 
         for stmt in ["import pytest", "from pytest import"]:
-            _, r, _ = grep["-R", stmt, self._project_path].run(retcode=None)
+            _, r, _ = local["grep"]["-R", stmt, self._project_path].run(retcode=None)
             if len(r) > 0:
                 return True
         return False
 
     def get_test_count(self) -> Optional[int]:
         if self.is_used_in_project():
-            cmd = sh[
+            cmd = local["sh"][
                 "-c", r"egrep -e 'def test_' -r {} | wc -l".format(self._project_path)
             ]
             _, count, _ = cmd.run(retcode=None)
@@ -109,50 +291,181 @@ class PytestRunner(AbstractRunner):
         else:
             return None
 
-    def _extract_run_results(self, log: str) -> Tuple[TestResult, CoverageResult]:
-        self._logger.debug("Parsing run results")
-        test_result = None
-        coverage_result = None
-
-        matches = self._pytest_regex.search(log)
-        if matches:
-            self._logger.debug("Matched test results")
-            failed = int(matches.group("failed")) if matches.group("failed") else 0
-            passed = int(matches.group("passed")) if matches.group("passed") else 0
-            skipped = int(matches.group("skipped")) if matches.group("skipped") else 0
-            xfailed = int(matches.group("xfailed")) if matches.group("xfailed") else 0
-            xpassed = int(matches.group("xpassed")) if matches.group("xpassed") else 0
-            warnings = (
-                int(matches.group("warnings")) if matches.group("warnings") else 0
+    def _extract_run_results(
+        self, shards: int = 1
+    ) -> Tuple[TestResult, Optional[CoverageResult]]:
+        """
+        Reads the results all shards wrote to their results directory. Test results
+        are summed, the coverage is merged from the lines executed in every file, so
+        lines covered by several shards count once. The coverage is None if a shard
+        did not write it, for example when the suite ran out of time.
+        """
+        self._logger.debug("Reading run results")
+        self._test_cases = []
+        times: List[float] = []
+        tests_times: List[float] = []
+        coverage_times: List[float] = []
+        warnings = 0
+        executed: Dict[str, Set[int]] = dict()
+        summaries: Dict[str, Dict[str, Any]] = dict()
+        coverage_missing = False
+        for shard in range(shards):
+            results_dir = self._results_dir(shard)
+            cases, shard_warnings, tests_time = self.__read_report_log(
+                results_dir.joinpath("report.jsonl")
             )
-            error = int(matches.group("errors")) if matches.group("errors") else 0
-            time = float(matches.group("time"))
+            self._test_cases.extend(cases)
+            warnings += shard_warnings
+            time = self.__session_time(results_dir, "report")
+            times.append(tests_time if time is None else time)
+            tests_times.append(tests_time)
+            if self.coverage_mode == "off":
+                continue
+            coverage_log = results_dir.joinpath("coverage-report.jsonl")
+            if not self.__timed_run:
+                coverage_times.append(times[-1])  # The only run measured coverage
+            elif coverage_log.is_file():
+                time = self.__session_time(results_dir, "coverage-report")
+                if time is None:
+                    time = self.__read_report_log(coverage_log)[2]
+                coverage_times.append(time)
+            files = self.__read_coverage(results_dir.joinpath("coverage.json"))
+            if files is None:
+                coverage_missing = True
+                continue
+            for path, data in files.items():
+                executed.setdefault(path, set()).update(data["executed_lines"])
+                summaries[path] = data["summary"]
 
-            test_result = TestResult(
-                failed, passed, skipped, xfailed, xpassed, warnings, error, time,
-            )
+        outcomes = Counter(case.outcome for case in self._test_cases)
+        test_result = TestResult(
+            outcomes["failed"],
+            outcomes["passed"],
+            outcomes["skipped"],
+            outcomes["xfailed"],
+            outcomes["xpassed"],
+            warnings,
+            outcomes["error"],
+            max(times),  # Shards run at the same time
+            max(coverage_times) if coverage_times else None,
+            max(tests_times),
+        )
+        if self.coverage_mode == "off" or coverage_missing:
+            return test_result, None
 
-        matches = self._coverage_regex.search(log)
-        if matches:
-            self._logger.debug("Matched coverage")
-            covered_lines = int(matches.group("covered"))
-            num_statements = int(matches.group("stmts"))
-            percent_covered = float(matches.group("percent"))
-            missing_lines = int(matches.group("missing"))
-            excluded_lines = int(matches.group("excluded"))
-
-            coverage_result = CoverageResult(
-                covered_lines,
-                num_statements,
-                percent_covered,
-                missing_lines,
-                excluded_lines,
+        self._file_coverage = {
+            path: self.__coverage_result(
+                len(executed[path]),
+                summary["num_statements"],
+                summary["excluded_lines"],
             )
+            for path, summary in summaries.items()
+        }
+        coverage_result = self.__coverage_result(
+            sum(c.covered_lines for c in self._file_coverage.values()),
+            sum(c.num_statements for c in self._file_coverage.values()),
+            sum(c.excluded_lines for c in self._file_coverage.values()),
+        )
+        return test_result, coverage_result
 
-        if test_result is None or coverage_result is None:
-            self._logger.error(
-                "Unexpected output format of pytest and pytest-cov:\n{}".format(log)
-            )
-            raise ValueError("Unexpected output format of pytest and pytest-cov")
+    def __read_report_log(self, path: Path) -> Tuple[List[TestCaseResult], int, float]:
+        """
+        Returns the test cases, the number of warnings and the time from the start of
+        the first to the end of the last test.
+        """
+        if not path.is_file():
+            self._logger.error("pytest did not write a report log")
+            raise ValueError("pytest did not write a report log")
+        cases: List[TestCaseResult] = []
+        warnings = 0
+        starts: List[float] = []
+        stops: List[float] = []
+        running: Dict[str, float] = dict()  # Tests set up but not torn down
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut off when the container was killed
+                kind = entry.get("$report_type")
+                if kind == "WarningMessage":
+                    warnings += 1
+                elif kind == "CollectReport" and entry.get("outcome") == "failed":
+                    cases.append(TestCaseResult(entry["nodeid"], "error", 0.0))
+                elif kind == "TestReport":
+                    if "start" in entry and "stop" in entry:
+                        starts.append(entry["start"])
+                        stops.append(entry["stop"])
+                    if entry.get("when") == "setup":
+                        running[entry["nodeid"]] = entry.get("start", 0.0)
+                    elif entry.get("when") == "teardown":
+                        running.pop(entry["nodeid"], None)
+                    outcome = self.__outcome(entry)
+                    if outcome is not None:
+                        cases.append(
+                            TestCaseResult(
+                                entry["nodeid"],
+                                outcome,
+                                entry.get("duration", 0.0),
+                                outcome == "failed"
+                                and "Timeout >" in str(entry.get("longrepr")),
+                            )
+                        )
+        # pytest was interrupted during these tests when the suite ran out of time
+        for nodeid, start in running.items():
+            duration = max(stops) - start if stops and start > 0 else 0.0
+            cases.append(TestCaseResult(nodeid, "failed", duration, True))
+        if starts:
+            time = float(max(stops) - min(starts))
         else:
-            return test_result, coverage_result
+            time = sum(case.duration for case in cases)
+        return cases, warnings, time
+
+    @staticmethod
+    def __session_time(results_dir: Path, name: str) -> Optional[float]:
+        """The wall time written by __clocked(), None if pytest did not finish."""
+        try:
+            start, stop = (
+                float(results_dir.joinpath("{}.{}".format(name, end)).read_text())
+                for end in ["start", "stop"]
+            )
+        except (OSError, ValueError):
+            return None
+        return stop - start
+
+    @staticmethod
+    def __outcome(report: Dict[str, Any]) -> Optional[str]:
+        """Classifies the report of a test phase like the pytest summary does."""
+        outcome = report.get("outcome")
+        xfail = "wasxfail" in report
+        if report.get("when") == "call":
+            if outcome == "passed":
+                return "xpassed" if xfail else "passed"
+            if outcome == "skipped":
+                return "xfailed" if xfail else "skipped"
+            return "failed"
+        if outcome == "failed":
+            return "error"  # in setup or teardown
+        if outcome == "skipped":
+            return "xfailed" if xfail else "skipped"
+        return None
+
+    def __read_coverage(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            self._logger.warning("Coverage: No data collected")
+            return None
+
+    @staticmethod
+    def __coverage_result(
+        covered_lines: int, num_statements: int, excluded_lines: int
+    ) -> CoverageResult:
+        return CoverageResult(
+            covered_lines,
+            num_statements,
+            100.0 * covered_lines / num_statements if num_statements > 0 else 100.0,
+            num_statements - covered_lines,
+            excluded_lines,
+        )
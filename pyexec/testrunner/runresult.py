@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -19,4 +20,15 @@ class TestResult:
     xpassed: int
     warnings: int
     error: int
-    time: float
+    time: float  # Wall time of the pytest session, without coverage if timed apart
+    coverage_time: Optional[float] = None  # Of the session measuring coverage
+    # From the start of the first to the end of the last test, without collection
+    tests_time: Optional[float] = None
+
+
+@dataclass
+class TestCaseResult:
+    nodeid: str
+    outcome: str  # passed, failed, skipped, xfailed, xpassed or error
+    duration: float
+    timed_out: bool = False  # Failed because it exceeded the per-test timeout
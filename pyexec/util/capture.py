@@ -0,0 +1,123 @@
+import gzip
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, Thread
+from typing import IO, Iterator, Optional
+
+
+class SpillLog:
+    """
+    Writes the complete output of a package gzip compressed to a file, until the
+    file reaches its size limit.
+
+    The file is kept open only while output is written. Every session appends a gzip
+    member of its own, zcat reads them as one stream.
+    """
+
+    def __init__(self, path: Path, limit: Optional[int] = None) -> None:
+        self.__path = path
+        self.__limit = limit
+        self.__lock = Lock()
+        self.__sessions = 0
+        self.__raw: Optional[IO[bytes]] = None
+        self.__file: Optional[gzip.GzipFile] = None
+        self.__truncated = False
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @property
+    def truncated(self) -> bool:
+        """Whether output was dropped because the file reached its limit."""
+        return self.__truncated
+
+    @contextmanager
+    def session(self, header: str) -> Iterator["SpillLog"]:
+        with self.__lock:
+            if self.__sessions == 0:
+                self.__path.parent.mkdir(parents=True, exist_ok=True)
+                self.__raw = open(self.__path, "ab")
+                self.__file = gzip.GzipFile(fileobj=self.__raw, mode="wb")
+            self.__sessions += 1
+        self.write("### {}\n".format(header).encode())
+        try:
+            yield self
+        finally:
+            with self.__lock:
+                self.__sessions -= 1
+                if self.__sessions == 0:
+                    self.__close()
+
+    def write(self, data: bytes) -> None:
+        with self.__lock:
+            if self.__file is None or self.__raw is None or self.__truncated:
+                return
+            if self.__limit is not None and self.__raw.tell() >= self.__limit:
+                self.__file.write(b"\n### Output truncated\n")
+                self.__truncated = True
+                return
+            self.__file.write(data)
+
+    def __close(self) -> None:
+        if self.__file is not None:
+            self.__file.close()
+        if self.__raw is not None:
+            self.__raw.close()
+        self.__file = None
+        self.__raw = None
+
+
+class OutputCapture:
+    """
+    Keeps the last tail_size bytes of a stream in memory, however much is written.
+    Everything written is passed on to the spill log, if there is one.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self, tail_size: int = 64 * 1024, spill: Optional[SpillLog] = None
+    ) -> None:
+        self.__tail = bytearray()
+        self.__tail_size = tail_size
+        self.__spill = spill
+        self.__total = 0
+        self.__lock = Lock()
+
+    @property
+    def total(self) -> int:
+        """Number of bytes written, including those no longer kept."""
+        return self.__total
+
+    def write(self, data: bytes) -> None:
+        with self.__lock:
+            self.__total += len(data)
+            self.__tail += data[-self.__tail_size :]
+            if len(self.__tail) > self.__tail_size:
+                del self.__tail[: len(self.__tail) - self.__tail_size]
+        if self.__spill is not None:
+            self.__spill.write(data)
+
+    def drain(self, stream: IO[bytes]) -> None:
+        """Writes everything read from the stream until it is closed."""
+        fd = stream.fileno()
+        while True:
+            data = os.read(fd, self.chunk_size)
+            if not data:
+                break
+            self.write(data)
+
+    def drain_in_background(self, stream: IO[bytes]) -> Thread:
+        thread = Thread(target=self.drain, args=(stream,), daemon=True)
+        thread.start()
+        return thread
+
+    def tail(self) -> str:
+        with self.__lock:
+            text = self.__tail.decode(errors="replace")
+        if self.__total > self.__tail_size:
+            # The first line is most likely cut off
+            text = text.split("\n", 1)[-1]
+        return text
@@ -1,9 +1,10 @@
-from dataclasses import asdict, dataclass
+import csv
+import os
+from dataclasses import asdict, dataclass, fields
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
-
-import pandas as pd
+from timeit import default_timer as time
+from typing import Any, Dict, List, Optional
 
 from pyexec.mining.packageInfo import PackageInfo
 from pyexec.util.logging import get_logger
@@ -33,6 +34,9 @@ class PyexecStats:
     pip_dependency_count: int
     apt_dependency_count: int
     dockerimage_build_success: bool
+    build_context_size: int
+    queue_wait_time: float
+    timed_out_stage: str
     testcase_count: int
     testsuit_executed: bool
     testsuit_result_parsed: bool
@@ -43,12 +47,29 @@ class PyexecStats:
     xpassed: int
     warnings: int
     errors: int
+    hung_tests: int
     time: float
+    tests_time: float
+    coverage_mode: str
+    coverage_time: float
     covered_lines: int
     num_statements: int
     percentage_covered: float
     missing_lines: int
     excluded_lines: int
+    pypi_duration: float
+    github_duration: float
+    clone_duration: float
+    analysis_duration: float
+    inference_duration: float
+    build_duration: float
+    test_duration: float
+    checkout_size: int
+    test_output_size: int
+    cpu_time: float
+    peak_memory: int
+    disk_written: int
+    network_bytes: int
 
 
 class CSV:
@@ -118,6 +139,13 @@ class CSV:
             -1 if info.dockerfile is None else info.dockerfile.apt_dependency_count()
         )
         dockerimage_build_success = info.dockerimage_build
+        build_context_size = (
+            -1 if info.build_context_size is None else info.build_context_size
+        )
+        queue_wait_time = -1 if info.queue_wait_time is None else info.queue_wait_time
+        timed_out_stage = (
+            "None" if info.timed_out_stage is None else info.timed_out_stage
+        )
         testcase_count = -1 if info.testcase_count is None else info.testcase_count
         testsuit_executed = info.testsuit_executed
         testsuit_result_parsed = info.testsuit_result_parsed
@@ -128,22 +156,40 @@ class CSV:
         xpassed = -1 if info.test_result is None else info.test_result[0].xpassed
         warnings = -1 if info.test_result is None else info.test_result[0].warnings
         errors = -1 if info.test_result is None else info.test_result[0].error
+        hung_tests = -1 if info.test_result is None else len(info.hung_tests)
         time = -1 if info.test_result is None else info.test_result[0].time
-        covered_lines = (
-            -1 if info.test_result is None else info.test_result[1].covered_lines
-        )
-        num_statements = (
-            -1 if info.test_result is None else info.test_result[1].num_statements
-        )
-        percentage_covered = (
-            -1 if info.test_result is None else info.test_result[1].percentage_covered
-        )
-        missing_lines = (
-            -1 if info.test_result is None else info.test_result[1].missing_lines
+        coverage = None if info.test_result is None else info.test_result[1]
+        tests_time = (
+            -1
+            if info.test_result is None or info.test_result[0].tests_time is None
+            else info.test_result[0].tests_time
         )
-        excluded_lines = (
-            -1 if info.test_result is None else info.test_result[1].excluded_lines
+        coverage_mode = "None" if info.coverage_mode is None else info.coverage_mode
+        coverage_time = (
+            -1
+            if info.test_result is None or info.test_result[0].coverage_time is None
+            else info.test_result[0].coverage_time
         )
+        covered_lines = -1 if coverage is None else coverage.covered_lines
+        num_statements = -1 if coverage is None else coverage.num_statements
+        percentage_covered = -1 if coverage is None else coverage.percentage_covered
+        missing_lines = -1 if coverage is None else coverage.missing_lines
+        excluded_lines = -1 if coverage is None else coverage.excluded_lines
+        durations = info.stage_durations
+        pypi_duration = durations.get("pypi", -1)
+        github_duration = durations.get("github", -1)
+        clone_duration = durations.get("clone", -1)
+        analysis_duration = durations.get("analysis", -1)
+        inference_duration = durations.get("inference", -1)
+        build_duration = durations.get("build", -1)
+        test_duration = durations.get("test", -1)
+        checkout_size = info.stage_bytes.get("clone", -1)
+        test_output_size = info.stage_bytes.get("test", -1)
+        usage = info.total_resource_usage
+        cpu_time = usage.cpu_time
+        peak_memory = usage.max_memory
+        disk_written = usage.disk_written
+        network_bytes = usage.network_bytes
         return PyexecStats(
             name,
             project_on_pypi,
@@ -167,6 +213,9 @@ class CSV:
             pip_dependency_count,
             apt_dependency_count,
             dockerimage_build_success,
+            build_context_size,
+            queue_wait_time,
+            timed_out_stage,
             testcase_count,
             testsuit_executed,
             testsuit_result_parsed,
@@ -177,15 +226,101 @@ class CSV:
             xpassed,
             warnings,
             errors,
+            hung_tests,
             time,
+            tests_time,
+            coverage_mode,
+            coverage_time,
             covered_lines,
             num_statements,
             percentage_covered,
             missing_lines,
             excluded_lines,
+            pypi_duration,
+            github_duration,
+            clone_duration,
+            analysis_duration,
+            inference_duration,
+            build_duration,
+            test_duration,
+            checkout_size,
+            test_output_size,
+            cpu_time,
+            peak_memory,
+            disk_written,
+            network_bytes,
+        )
+
+
+class StatsWriter:
+    """
+    Appends PyexecStats to a csv file that is kept open.
+
+    Rows are buffered and written once flush_rows rows are waiting or flush_interval
+    seconds passed since the last write. Every checkpoint_rows rows and on close the
+    file is synced to disk, so a crash loses at most the rows since the last
+    checkpoint. The header is only written to a new or empty file.
+    """
+
+    def __init__(
+        self,
+        csv_file: Path,
+        logfile: Optional[Path] = None,
+        *,
+        flush_rows: int = 16,
+        flush_interval: float = 10.0,
+        checkpoint_rows: int = 128,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::StatsWriter", logfile)
+        self.__flush_rows = flush_rows
+        self.__flush_interval = flush_interval
+        self.__checkpoint_rows = checkpoint_rows
+        self.__buffer: List[Dict[str, Any]] = []
+        self.__unsynced = 0
+        self.__last_flush = time()
+        self.__file = open(csv_file, "a", newline="")
+        self.__writer = csv.DictWriter(
+            self.__file, fieldnames=[f.name for f in fields(PyexecStats)]
         )
+        if self.__file.tell() == 0:
+            self.__writer.writeheader()
+
+    def __enter__(self) -> "StatsWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(self, stat: PyexecStats) -> None:
+        self.__buffer.append(asdict(stat))
+        if (
+            len(self.__buffer) >= self.__flush_rows
+            or time() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self.__writer.writerows(self.__buffer)
+        self.__file.flush()
+        self.__unsynced += len(self.__buffer)
+        self.__buffer = []
+        self.__last_flush = time()
+        if self.__unsynced >= self.__checkpoint_rows:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Writes all buffered rows and syncs the file to disk."""
+        if self.__buffer:
+            self.__writer.writerows(self.__buffer)
+            self.__unsynced += len(self.__buffer)
+            self.__buffer = []
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__logger.debug("Synced {} rows".format(self.__unsynced))
+        self.__unsynced = 0
 
-    def append(self, stat: PyexecStats, csv_file: Path, *, write_header: bool) -> None:
-        toCSV = asdict(stat)
-        frame = pd.DataFrame([toCSV])
-        frame.to_csv(csv_file, mode="a", header=write_header, index=False)
+    def close(self) -> None:
+        if self.__file.closed:
+            return
+        self.checkpoint()
+        self.__file.close()
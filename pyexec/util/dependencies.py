@@ -1,12 +1,22 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import re
+from dataclasses import dataclass
 from re import Pattern
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from pyexec.util.list import all_equal
 
 
+@dataclass
+class BaseImage:
+    tag: str
+    python_version: str
+    pip_packages: List[str]
+
+
 class Dependencies:
     class InvalidFormatException(Exception):
         pass
@@ -19,6 +29,9 @@ class Dependencies:
         r"""^RUN \["pip", ?"install", ?"(?P<name>[\w\d._-]+) ?(?:== ?(?P<version>[\d\w._+:~-]+))?"\]$"""
     )
     __apt_update_regex: Pattern = re.compile(r"""^RUN \["apt-get", ?"update" ?\]$""")
+    __pip_upgrade_regex: Pattern = re.compile(
+        r"""^RUN \["python", ?"-m", ?"pip", ?"install", ?"--upgrade", ?"pip" ?\]$"""
+    )
 
     def __init__(self, from_clause: str) -> None:
         match = self.__from_regex.match(from_clause)
@@ -46,7 +59,7 @@ class Dependencies:
             line = line.strip()
             if line == "":
                 continue
-            if line.startswith("FROM"):
+            if line.startswith("FROM") or line.startswith("ARG"):
                 continue
             elif instance.__parse_run_command(line):
                 continue
@@ -76,15 +89,39 @@ class Dependencies:
             d = match.groupdict()
             self.add_apt_dependency(d["name"], d["version"])
             return True
-        return self.__apt_update_regex.match(cmd) is not None
+        return (
+            self.__apt_update_regex.match(cmd) is not None
+            or self.__pip_upgrade_regex.match(cmd) is not None
+        )
 
-    def to_dockerfile(self) -> str:
-        df = "FROM python:{}\n".format(self.__python_version)
+    def to_dockerfile(
+        self,
+        *,
+        index_url: Optional[str] = None,
+        extra_index_url: Optional[str] = None,
+        base_images: Optional[List[BaseImage]] = None,
+        environment_only: bool = False,
+    ) -> str:
+        base = self.select_base_image(base_images) if base_images else None
+        if base is not None:
+            df = "FROM {}\n".format(base.tag)
+        else:
+            df = "FROM python:{}\n".format(self.__python_version)
+        if index_url is not None:
+            # Build arguments are visible to pip during the build only
+            df = df + "ARG PIP_INDEX_URL={}\n".format(index_url)
+            df = df + "ARG PIP_TRUSTED_HOST=127.0.0.1\n"
+            if extra_index_url is not None:
+                df = df + "ARG PIP_EXTRA_INDEX_URL={}\n".format(extra_index_url)
         df = df + r"""RUN ["apt-get", "update"]""" + "\n"
-        df = (
-            df
-            + r"""RUN ["python", "-m", "pip", "install", "--upgrade", "pip"]"""
-            + "\n"
+        if base is None:
+            df = (
+                df
+                + r"""RUN ["python", "-m", "pip", "install", "--upgrade", "pip"]"""
+                + "\n"
+            )
+        preinstalled = (
+            set() if base is None else {self.__normalize(p) for p in base.pip_packages}
         )
 
         self.__apt_installs.pop("python-pip", None)  # Do not attempt to install pip
@@ -101,7 +138,9 @@ class Dependencies:
                 df = df + r"""RUN ["apt-get","install","-y","{}"]""".format(name) + "\n"
 
         for name, version in self.__pip_installs.items():
-            if version is not None:
+            if version is None and self.__normalize(name) in preinstalled:
+                continue
+            elif version is not None:
                 df = (
                     df
                     + r"""RUN ["pip","install","{}=={}"]""".format(name, version)
@@ -110,6 +149,50 @@ class Dependencies:
             else:
                 df = df + r"""RUN ["pip","install","{}"]""".format(name) + "\n"
 
+        if environment_only:
+            return df
+        return df + self.__source_commands()
+
+    def to_source_dockerfile(self, environment_image: str) -> str:
+        """Returns a Dockerfile adding the project on top of an environment image."""
+        return "FROM {}\n".format(environment_image) + self.__source_commands()
+
+    def environment_hash(self) -> str:
+        """
+        Returns a hash identifying the environment described by these dependencies.
+
+        The hash only covers the Python version and the apt and pip dependencies and
+        does not depend on the order the dependencies were added in.
+        """
+        canonical = {
+            "python": self.__python_version,
+            "apt": sorted(
+                (
+                    [name.lower(), version]
+                    for name, version in self.__apt_installs.items()
+                    if name != "python-pip"
+                ),
+                key=self.__sort_key,
+            ),
+            "pip": sorted(
+                (
+                    [self.__normalize(name), version]
+                    for name, version in self.__pip_installs.items()
+                ),
+                key=self.__sort_key,
+            ),
+        }
+        return hashlib.sha256(
+            json.dumps(canonical, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def __sort_key(dependency: List[Optional[str]]) -> Tuple[str, str]:
+        # Names that normalize alike may come with and without a version
+        return dependency[0] or "", dependency[1] or ""
+
+    def __source_commands(self) -> str:
+        df = ""
         if self.__copy_command is not None:
             df = df + self.__copy_command + "\n"
 
@@ -120,6 +203,23 @@ class Dependencies:
             df = df + self.__cmd_command + "\n"
         return df
 
+    def select_base_image(self, base_images: List[BaseImage]) -> Optional[BaseImage]:
+        """Returns the base image providing most of the pip dependencies, if any."""
+        names = {self.__normalize(name) for name in self.__pip_installs.keys()}
+        best: Optional[BaseImage] = None
+        best_covered = 0
+        for image in base_images:
+            if image.python_version != self.__python_version:
+                continue
+            covered = len(names & {self.__normalize(p) for p in image.pip_packages})
+            if covered > best_covered or (
+                best is not None
+                and covered == best_covered
+                and len(image.pip_packages) < len(best.pip_packages)
+            ):
+                best, best_covered = image, covered
+        return best
+
     @classmethod
     def merge_dependencies(cls, dependencies: List[Dependencies]) -> Dependencies:
         if len(dependencies) == 0:
@@ -182,6 +282,15 @@ class Dependencies:
         elif self.__cmd_command is None or replace:
             self.__cmd_command = cmd
 
+    def cmd_arguments(self) -> Optional[List[str]]:
+        """Returns the arguments of the CMD command, e.g. to pass them to docker run."""
+        if self.__cmd_command is None:
+            return None
+        cmd = self.__cmd_command[len("CMD") :].strip()
+        if cmd.startswith("["):
+            return json.loads(cmd)
+        return ["sh", "-c", cmd]
+
     def add_pip_dependency(self, name: str, version: Optional[str] = None) -> None:
         if name not in self.__pip_installs or self.__pip_installs[name] is None:
             self.__pip_installs[name] = version
@@ -190,6 +299,13 @@ class Dependencies:
         if name not in self.__apt_installs or self.__apt_installs[name] is None:
             self.__apt_installs[name] = version
 
+    @property
+    def python_version(self) -> str:
+        return self.__python_version
+
+    def pip_dependencies(self) -> Dict[str, Optional[str]]:
+        return dict(self.__pip_installs)
+
     def pip_dependency_count(self) -> int:
         return len(self.__pip_installs)
 
@@ -199,6 +315,10 @@ class Dependencies:
     def __repr__(self) -> str:
         return self.to_dockerfile()
 
+    @staticmethod
+    def __normalize(name: str) -> str:
+        return re.sub(r"[-_.]+", "-", name).lower()
+
     @staticmethod
     def __merge_dict(
         base: Dict[str, Optional[str]], addition: Dict[str, Optional[str]]
@@ -1,5 +1,10 @@
+from typing import Optional
+
+
 class TimeoutException(Exception):
-    pass
+    def __init__(self, message: str = "", stage: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.stage = stage
 
 
 class DirectoryNotFoundException(Exception):
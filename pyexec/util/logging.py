@@ -1,27 +1,255 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from timeit import default_timer as time
+from typing import Dict, Optional, Tuple, Union
+
+_FILE_FORMAT = (
+    "%(asctime)s [%(levelname)s](%(name)s:%(funcName)s:%(lineno)d): %(message)s"
+)
+_CONSOLE_FORMAT = "[%(levelname)s](%(name)s): %(message)s"
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats every record as a JSON object on a line of its own."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "function": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops messages below WARNING once a thread logged more than rate messages in a
+    second. Packages are mined by one thread each, so a single package flooding the
+    log does not drown out the others. The number of dropped messages is logged when
+    the thread logs again in a later second.
+    """
+
+    def __init__(self, rate: int) -> None:
+        super().__init__()
+        self.__rate = rate
+        self.__lock = threading.Lock()
+        # thread -> (start of the current second, messages, dropped messages)
+        self.__counts: Dict[int, Tuple[float, int, int]] = dict()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time()
+        with self.__lock:
+            start, count, dropped = self.__counts.get(record.thread or 0, (now, 0, 0))
+            if now - start >= 1.0:
+                if dropped:
+                    record.msg = "({} messages suppressed) {}".format(
+                        dropped, record.msg
+                    )
+                start, count, dropped = now, 0, 0
+            count += 1
+            keep = count <= self.__rate
+            if not keep:
+                dropped += 1
+            self.__counts[record.thread or 0] = (start, count, dropped)
+        return keep
+
+
+class _Dispatcher(logging.Handler):
+    """
+    Runs on the listener thread and passes every record on to the console and to
+    the log file of the logger it was logged with.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.console = logging.StreamHandler()
+        self.file_level = logging.DEBUG
+        self.file_formatter = logging.Formatter(_FILE_FORMAT)
+        self.__files: Dict[Path, logging.FileHandler] = dict()
+
+    def set_file_format(self, level: int, formatter: logging.Formatter) -> None:
+        self.file_level = level
+        self.file_formatter = formatter
+        for handler in self.__files.values():
+            handler.setLevel(level)
+            handler.setFormatter(formatter)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logfile: Optional[Path] = getattr(record, "logfile", None)
+        if logfile is not None and record.levelno >= self.file_level:
+            handler = self.__files.get(logfile)
+            if handler is None:
+                handler = logging.FileHandler(logfile)
+                handler.setLevel(self.file_level)
+                handler.setFormatter(self.file_formatter)
+                self.__files[logfile] = handler
+            handler.handle(record)
+        # After the file, as the filters of the console may rewrite the message
+        if record.levelno >= self.console.level:
+            self.console.handle(record)
+
+    def close(self) -> None:
+        for handler in self.__files.values():
+            handler.close()
+        self.__files.clear()
+        try:
+            self.console.flush()
+        except (OSError, ValueError):
+            pass  # stderr may already be closed at exit
+        super().close()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Tags every record with the log file of its logger before queueing it. Once
+    logging was stopped the records are written by the calling thread instead.
+    """
+
+    def __init__(
+        self, log_queue: "queue.Queue[logging.LogRecord]", logfile: Optional[Path]
+    ) -> None:
+        super().__init__(log_queue)
+        self.__logfile = logfile
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare, keeps the traceback apart from the message,
+        # so the formatters of the dispatcher can place it themselves
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        record.logfile = self.__logfile
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if _config.listener is not None:
+            super().emit(record)
+            return
+        try:
+            _config.dispatcher.handle(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+
+class _LogConfig:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.queue: "queue.Queue[logging.LogRecord]" = queue.Queue()
+        self.dispatcher = _Dispatcher()
+        self.dispatcher.console.setLevel(logging.DEBUG)
+        self.dispatcher.console.setFormatter(logging.Formatter(_CONSOLE_FORMAT))
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.rate_limit: Optional[RateLimitFilter] = None
+        self.handlers: Dict[str, _QueueHandler] = dict()
+
+    def level(self) -> int:
+        return min(self.dispatcher.console.level, self.dispatcher.file_level)
+
+    def start(self) -> None:
+        if self.listener is None:
+            self.listener = logging.handlers.QueueListener(self.queue, self.dispatcher)
+            self.listener.start()
+
+
+_config = _LogConfig()
+
+
+def _level(level: Union[int, str]) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(level.upper())
+    if not isinstance(value, int):
+        raise ValueError("Unknown log level {}".format(level))
+    return value
+
+
+def configure_logging(
+    *,
+    console_level: Union[int, str] = logging.DEBUG,
+    file_level: Union[int, str] = logging.DEBUG,
+    json_format: bool = False,
+    rate_limit: Optional[int] = None,
+) -> None:
+    """
+    Configures all loggers returned by get_logger, including those created before.
+
+    The log file is written as JSON Lines with json_format. With rate_limit a thread
+    prints at most that many messages below WARNING per second to the console, the
+    log file gets all of them.
+    """
+    with _config.lock:
+        _config.dispatcher.console.setLevel(_level(console_level))
+        _config.dispatcher.set_file_format(
+            _level(file_level),
+            JsonFormatter() if json_format else logging.Formatter(_FILE_FORMAT),
+        )
+        console = _config.dispatcher.console
+        if _config.rate_limit is not None:
+            console.removeFilter(_config.rate_limit)
+        _config.rate_limit = RateLimitFilter(rate_limit) if rate_limit else None
+        if _config.rate_limit is not None:
+            console.addFilter(_config.rate_limit)
+        for name in _config.handlers:
+            logging.getLogger(name).setLevel(_config.level())
+        _config.start()
+
+
+def stop_logging() -> None:
+    """
+    Writes the queued messages and stops the listener thread. Messages logged later
+    on, for example by other atexit handlers, are written right away.
+    """
+    with _config.lock:
+        listener, _config.listener = _config.listener, None
+        if listener is not None:
+            listener.stop()
+        # Records queued by threads that had not yet seen the listener stopping
+        while True:
+            try:
+                record = _config.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                _config.dispatcher.handle(record)
+        _config.dispatcher.close()
+
+
+atexit.register(stop_logging)
 
 
 def get_logger(name: str, filepath: Optional[Path] = None) -> logging.Logger:
+    """
+    Returns a logger that never blocks the calling thread: its messages are queued
+    and written to the console and filepath by a background thread.
+    """
     logger = logging.getLogger(name)
     if logger.hasHandlers():  # Logger already configured
         return logger
 
-    logger.setLevel(logging.DEBUG)
-    if filepath:
-        log_file = logging.FileHandler(filepath)
-        log_file.setFormatter(
-            logging.Formatter(
-                "%(asctime)s [%(levelname)s](%(name)s:%(funcName)s:%(lineno)d): "
-                "%(message)s"
-            )
-        )
-        log_file.setLevel(logging.DEBUG)
-        logger.addHandler(log_file)
-
-    console = logging.StreamHandler()
-    console.setLevel(logging.DEBUG)
-    console.setFormatter(logging.Formatter("[%(levelname)s](%(name)s): %(message)s"))
-    logger.addHandler(console)
+    with _config.lock:
+        handler = _QueueHandler(_config.queue, filepath)
+        _config.handlers[name] = handler
+        logger.setLevel(_config.level())
+        logger.addHandler(handler)
+        _config.start()
     return logger
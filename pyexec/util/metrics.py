@@ -0,0 +1,267 @@
+import os
+from pathlib import Path
+from threading import Event, Lock, Thread
+from time import time as now
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from pyexec.mining.packageInfo import PackageInfo
+from pyexec.util.logging import get_logger
+from pyexec.util.resources import ResourceUsage
+
+STAGES = ["pypi", "github", "clone", "analysis", "inference", "build", "test"]
+
+
+class Histogram:
+    """A cumulative histogram in the sense of Prometheus."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.__buckets = sorted(buckets)
+        self.__counts = [0] * len(self.__buckets)
+        self.__sum = 0.0
+        self.__count = 0
+
+    def observe(self, value: float) -> None:
+        self.__sum += value
+        self.__count += 1
+        for i, bound in enumerate(self.__buckets):
+            if value <= bound:
+                self.__counts[i] += 1
+
+    def samples(self) -> List[Tuple[str, float]]:
+        """Returns (le, count) for every bucket, including +Inf."""
+        samples = [
+            (_number(bound), float(count))
+            for bound, count in zip(self.__buckets, self.__counts)
+        ]
+        samples.append(("+Inf", float(self.__count)))
+        return samples
+
+    @property
+    def sum(self) -> float:
+        return self.__sum
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+
+class Metrics:
+    """
+    Collects the duration, outcome, bytes processed and resource usage of every stage
+    of every mined package and renders them in the Prometheus text format.
+    """
+
+    duration_buckets = [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600]
+
+    def __init__(self) -> None:
+        self.__lock = Lock()
+        self.__start = now()
+        self.__packages = 0
+        self.__durations: Dict[str, Histogram] = dict()
+        self.__outcomes: Dict[Tuple[str, str], int] = dict()
+        self.__bytes: Dict[str, int] = dict()
+        self.__usage: Dict[str, ResourceUsage] = dict()
+        self.__queue_wait_time = 0.0
+
+    def record(self, info: PackageInfo) -> None:
+        with self.__lock:
+            self.__packages += 1
+            for stage, duration in info.stage_durations.items():
+                if stage not in self.__durations:
+                    self.__durations[stage] = Histogram(self.duration_buckets)
+                self.__durations[stage].observe(max(duration, 0.0))
+            for stage, outcome in info.stage_outcomes.items():
+                key = (stage, outcome)
+                self.__outcomes[key] = self.__outcomes.get(key, 0) + 1
+            for stage, size in info.stage_bytes.items():
+                self.__bytes[stage] = self.__bytes.get(stage, 0) + size
+            for stage, usage in info.resource_usage.items():
+                self.__usage.setdefault(stage, ResourceUsage()).add(usage)
+            if info.queue_wait_time is not None:
+                self.__queue_wait_time += info.queue_wait_time
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self.__lock:
+            lines += _header(
+                "pyexec_packages_total", "counter", "Number of packages mined"
+            )
+            lines.append("pyexec_packages_total {}".format(self.__packages))
+            lines += _header(
+                "pyexec_stage_duration_seconds",
+                "histogram",
+                "Seconds a stage took per package",
+            )
+            for stage in _ordered(self.__durations):
+                histogram = self.__durations[stage]
+                for le, count in histogram.samples():
+                    lines.append(
+                        'pyexec_stage_duration_seconds_bucket{{stage="{}",le="{}"}} '
+                        "{}".format(stage, le, _number(count))
+                    )
+                lines.append(
+                    'pyexec_stage_duration_seconds_sum{{stage="{}"}} {}'.format(
+                        stage, _number(histogram.sum)
+                    )
+                )
+                lines.append(
+                    'pyexec_stage_duration_seconds_count{{stage="{}"}} {}'.format(
+                        stage, histogram.count
+                    )
+                )
+            lines += _header(
+                "pyexec_stage_outcomes_total",
+                "counter",
+                "Number of times a stage succeeded, failed or timed out",
+            )
+            for (stage, outcome), count in sorted(
+                self.__outcomes.items(), key=lambda item: _stage_key(item[0][0])
+            ):
+                lines.append(
+                    'pyexec_stage_outcomes_total{{stage="{}",outcome="{}"}} {}'.format(
+                        stage, outcome, count
+                    )
+                )
+            lines += _header(
+                "pyexec_stage_bytes_total",
+                "counter",
+                "Bytes downloaded, checked out, sent to docker or output per stage",
+            )
+            for stage in _ordered(self.__bytes):
+                lines.append(
+                    'pyexec_stage_bytes_total{{stage="{}"}} {}'.format(
+                        stage, self.__bytes[stage]
+                    )
+                )
+            for name, kind, description, value in [
+                (
+                    "pyexec_stage_cpu_seconds_total",
+                    "counter",
+                    "CPU seconds used by the processes and containers of a stage",
+                    lambda u: _number(u.cpu_time),
+                ),
+                (
+                    "pyexec_stage_peak_memory_bytes",
+                    "gauge",
+                    "Largest peak memory of a process or container of a stage",
+                    lambda u: str(u.max_memory),
+                ),
+                (
+                    "pyexec_stage_disk_written_bytes_total",
+                    "counter",
+                    "Bytes written to disk by the processes and containers of a stage",
+                    lambda u: str(u.disk_written),
+                ),
+                (
+                    "pyexec_stage_network_bytes_total",
+                    "counter",
+                    "Bytes received and sent by the containers of a stage",
+                    lambda u: str(u.network_bytes),
+                ),
+            ]:
+                lines += _header(name, kind, description)
+                for stage in _ordered(self.__usage):
+                    lines.append(
+                        '{}{{stage="{}"}} {}'.format(
+                            name, stage, value(self.__usage[stage])
+                        )
+                    )
+            lines += _header(
+                "pyexec_queue_wait_seconds_total",
+                "counter",
+                "Seconds builds and containers waited for the scheduler",
+            )
+            lines.append(
+                "pyexec_queue_wait_seconds_total {}".format(
+                    _number(self.__queue_wait_time)
+                )
+            )
+            lines += _header(
+                "pyexec_start_time_seconds", "gauge", "Start of the run as Unix time"
+            )
+            lines.append("pyexec_start_time_seconds {}".format(_number(self.__start)))
+        return "\n".join(lines) + "\n"
+
+    def resource_summary(self) -> str:
+        with self.__lock:
+            return "; ".join(
+                "{}: {:.1f} CPU s, {:.0f} MB peak, {:.0f} MB written, "
+                "{:.0f} MB network".format(
+                    stage,
+                    usage.cpu_time,
+                    usage.max_memory / 2 ** 20,
+                    usage.disk_written / 2 ** 20,
+                    usage.network_bytes / 2 ** 20,
+                )
+                for stage, usage in sorted(
+                    self.__usage.items(), key=lambda item: _stage_key(item[0])
+                )
+            )
+
+    def write(self, path: Path) -> None:
+        """Replaces path atomically, as the node_exporter textfile collector wants."""
+        tmp = path.with_name(".{}.tmp".format(path.name))
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+class MetricsExporter:
+    """Writes the metrics to a Prometheus text file every interval seconds."""
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        path: Path,
+        logfile: Optional[Path] = None,
+        *,
+        interval: float = 15.0,
+    ) -> None:
+        self.__logger = get_logger("Pyexec::MetricsExporter", logfile)
+        self.__metrics = metrics
+        self.__path = path
+        self.__interval = interval
+        self.__stopped = Event()
+        self.__thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        if self.__thread is not None:
+            return
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        self.__thread = Thread(target=self.__export, name="pyexec-metrics", daemon=True)
+        self.__thread.start()
+        self.__logger.debug("Writing metrics to {}".format(self.__path))
+
+    def stop(self) -> None:
+        if self.__thread is None:
+            return
+        self.__stopped.set()
+        self.__thread.join()
+        self.__thread = None
+        self.__write()
+
+    def __export(self) -> None:
+        while not self.__stopped.wait(self.__interval):
+            self.__write()
+
+    def __write(self) -> None:
+        try:
+            self.__metrics.write(self.__path)
+        except OSError as e:
+            self.__logger.warning("Could not write metrics: {}".format(e))
+
+
+def _header(name: str, kind: str, description: str) -> List[str]:
+    return ["# HELP {} {}".format(name, description), "# TYPE {} {}".format(name, kind)]
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(float(value))
+
+
+def _stage_key(stage: str) -> Tuple[int, str]:
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage)
+
+
+def _ordered(stages: Mapping[str, Any]) -> List[str]:
+    return sorted(stages.keys(), key=_stage_key)
@@ -0,0 +1,135 @@
+import importlib.util
+import shutil
+from dataclasses import asdict, fields
+from datetime import datetime
+from pathlib import Path
+from timeit import default_timer as time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, get_type_hints
+
+from pyexec.util.csv import PyexecStats
+from pyexec.util.logging import get_logger
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+class ParquetStatsWriter:
+    """
+    Writes PyexecStats to a Parquet file with nullable columns instead of the
+    sentinels of the csv file: -1, "None" and datetime.min become null.
+
+    Rows are buffered and every flush writes them as a row group to a part file of
+    its own, which stays readable if pyexec crashes. On close the parts are compacted
+    into a single file with large row groups.
+    """
+
+    # Columns with few distinct values, stored dictionary encoded
+    categorical = ["dockerfile_source", "timed_out_stage", "coverage_mode"]
+
+    def __init__(
+        self,
+        parquet_file: Path,
+        logfile: Optional[Path] = None,
+        *,
+        flush_rows: int = 1024,
+        flush_interval: float = 60.0,
+    ) -> None:
+        if not self.available():
+            raise RuntimeError("Writing Parquet files requires pyarrow")
+        self.__logger = get_logger("Pyexec::ParquetStatsWriter", logfile)
+        self.__file = parquet_file
+        self.__parts = parquet_file.with_name(parquet_file.name + ".parts")
+        self.__parts.mkdir(parents=True, exist_ok=True)
+        self.__flush_rows = flush_rows
+        self.__flush_interval = flush_interval
+        self.__buffer: List[Dict[str, Any]] = []
+        self.__last_flush = time()
+        self.__part_count = 0
+        self.__schema = self.schema()
+
+    @staticmethod
+    def available() -> bool:
+        # pyarrow is only needed, and slow to import, with --parquet
+        return importlib.util.find_spec("pyarrow") is not None
+
+    @classmethod
+    def schema(cls) -> "pa.Schema":
+        import pyarrow as pa
+
+        types = {
+            bool: pa.bool_(),
+            int: pa.int64(),
+            float: pa.float64(),
+            str: pa.string(),
+            datetime: pa.timestamp("s"),
+        }
+        hints = get_type_hints(PyexecStats)
+        return pa.schema(
+            [
+                pa.field(
+                    f.name,
+                    pa.dictionary(pa.int32(), pa.string())
+                    if f.name in cls.categorical
+                    else types[hints[f.name]],
+                    nullable=f.name != "name",
+                )
+                for f in fields(PyexecStats)
+            ]
+        )
+
+    def __enter__(self) -> "ParquetStatsWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(self, stat: PyexecStats) -> None:
+        self.__buffer.append(
+            {key: self.__nullable(value) for key, value in asdict(stat).items()}
+        )
+        if (
+            len(self.__buffer) >= self.__flush_rows
+            or time() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self.__last_flush = time()
+        if not self.__buffer:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(self.__buffer, schema=self.__schema)
+        part = self.__parts.joinpath("part-{:05d}.parquet".format(self.__part_count))
+        pq.write_table(table, part)
+        self.__part_count += 1
+        self.__buffer = []
+
+    def close(self) -> None:
+        self.flush()
+        if self.__parts.exists():
+            compact(self.__parts, self.__file)
+            self.__logger.debug("Compacted {} parts".format(self.__part_count))
+
+    @staticmethod
+    def __nullable(value: Any) -> Any:
+        if isinstance(value, bool):
+            return value
+        if value == -1 or value == "None" or value == datetime.min:
+            return None
+        return value
+
+
+def compact(parts: Path, parquet_file: Path, row_group_size: int = 2 ** 20) -> None:
+    """Merges the part files in parts into parquet_file and removes them."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    files = sorted(parts.glob("part-*.parquet"))
+    if files:
+        table = pa.concat_tables([pq.read_table(f) for f in files])
+        tmp = parquet_file.with_name(parquet_file.name + ".tmp")
+        pq.write_table(table, tmp, row_group_size=row_group_size)
+        tmp.replace(parquet_file)
+    shutil.rmtree(parts)
@@ -0,0 +1,54 @@
+import os
+import signal
+from subprocess import PIPE, Popen, TimeoutExpired
+from typing import Optional, Tuple
+
+from plumbum.commands.base import BaseCommand
+
+from pyexec.util.capture import OutputCapture
+from pyexec.util.exceptions import TimeoutException
+from pyexec.util.resources import ChildWaiter, ResourceUsage
+
+
+def run_with_timeout(
+    command: BaseCommand,
+    timeout: Optional[float] = None,
+    *,
+    tail_size: int = 2 ** 20,
+    usage: Optional[ResourceUsage] = None,
+) -> Tuple[int, str, str]:
+    """
+    Runs the command in a session of its own and returns its exit code and the last
+    tail_size bytes of its output. The resources used by the command are added to
+    usage, if given.
+
+    On timeout the whole process group is killed, including all processes the
+    command started, and a TimeoutException is raised.
+    """
+    process = Popen(
+        command.formulate(), stdout=PIPE, stderr=PIPE, start_new_session=True
+    )
+    assert process.stdout is not None and process.stderr is not None
+    out, err = OutputCapture(tail_size), OutputCapture(tail_size)
+    readers = [
+        out.drain_in_background(process.stdout),
+        err.drain_in_background(process.stderr),
+    ]
+    waiter = ChildWaiter(process)
+    try:
+        returncode = waiter.wait(timeout=timeout)
+    except TimeoutExpired as e:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        waiter.wait()
+        raise TimeoutException(
+            "{} timed out after {:.0f}s".format(command, e.timeout)
+        )
+    finally:
+        for reader in readers:
+            reader.join()
+        if usage is not None:
+            usage.add(waiter.usage)
+    return returncode, out.tail(), err.tail()
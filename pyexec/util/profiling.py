@@ -0,0 +1,86 @@
+import cProfile
+import itertools
+import re
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from timeit import default_timer as time
+from typing import Iterator, Optional
+
+from pyexec.util.logging import get_logger
+
+
+@dataclass
+class ProfileConfig:
+    directory: Path
+    every: int = 1  # Profile every nth package only
+    memory: bool = False  # Trace allocations with tracemalloc
+    min_time: float = 0.0  # Keep profiles of packages taking at least this many s
+    min_memory: int = 0  # Keep allocations of packages with a larger peak in bytes
+    top: int = 25  # Number of allocation sites in the summary
+
+
+class PackageProfiler:
+    """
+    Profiles mining a package with cProfile and optionally tracemalloc, and writes
+    <package>.prof and <package>.allocations.txt for packages above the thresholds.
+
+    Python allows a single profiler per process from 3.12 on and tracemalloc is
+    process-wide anyway, so one package is profiled at a time. A package due for
+    profiling while another one is profiled is skipped. Allocations of other workers
+    running meanwhile end up in the summary as well.
+    """
+
+    def __init__(self, config: ProfileConfig, logfile: Optional[Path] = None) -> None:
+        self.__logger = get_logger("Pyexec::PackageProfiler", logfile)
+        self.__config = config
+        self.__counter = itertools.count()
+        self.__lock = Lock()
+        self.__config.directory.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        if next(self.__counter) % self.__config.every != 0:
+            yield
+            return
+        if not self.__lock.acquire(blocking=False):
+            self.__logger.debug("Not profiling {}, busy with another one".format(name))
+            yield
+            return
+        try:
+            profiler = cProfile.Profile()
+            if self.__config.memory:
+                tracemalloc.start()
+            start = time()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                duration = time() - start
+                if duration >= self.__config.min_time:
+                    profiler.dump_stats(str(self.__path(name, ".prof")))
+                if self.__config.memory:
+                    self.__write_allocations(name)
+        finally:
+            self.__lock.release()
+
+    def __write_allocations(self, name: str) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if peak < self.__config.min_memory:
+            return
+        statistics = snapshot.statistics("lineno")
+        with open(self.__path(name, ".allocations.txt"), "w") as f:
+            f.write("Peak of traced memory: {:.1f} MB\n".format(peak / 2 ** 20))
+            f.write(
+                "Top {} allocation sites still allocated:\n".format(self.__config.top)
+            )
+            for statistic in statistics[: self.__config.top]:
+                f.write("{}\n".format(statistic))
+
+    def __path(self, name: str, suffix: str) -> Path:
+        return self.__config.directory.joinpath(re.sub(r"[^\w.-]", "_", name) + suffix)
@@ -0,0 +1,208 @@
+import os
+import resource
+from dataclasses import dataclass
+from pathlib import Path
+from subprocess import TimeoutExpired
+from threading import Event, Thread
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclass
+class ResourceUsage:
+    cpu_time: float = 0.0  # user and system seconds
+    max_memory: int = 0  # peak resident memory in bytes
+    disk_written: int = 0  # in bytes
+    network_bytes: int = 0  # received and sent, in bytes
+
+    def add(self, other: "ResourceUsage") -> None:
+        """Adds the usage of something that ran after or beside this."""
+        self.cpu_time += other.cpu_time
+        self.max_memory = max(self.max_memory, other.max_memory)
+        self.disk_written += other.disk_written
+        self.network_bytes += other.network_bytes
+
+    @classmethod
+    def from_rusage(cls, usage: Any) -> "ResourceUsage":
+        return cls(
+            cpu_time=usage.ru_utime + usage.ru_stime,
+            max_memory=usage.ru_maxrss * 1024,  # reported in KiB on Linux
+            disk_written=usage.ru_oublock * 512,
+        )
+
+
+class ChildWaiter:
+    """
+    Waits for a child process with wait4 on a thread of its own, which reports the
+    resources used by the process and all its children it waited for.
+
+    Use wait() instead of the wait() of the process, which would reap the process
+    before its resource usage is read.
+    """
+
+    def __init__(self, process: Any) -> None:
+        self.__process = process
+        self.__usage = ResourceUsage()
+        self.__thread = Thread(target=self.__reap, daemon=True)
+        self.__thread.start()
+
+    @property
+    def usage(self) -> ResourceUsage:
+        return self.__usage
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        """Returns the exit code, raises TimeoutExpired like Popen.wait()."""
+        self.__thread.join(timeout)
+        if timeout is not None and self.__thread.is_alive():
+            raise TimeoutExpired(self.__process.args, timeout)
+        return self.__process.returncode
+
+    def __reap(self) -> None:
+        try:
+            _, status, usage = os.wait4(self.__process.pid, 0)
+        except ChildProcessError:  # Reaped elsewhere
+            self.__process.wait()
+            return
+        self.__usage = ResourceUsage.from_rusage(usage)
+        self.__process.returncode = (
+            -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        )
+
+
+class ContainerSampler:
+    """
+    Polls the resource usage of a running container until it is stopped.
+
+    The counters of a container are gone once it exits, so the last sample is used,
+    which misses at most the last interval. The peak memory is the maximum of all
+    samples where the kernel does not track it.
+    """
+
+    def __init__(
+        self,
+        sample: Callable[[], Optional[ResourceUsage]],
+        *,
+        interval: float = 1.0,
+    ) -> None:
+        self.__sample = sample
+        self.__interval = interval
+        self.__usage: Optional[ResourceUsage] = None
+        self.__stopped = Event()
+        self.__thread = Thread(target=self.__poll, daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> Optional[ResourceUsage]:
+        """Stops polling, returns the last sample or None if there was none."""
+        self.__stopped.set()
+        self.__thread.join()
+        return self.__usage
+
+    def __poll(self) -> None:
+        while True:
+            try:
+                usage = self.__sample()
+            except Exception:  # The container is not running (any more)
+                usage = None
+            if usage is not None:
+                if self.__usage is not None:
+                    usage.max_memory = max(usage.max_memory, self.__usage.max_memory)
+                self.__usage = usage
+            if self.__stopped.wait(self.__interval):
+                return
+
+
+def cgroup_usage(pid: int) -> Optional[ResourceUsage]:
+    """
+    Reads the resource usage of the cgroup of the process from the cgroup v2 or v1
+    hierarchy, and its network traffic from its network namespace.
+    """
+    root = Path("/sys/fs/cgroup")
+    groups: Dict[str, str] = dict()
+    with open("/proc/{}/cgroup".format(pid)) as f:
+        for line in f:
+            _, controllers, path = line.rstrip("\n").split(":", 2)
+            for controller in controllers.split(",") if controllers else [""]:
+                groups[controller] = path.lstrip("/")
+
+    usage = ResourceUsage(network_bytes=_network_bytes(pid))
+    if "" in groups and root.joinpath(groups[""], "cpu.stat").exists():
+        group = root.joinpath(groups[""])
+        cpu = _keyed(group.joinpath("cpu.stat"))
+        usage.cpu_time = cpu.get("usage_usec", 0) / 1e6
+        peak = group.joinpath("memory.peak")  # Linux 5.19 and newer
+        if not peak.exists():
+            peak = group.joinpath("memory.current")
+        usage.max_memory = int(peak.read_text())
+        with open(group.joinpath("io.stat")) as f:
+            for line in f:
+                for field in line.split()[1:]:
+                    if field.startswith("wbytes="):
+                        usage.disk_written += int(field[len("wbytes=") :])
+        return usage
+    if "cpuacct" in groups and "memory" in groups:
+        cpuacct = root.joinpath("cpuacct", groups["cpuacct"])
+        usage.cpu_time = int(cpuacct.joinpath("cpuacct.usage").read_text()) / 1e9
+        memory = root.joinpath("memory", groups["memory"])
+        usage.max_memory = int(memory.joinpath("memory.max_usage_in_bytes").read_text())
+        if "blkio" in groups:
+            stats = root.joinpath(
+                "blkio", groups["blkio"], "blkio.throttle.io_service_bytes"
+            )
+            with open(stats) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 3 and parts[1] == "Write":
+                        usage.disk_written += int(parts[2])
+        return usage
+    return None
+
+
+def engine_usage(stats: Dict[str, Any]) -> ResourceUsage:
+    """Converts the response of the stats endpoint of the Docker Engine API."""
+    cpu = (stats.get("cpu_stats") or dict()).get("cpu_usage") or dict()
+    memory = stats.get("memory_stats") or dict()
+    blkio = (stats.get("blkio_stats") or dict()).get("io_service_bytes_recursive")
+    networks = stats.get("networks") or dict()
+    return ResourceUsage(
+        cpu_time=cpu.get("total_usage", 0) / 1e9,
+        # max_usage is only reported with cgroup v1
+        max_memory=int(memory.get("max_usage", memory.get("usage", 0))),
+        disk_written=sum(
+            int(entry.get("value", 0))
+            for entry in blkio or []
+            if entry.get("op", "").lower() == "write"
+        ),
+        network_bytes=sum(
+            int(n.get("rx_bytes", 0)) + int(n.get("tx_bytes", 0))
+            for n in networks.values()
+        ),
+    )
+
+
+def own_usage() -> ResourceUsage:
+    """The resources used by pyexec itself so far."""
+    return ResourceUsage.from_rusage(resource.getrusage(resource.RUSAGE_SELF))
+
+
+def _keyed(path: Path) -> Dict[str, int]:
+    values = dict()
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2:
+                values[parts[0]] = int(parts[1])
+    return values
+
+
+def _network_bytes(pid: int) -> int:
+    total = 0
+    try:
+        with open("/proc/{}/net/dev".format(pid)) as f:
+            for line in f.readlines()[2:]:
+                interface, counters = line.split(":", 1)
+                if interface.strip() == "lo":
+                    continue
+                fields = counters.split()
+                total += int(fields[0]) + int(fields[8])
+    except OSError:
+        pass
+    return total
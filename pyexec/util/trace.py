@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from timeit import default_timer as time
+from typing import IO, Any, ContextManager, Dict, Iterator, List, Optional
+
+
+class Tracer:
+    """
+    Writes spans as complete events in the Chrome Trace Event format, which Perfetto
+    and chrome://tracing display as a timeline per thread.
+
+    Events are buffered and appended to a JSON array. The closing bracket is
+    optional in this format, so the file stays readable if pyexec crashes.
+    """
+
+    def __init__(self, path: Path, *, buffer_size: int = 1024) -> None:
+        self.__file: IO[str] = open(path, "w")
+        self.__file.write("[")
+        self.__empty = True
+        self.__lock = threading.Lock()
+        self.__buffer: List[Dict[str, Any]] = []
+        self.__buffer_size = buffer_size
+        self.__threads: Dict[int, str] = dict()
+        self.__start = time()
+        self.__pid = os.getpid()
+
+    def add(
+        self, name: str, category: str, start: float, duration: float, **args: Any
+    ) -> None:
+        """Adds a span that started at start, as returned by timeit.default_timer."""
+        tid = threading.get_ident()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self.__start) * 1e6),
+            "dur": round(duration * 1e6),
+            "pid": self.__pid,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        with self.__lock:
+            if tid not in self.__threads:
+                self.__threads[tid] = threading.current_thread().name
+                self.__buffer.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": self.__pid,
+                        "tid": tid,
+                        "args": {"name": self.__threads[tid]},
+                    }
+                )
+            self.__buffer.append(event)
+            if len(self.__buffer) >= self.__buffer_size:
+                self.__flush()
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        start = time()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time() - start, **args)
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__flush()
+            self.__file.write("\n]\n")
+            self.__file.close()
+
+    def __flush(self) -> None:
+        for event in self.__buffer:
+            self.__file.write("\n" if self.__empty else ",\n")
+            self.__file.write(json.dumps(event))
+            self.__empty = False
+        self.__file.flush()
+        self.__buffer = []
+
+
+_tracer: Optional[Tracer] = None
+_disabled = nullcontext()
+
+
+def start_tracing(path: Path) -> None:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path)
+
+
+def stop_tracing() -> None:
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+
+def span(name: str, category: str, **args: Any) -> ContextManager[None]:
+    """Traces the with block, does nothing unless tracing was started."""
+    tracer = _tracer
+    if tracer is None:
+        return _disabled
+    return tracer.span(name, category, **args)
+
+
+def add_span(
+    name: str, category: str, start: float, duration: float, **args: Any
+) -> None:
+    """Adds a span whose start and duration were measured by the caller."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add(name, category, start, duration, **args)
@@ -0,0 +1,126 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from timeit import default_timer as time
+from typing import Dict, Iterator, List, Optional
+
+from pyexec.util.exceptions import TimeoutException
+from pyexec.util.logging import get_logger
+from pyexec.util.resources import ResourceUsage
+from pyexec.util.trace import span
+
+
+@dataclass
+class Deadlines:
+    """Seconds every stage of mining a package may take, None for no limit."""
+
+    clone: Optional[float] = None
+    analysis: Optional[float] = None
+    inference: Optional[float] = None
+    build: Optional[float] = None
+    test: Optional[float] = None
+    package: Optional[float] = None
+
+
+class Watchdog:
+    """
+    Tracks the stages of mining one package against their deadlines.
+
+    Every stage gets the time left until its own deadline or the deadline of the
+    package, whichever comes first. The stages pass this timeout on to the
+    processes and containers they run, which are killed when it expires. The
+    watchdog records how long every stage took, whether it succeeded, failed or
+    timed out, how many bytes and resources it used and which stage timed out first.
+    """
+
+    def __init__(self, deadlines: Deadlines, logfile: Optional[Path] = None) -> None:
+        self.__logger = get_logger("Pyexec::Watchdog", logfile)
+        self.__deadlines = deadlines
+        self.__start = time()
+        self.__durations: Dict[str, float] = dict()
+        self.__outcomes: Dict[str, str] = dict()
+        self.__bytes: Dict[str, int] = dict()
+        self.__usage: Dict[str, ResourceUsage] = dict()
+        self.__timed_out_stage: Optional[str] = None
+
+    @property
+    def durations(self) -> Dict[str, float]:
+        return dict(self.__durations)
+
+    @property
+    def outcomes(self) -> Dict[str, str]:
+        """The outcome of every stage: success, failure or timeout."""
+        return dict(self.__outcomes)
+
+    @property
+    def bytes(self) -> Dict[str, int]:
+        return dict(self.__bytes)
+
+    @property
+    def resource_usage(self) -> Dict[str, ResourceUsage]:
+        return dict(self.__usage)
+
+    @property
+    def timed_out_stage(self) -> Optional[str]:
+        """The first stage that exceeded its deadline, None if all kept them."""
+        return self.__timed_out_stage
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """When the package runs out of time as timeit.default_timer, None if never."""
+        if self.__deadlines.package is None:
+            return None
+        return self.__start + self.__deadlines.package
+
+    def timeout(self, stage: str) -> Optional[float]:
+        """Seconds the stage may take from now on, None if unlimited."""
+        timeouts: List[float] = []
+        stage_timeout = getattr(self.__deadlines, stage, None)
+        if stage_timeout is not None:
+            timeouts.append(stage_timeout)
+        if self.__deadlines.package is not None:
+            timeouts.append(self.__deadlines.package - (time() - self.__start))
+        return max(min(timeouts), 0.0) if timeouts else None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Optional[float]]:
+        """Runs a stage, yields its timeout in seconds."""
+        timeout = self.timeout(name)
+        if timeout is not None and timeout <= 0:
+            self.__expired(name)
+            raise TimeoutException("No time left for {}".format(name), name)
+        start = time()
+        try:
+            with span(name, "stage"):
+                yield timeout
+            self.__outcomes.setdefault(name, "success")
+        except TimeoutException as e:
+            self.__expired(e.stage if e.stage is not None else name)
+            self.__outcomes[name] = "timeout"
+            raise
+        except Exception:
+            self.__outcomes[name] = "failure"
+            raise
+        finally:
+            self.__durations[name] = self.__durations.get(name, 0.0) + time() - start
+
+    def split(self, stage: str, part: str, seconds: float) -> None:
+        """Attributes seconds of the time spent in stage to part, that ran within it."""
+        self.__durations[stage] = self.__durations.get(stage, 0.0) - seconds
+        self.__durations[part] = self.__durations.get(part, 0.0) + seconds
+
+    def set_outcome(self, stage: str, outcome: str) -> None:
+        """Overrides the outcome of a stage that failed without raising."""
+        self.__outcomes[stage] = outcome
+
+    def add_bytes(self, stage: str, count: int) -> None:
+        self.__bytes[stage] = self.__bytes.get(stage, 0) + count
+
+    def usage(self, stage: str) -> ResourceUsage:
+        """The resource usage of the stage, for the processes it runs to add to."""
+        return self.__usage.setdefault(stage, ResourceUsage())
+
+    def __expired(self, stage: str) -> None:
+        self.__logger.warning("Stage {} exceeded its deadline".format(stage))
+        if self.__timed_out_stage is None:
+            self.__timed_out_stage = stage
@@ -0,0 +1,61 @@
+import io
+import tarfile
+
+import pytest
+
+from pyexec.dockerTools.buildContext import BuildContext
+
+
+@pytest.fixture
+def project(tmp_path):
+    project = tmp_path.joinpath("foo")
+    for name in ["foo/__init__.py", "tests/test_foo.py", "docs/index.rst"]:
+        project.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+        project.joinpath(name).write_text("x = 1\n")
+    project.joinpath(".git").mkdir()
+    project.joinpath(".git", "HEAD").write_text("ref: refs/heads/main\n")
+    project.joinpath("foo", "__init__.pyc").write_bytes(b"\0")
+    project.joinpath("data.bin").write_bytes(b"\0" * 1000)
+    dockerfile = tmp_path.joinpath("Dockerfile")
+    dockerfile.write_text("FROM python:3.8\n")
+    return dockerfile, project
+
+
+def _names(context):
+    return [name for _, name in context.files() if "." in name.split("/")[-1]]
+
+
+def test_version_control_and_caches_are_left_out(project):
+    dockerfile, project_dir = project
+    assert _names(BuildContext(dockerfile, project_dir)) == [
+        "foo/data.bin",
+        "foo/docs/index.rst",
+        "foo/foo/__init__.py",
+        "foo/tests/test_foo.py",
+    ]
+
+
+def test_docs_and_large_files_are_only_left_out_on_request(project):
+    dockerfile, project_dir = project
+    context = BuildContext(
+        dockerfile, project_dir, exclude_docs=True, max_file_size=100
+    )
+    assert _names(context) == ["foo/foo/__init__.py", "foo/tests/test_foo.py"]
+
+
+def test_context_without_project_only_has_the_dockerfile(project):
+    dockerfile, _ = project
+    assert [name for _, name in BuildContext(dockerfile).files()] == ["Dockerfile"]
+
+
+def test_tarball(project):
+    dockerfile, project_dir = project
+    buffer = io.BytesIO()
+    size = BuildContext(dockerfile, project_dir).write_tarball(buffer)
+    buffer.seek(0)
+    with tarfile.open(fileobj=buffer) as tar:
+        names = tar.getnames()
+        assert tar.extractfile("Dockerfile").read() == b"FROM python:3.8\n"
+    assert "foo/.git/HEAD" not in names
+    assert "foo/foo/__init__.py" in names
+    assert size == 16 + 1000 + 3 * 6
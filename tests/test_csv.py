@@ -0,0 +1,54 @@
+import csv
+
+import pytest
+
+pytest.importorskip("plumbum")
+
+from pyexec.mining.packageInfo import PackageInfo  # noqa: E402
+from pyexec.testrunner import runresult  # noqa: E402
+from pyexec.util.csv import CSV, StatsWriter  # noqa: E402
+
+
+def _stats(name, **info):
+    return CSV().to_stats(PackageInfo(name, **info))
+
+
+def _rows(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_missing_values_are_written_as_minus_one():
+    stats = _stats("foo")
+    assert stats.failed == -1
+    assert stats.tests_time == -1
+    assert stats.coverage_time == -1
+    assert stats.timed_out_stage == "None"
+
+
+def test_test_result_is_written():
+    result = runresult.TestResult(1, 2, 3, 0, 0, 4, 0, 10.0, 20.0, 8.0)
+    stats = _stats("foo", test_result=(result, None), coverage_mode="off")
+    assert (stats.failed, stats.passed, stats.skipped) == (1, 2, 3)
+    assert (stats.time, stats.coverage_time, stats.tests_time) == (10.0, 20.0, 8.0)
+    assert stats.covered_lines == -1
+
+
+def test_rows_are_buffered_until_flushed(tmp_path):
+    path = tmp_path.joinpath("stats.csv")
+    writer = StatsWriter(path, flush_rows=2, flush_interval=3600)
+    writer.write(_stats("foo"))
+    assert _rows(path) == []
+    writer.write(_stats("bar"))
+    assert [row["name"] for row in _rows(path)] == ["foo", "bar"]
+    writer.write(_stats("baz"))
+    writer.close()
+    assert [row["name"] for row in _rows(path)] == ["foo", "bar", "baz"]
+
+
+def test_header_is_only_written_once(tmp_path):
+    path = tmp_path.joinpath("stats.csv")
+    for name in ["foo", "bar"]:
+        with StatsWriter(path) as writer:
+            writer.write(_stats(name))
+    assert [row["name"] for row in _rows(path)] == ["foo", "bar"]
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("plumbum")
+
+from pyexec.dockerTools.backend import FakeBackend, RunResult  # noqa: E402
+from pyexec.dockerTools.dockerTools import (  # noqa: E402
+    BuildFailedException,
+    DockerConfig,
+    DockerTools,
+)
+from pyexec.dockerTools.scheduler import Scheduler  # noqa: E402
+from pyexec.util.dependencies import Dependencies  # noqa: E402
+from pyexec.util.exceptions import TimeoutException  # noqa: E402
+from pyexec.util.resources import ResourceUsage  # noqa: E402
+
+
+@pytest.fixture
+def context(tmp_path):
+    tmp_path.joinpath("Foo").mkdir()
+    tmp_path.joinpath("Foo", "setup.py").write_text("from setuptools import setup\n")
+    return tmp_path
+
+
+def _docker_tools(context, backend, **config):
+    dependencies = Dependencies("FROM python:3.8")
+    dependencies.add_pip_dependency("pytest")
+    dependencies.set_copy_command("COPY Foo /tmp/Foo/")
+    dependencies.set_cmd_command('CMD ["pytest"]')
+    return DockerTools(
+        dependencies, context, "Foo", config=DockerConfig(backend=backend, **config)
+    )
+
+
+def test_build_and_run(context):
+    backend = FakeBackend(
+        run_result=RunResult(0, "1 passed", "", 1.0, 42, ResourceUsage(cpu_time=2.0))
+    )
+    docker = _docker_tools(context, backend)
+    docker.write_dockerfile()
+    docker.build_image()
+    dockerfile = context.joinpath("Dockerfile").read_text()
+    assert 'RUN ["pip","install","pytest"]' in dockerfile
+    assert backend.calls[0] == ("build", "pyexec:foo")
+    assert docker.context_size > 0
+
+    stdout, _ = docker.run_container(None, results_dir=context.joinpath("results"))
+    assert stdout == "1 passed"
+    spec = backend.calls[1][1]
+    assert spec.image == "pyexec:foo"
+    assert spec.user == DockerTools.host_user()
+    assert spec.volumes == [
+        "{}:{}".format(context.joinpath("results"), DockerTools.results_mount)
+    ]
+    assert docker.output_size == 42
+    assert docker.resource_usage.cpu_time == 2.0
+
+    docker.remove_image()
+    assert "pyexec:foo" not in backend.images
+
+
+def test_failed_build(context):
+    backend = FakeBackend(failing_builds=["pyexec:foo"])
+    docker = _docker_tools(context, backend, clear_dangling_images=True)
+    docker.write_dockerfile()
+    with pytest.raises(BuildFailedException):
+        docker.build_image()
+    assert backend.calls[-1][0] == "prune_dangling_images"
+
+
+def test_run_timeout(context):
+    backend = FakeBackend(run_result=RunResult(None, "", "", 10.0, 0))
+    docker = _docker_tools(context, backend)
+    with pytest.raises(TimeoutException) as e:
+        docker.run_container(10.0)
+    assert e.value.stage == "test"
+
+
+def test_shards_run_in_containers_of_their_own(context):
+    backend = FakeBackend()
+    scheduler = Scheduler(1, 1, max_load=float("inf"))
+    docker = _docker_tools(context, backend, scheduler=scheduler)
+    commands = [["pytest", "a"], ["pytest", "b"]]
+    results = [context.joinpath("0"), context.joinpath("1")]
+    assert len(docker.run_containers(None, commands, results)) == 2
+    specs = sorted((spec for kind, spec in backend.calls), key=lambda s: s.name)
+    assert [spec.name for spec in specs] == ["foo-shard0", "foo-shard1"]
+    assert [spec.command for spec in specs] == commands
+    assert scheduler.summary()["run_admitted"] == 2
+
+
+def test_mounted_source(context):
+    backend = FakeBackend()
+    docker = _docker_tools(context, backend, mount_source=True)
+    docker.write_dockerfile()
+    assert "COPY" not in context.joinpath("Dockerfile").read_text()
+    docker.run_container(None)
+    spec = backend.calls[-1][1]
+    assert spec.volumes == ["{}:/mnt/Foo:ro".format(context.joinpath("Foo"))]
+    assert spec.workdir == "/tmp/Foo"
+    assert spec.user == DockerTools.host_user()
+    assert spec.command[-1] == "pytest"
+
+
+class _SlowBackend(FakeBackend):
+    """Records how many containers run at the same time."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def run(self, spec, timeout=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return super().run(spec, timeout)
+
+
+@pytest.mark.parametrize("max_runs, peak", [(1, 1), (2, 2), (4, 3)])
+def test_shards_are_limited_by_max_runs(context, max_runs, peak):
+    backend = _SlowBackend()
+    scheduler = Scheduler(1, max_runs, max_load=float("inf"), poll_interval=0.01)
+    docker = _docker_tools(context, backend, scheduler=scheduler)
+    commands = [["pytest", str(shard)] for shard in range(3)]
+    results = [context.joinpath(str(shard)) for shard in range(3)]
+    docker.run_containers(None, commands, results)
+    assert backend.peak == peak
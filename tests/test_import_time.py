@@ -0,0 +1,50 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# The miner itself needs these, the test cannot run without them
+pytest.importorskip("plumbum")
+pytest.importorskip("configargparse")
+
+# Packages only some stages need, importing the miner must not load them
+DEFERRED = ("requests", "bs4", "github", "pandas", "pyarrow", "setuptools")
+
+# Cumulative import time of pyexec.mining.miner in seconds
+BUDGET = 1.0
+
+
+def _import_miner():
+    script = (
+        "import sys\n"
+        "import pyexec.mining.miner\n"
+        "print('\\n'.join(sorted(sys.modules)))\n"
+    )
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=Path(__file__).resolve().parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_miner_defers_slow_imports():
+    modules = set(_import_miner().stdout.split())
+    loaded = [
+        name
+        for name in DEFERRED
+        if any(m == name or m.startswith(name + ".") for m in modules)
+    ]
+    assert loaded == []
+
+
+def test_miner_import_time():
+    # Lines of -X importtime read "import time: self [us] | cumulative | module"
+    cumulative = {
+        line.split("|")[2].strip(): int(line.split("|")[1])
+        for line in _import_miner().stderr.splitlines()
+        if line.startswith("import time:") and "cumulative" not in line
+    }
+    assert cumulative["pyexec.mining.miner"] / 1e6 < BUDGET
@@ -0,0 +1,84 @@
+import json
+import logging
+import sys
+
+from pyexec.util.logging import (
+    JsonFormatter,
+    RateLimitFilter,
+    configure_logging,
+    get_logger,
+    stop_logging,
+)
+
+
+def _record(level=logging.INFO, thread=1, msg="message"):
+    return logging.makeLogRecord(
+        {"msg": msg, "levelno": level, "levelname": "INFO", "thread": thread}
+    )
+
+
+def test_rate_limit_drops_messages_above_rate():
+    limiter = RateLimitFilter(2)
+    kept = [limiter.filter(_record()) for _ in range(5)]
+    assert kept == [True, True, False, False, False]
+
+
+def test_rate_limit_keeps_warnings_and_other_threads():
+    limiter = RateLimitFilter(1)
+    assert limiter.filter(_record())
+    assert not limiter.filter(_record())
+    assert limiter.filter(_record(level=logging.WARNING))
+    assert limiter.filter(_record(thread=2))
+
+
+def test_rate_limit_reports_suppressed_messages(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("pyexec.util.logging.time", lambda: now[0])
+    limiter = RateLimitFilter(1)
+    for _ in range(4):
+        limiter.filter(_record())
+    now[0] += 1.5
+    record = _record()
+    assert limiter.filter(record)
+    assert record.msg == "(3 messages suppressed) message"
+
+
+def test_rate_limit_leaves_log_file_complete(tmp_path, monkeypatch):
+    # get_logger leaves loggers alone whose ancestors have handlers, like pytest's
+    monkeypatch.setattr(logging.getLogger(), "handlers", [])
+    logfile = tmp_path.joinpath("log.txt")
+    configure_logging(console_level=logging.ERROR, rate_limit=1)
+    try:
+        logger = get_logger("Pyexec::RateLimitTest", logfile)
+        for i in range(5):
+            logger.info("message %d", i)
+        stop_logging()
+    finally:
+        configure_logging()
+    assert len(logfile.read_text().splitlines()) == 5
+
+
+def test_json_formatter_writes_one_object_per_record():
+    record = logging.makeLogRecord(
+        {
+            "name": "Pyexec::Test",
+            "msg": "%s done",
+            "args": ("build",),
+            "levelname": "INFO",
+        }
+    )
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["logger"] == "Pyexec::Test"
+    assert entry["level"] == "INFO"
+    assert entry["message"] == "build done"
+    assert "exception" not in entry
+
+
+def test_json_formatter_keeps_exception_apart():
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = logging.makeLogRecord({"msg": "failed", "exc_info": sys.exc_info()})
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "failed"
+    assert entry["exception"].endswith("ValueError: broken")
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("plumbum")
+
+from pyexec.mining.packageInfo import PackageInfo  # noqa: E402
+from pyexec.util.metrics import Histogram, Metrics  # noqa: E402
+from pyexec.util.resources import ResourceUsage  # noqa: E402
+
+
+def test_histogram_is_cumulative():
+    histogram = Histogram([1, 5, 0.5])
+    for value in [0.2, 3, 7]:
+        histogram.observe(value)
+    assert histogram.samples() == [
+        ("0.5", 1.0),
+        ("1", 1.0),
+        ("5", 2.0),
+        ("+Inf", 3.0),
+    ]
+    assert histogram.sum == pytest.approx(10.2)
+    assert histogram.count == 3
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.record(
+        PackageInfo(
+            "foo",
+            queue_wait_time=1.5,
+            stage_durations={"test": 20.0, "clone": 0.3},
+            stage_outcomes={"clone": "success", "test": "timeout"},
+            stage_bytes={"clone": 1024},
+            resource_usage={"test": ResourceUsage(2.5, 2048, 0, 0)},
+        )
+    )
+    metrics.record(PackageInfo("bar", stage_durations={"clone": 0.1}))
+    lines = metrics.render().splitlines()
+    assert "pyexec_packages_total 2" in lines
+    assert 'pyexec_stage_duration_seconds_bucket{stage="clone",le="0.5"} 2' in lines
+    assert 'pyexec_stage_duration_seconds_bucket{stage="test",le="10"} 0' in lines
+    assert 'pyexec_stage_duration_seconds_count{stage="test"} 1' in lines
+    assert 'pyexec_stage_outcomes_total{stage="test",outcome="timeout"} 1' in lines
+    assert 'pyexec_stage_bytes_total{stage="clone"} 1024' in lines
+    assert 'pyexec_stage_cpu_seconds_total{stage="test"} 2.5' in lines
+    assert 'pyexec_stage_peak_memory_bytes{stage="test"} 2048' in lines
+    assert "pyexec_queue_wait_seconds_total 1.5" in lines
+    # Stages are listed in the order packages go through them
+    durations = [line for line in lines if line.startswith("pyexec_stage_duration")]
+    assert 'stage="clone"' in durations[0]
+    assert 'stage="test"' in durations[-1]
+
+
+def test_write_replaces_the_file(tmp_path):
+    path = tmp_path.joinpath("pyexec.prom")
+    path.write_text("old")
+    Metrics().write(path)
+    assert path.read_text().startswith("# HELP pyexec_packages_total")
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,191 @@
+import json
+
+import pytest
+
+pytest.importorskip("plumbum")
+
+from pyexec.testrunner.runner import RunnerConfig  # noqa: E402
+from pyexec.testrunner.runners.pytestrunner import PytestRunner  # noqa: E402
+from pyexec.util.dependencies import Dependencies  # noqa: E402
+
+
+def _runner(tmp_path, coverage="off", python="3.8", **config):
+    tmp_path.joinpath("foo").mkdir()
+    return PytestRunner(
+        tmp_path,
+        "foo",
+        Dependencies("FROM python:{}".format(python)),
+        runner_config=RunnerConfig(coverage=coverage, **config),
+    )
+
+
+def _test(nodeid, when, outcome, start, stop, **report):
+    report.update(
+        {
+            "$report_type": "TestReport",
+            "nodeid": nodeid,
+            "when": when,
+            "outcome": outcome,
+            "start": start,
+            "stop": stop,
+            "duration": stop - start,
+        }
+    )
+    return report
+
+
+def _passed(nodeid, start):
+    return [
+        _test(nodeid, "setup", "passed", start, start + 0.1),
+        _test(nodeid, "call", "passed", start + 0.1, start + 1.0),
+        _test(nodeid, "teardown", "passed", start + 1.0, start + 1.1),
+    ]
+
+
+def _write(tmp_path, shard, name, entries):
+    results = tmp_path.joinpath("pyexec-results", str(shard))
+    results.mkdir(parents=True, exist_ok=True)
+    with open(results.joinpath(name), "w") as f:
+        for entry in entries:
+            f.write(entry if isinstance(entry, str) else json.dumps(entry))
+            f.write("\n")
+    return results
+
+
+def test_outcomes_are_counted_like_the_pytest_summary(tmp_path):
+    runner = _runner(tmp_path)
+    _write(
+        tmp_path,
+        0,
+        "report.jsonl",
+        _passed("test_a.py::test_pass", 100.0)
+        + [
+            _test("test_a.py::test_fail", "call", "failed", 102.0, 103.0),
+            _test("test_a.py::test_skip", "setup", "skipped", 103.0, 103.0),
+            _test("test_a.py::test_skip", "teardown", "passed", 103.0, 103.0),
+            _test("test_a.py::test_xf", "call", "skipped", 104.0, 105.0, wasxfail=""),
+            _test("test_a.py::test_xp", "call", "passed", 105.0, 106.0, wasxfail=""),
+            _test("test_a.py::test_error", "setup", "failed", 106.0, 107.0),
+            _test("test_a.py::test_error", "teardown", "passed", 107.0, 107.0),
+            {
+                "$report_type": "CollectReport",
+                "nodeid": "test_b.py",
+                "outcome": "failed",
+            },
+            {"$report_type": "WarningMessage"},
+            {"$report_type": "WarningMessage"},
+        ],
+    )
+    result, coverage = runner._extract_run_results()
+    assert coverage is None
+    counts = (result.failed, result.passed, result.skipped, result.xfailed)
+    assert counts == (1, 1, 1, 1)
+    assert (result.xpassed, result.error, result.warnings) == (1, 2, 2)
+    assert result.tests_time == pytest.approx(7.0)
+    # Without the session clock, the time falls back to that of the tests
+    assert result.time == pytest.approx(7.0)
+
+
+def test_session_time_is_the_wall_time_of_pytest(tmp_path):
+    runner = _runner(tmp_path)
+    results = _write(tmp_path, 0, "report.jsonl", _passed("test_a.py::test_a", 100.0))
+    results.joinpath("report.start").write_text("50.5\n")
+    results.joinpath("report.stop").write_text("60.0\n")
+    result, _ = runner._extract_run_results()
+    assert result.time == pytest.approx(9.5)
+    assert result.tests_time == pytest.approx(1.1)
+
+
+def test_interrupted_tests_are_reported_as_hung(tmp_path):
+    runner = _runner(tmp_path)
+    _write(
+        tmp_path,
+        0,
+        "report.jsonl",
+        _passed("test_a.py::test_a", 100.0)
+        + [
+            _test("test_a.py::test_hang", "setup", "passed", 101.5, 101.6),
+            '{"$report_type": "TestReport", "nodeid": "cut off',
+        ],
+    )
+    result, _ = runner._extract_run_results()
+    assert result.passed == 1
+    assert result.failed == 1
+    assert runner.hung_tests == ["test_a.py::test_hang"]
+
+
+def test_missing_report_log(tmp_path):
+    runner = _runner(tmp_path)
+    tmp_path.joinpath("pyexec-results", "0").mkdir(parents=True)
+    with pytest.raises(ValueError):
+        runner._extract_run_results()
+
+
+def test_shards_are_merged(tmp_path):
+    runner = _runner(tmp_path, coverage="full", time_without_coverage=True)
+    for shard, lines in enumerate([[1, 2], [2, 3]]):
+        _write(
+            tmp_path,
+            shard,
+            "report.jsonl",
+            _passed("test_{}.py::test".format(shard), 100.0 + shard),
+        )
+        _write(
+            tmp_path,
+            shard,
+            "coverage-report.jsonl",
+            _passed("test_{}.py::test".format(shard), 200.0),
+        )
+        coverage = {
+            "files": {
+                "foo.py": {
+                    "executed_lines": lines,
+                    "summary": {"num_statements": 4, "excluded_lines": 0},
+                }
+            }
+        }
+        _write(tmp_path, shard, "coverage.json", [coverage])
+    result, coverage = runner._extract_run_results(2)
+    assert result.passed == 2
+    assert result.coverage_time == pytest.approx(1.1)
+    # Line 2 was covered by both shards but counts once
+    assert coverage.covered_lines == 3
+    assert coverage.percentage_covered == 75.0
+    assert runner.file_coverage["foo.py"].missing_lines == 1
+
+
+def test_test_results_are_kept_without_coverage(tmp_path):
+    runner = _runner(tmp_path, coverage="full", time_without_coverage=True)
+    # The suite ran out of time before the run measuring coverage finished
+    _write(tmp_path, 0, "report.jsonl", _passed("test_a.py::test_a", 100.0))
+    result, coverage = runner._extract_run_results()
+    assert result.passed == 1
+    assert result.coverage_time is None
+    assert coverage is None
+    assert runner.file_coverage == dict()
+
+
+def test_tests_run_once_under_coverage_by_default(tmp_path):
+    runner = _runner(tmp_path, coverage="full")
+    results = _write(tmp_path, 0, "report.jsonl", _passed("test_a.py::test_a", 100.0))
+    results.joinpath("report.start").write_text("10.0\n")
+    results.joinpath("report.stop").write_text("14.0\n")
+    coverage = {
+        "files": {
+            "foo.py": {
+                "executed_lines": [1],
+                "summary": {"num_statements": 2, "excluded_lines": 0},
+            }
+        }
+    }
+    _write(tmp_path, 0, "coverage.json", [coverage])
+    result, coverage = runner._extract_run_results()
+    assert result.time == result.coverage_time == pytest.approx(4.0)
+    assert coverage.percentage_covered == 50.0
+
+
+@pytest.mark.parametrize(
+    "python, mode", [("3.8", "full"), ("3.11", "full"), ("3.12", "sysmon")]
+)
+def test_sysmon_needs_python_3_12(tmp_path, python, mode):
+    assert _runner(tmp_path, coverage="sysmon", python=python).coverage_mode == mode
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("plumbum")
+
+from pyexec.mining.githubrequest import GitHubInfo  # noqa: E402
+from pyexec.mining.packageInfo import PackageInfo  # noqa: E402
+from pyexec.mining.records import (  # noqa: E402
+    RecordReader,
+    RecordWriter,
+    from_record,
+    to_record,
+)
+from pyexec.testrunner import runresult  # noqa: E402
+from pyexec.util.dependencies import Dependencies  # noqa: E402
+from pyexec.util.resources import ResourceUsage  # noqa: E402
+
+
+def _package(name="foo"):
+    dockerfile = Dependencies("FROM python:3.8")
+    dockerfile.add_pip_dependency("pytest", "7.0")
+    return PackageInfo(
+        name,
+        project_on_pypi=True,
+        github_repo=("owner", name),
+        dockerfile=dockerfile,
+        github_info=GitHubInfo(datetime(2020, 1, 1), datetime(2021, 6, 1)),
+        test_result=(
+            runresult.TestResult(1, 2, 0, 0, 0, 3, 0, 4.5, 9.0, 3.0),
+            runresult.CoverageResult(8, 10, 80.0, 2, 0),
+        ),
+        test_cases=[runresult.TestCaseResult("test_foo.py::test_a", "passed", 0.5)],
+        stage_durations={"build": 10.0},
+        resource_usage={"test": ResourceUsage(1.0, 2, 3, 4)},
+    )
+
+
+def test_record_round_trip():
+    info = from_record(to_record(_package()))
+    expected = _package()
+    assert info.github_repo == expected.github_repo
+    assert info.github_info == expected.github_info
+    assert info.test_result == expected.test_result
+    assert info.test_cases == expected.test_cases
+    assert info.resource_usage == expected.resource_usage
+    assert info.dockerfile.pip_dependencies() == {"pytest": "7.0"}
+
+
+def test_unknown_schema_is_rejected():
+    record = to_record(_package())
+    record["schema"] = 0
+    with pytest.raises(ValueError):
+        from_record(record)
+
+
+def test_written_records_are_read_back(tmp_path):
+    path = tmp_path.joinpath("records.jsonl")
+    with RecordWriter(path) as writer:
+        writer.write(_package("foo"))
+        writer.write(_package("bar"))
+    with open(path, "a") as f:
+        f.write('{"schema": 1, "name": "cut off')
+    reader = RecordReader(path)
+    assert [info.name for info in reader.packages()] == ["foo", "bar"]
+    assert reader.names() == ["foo", "bar"]
+    assert reader.get("bar")[0]["name"] == "bar"
+    assert reader.get("baz") == []
@@ -0,0 +1,32 @@
+from pyexec.util.resources import ResourceUsage, engine_usage
+
+
+def test_add_sums_usage_and_keeps_the_peak_memory():
+    usage = ResourceUsage(1.0, 100, 10, 5)
+    usage.add(ResourceUsage(2.0, 50, 20, 5))
+    assert usage == ResourceUsage(3.0, 100, 30, 10)
+
+
+def test_engine_usage():
+    stats = {
+        "cpu_stats": {"cpu_usage": {"total_usage": 2_500_000_000}},
+        "memory_stats": {"usage": 1024, "max_usage": 4096},
+        "blkio_stats": {
+            "io_service_bytes_recursive": [
+                {"op": "Read", "value": 100},
+                {"op": "Write", "value": 300},
+                {"op": "write", "value": 200},
+            ]
+        },
+        "networks": {
+            "eth0": {"rx_bytes": 10, "tx_bytes": 20},
+            "eth1": {"rx_bytes": 1, "tx_bytes": 2},
+        },
+    }
+    assert engine_usage(stats) == ResourceUsage(2.5, 4096, 500, 33)
+
+
+def test_engine_usage_of_cgroup_v2_and_missing_stats():
+    stats = {"memory_stats": {"usage": 1024}, "blkio_stats": {}, "networks": None}
+    assert engine_usage(stats) == ResourceUsage(0.0, 1024, 0, 0)
+    assert engine_usage(dict()) == ResourceUsage()
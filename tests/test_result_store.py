@@ -0,0 +1,139 @@
+import csv
+import sqlite3
+
+import pytest
+
+pytest.importorskip("plumbum")
+pytest.importorskip("configargparse")
+
+from pyexec.mining.packageInfo import PackageInfo  # noqa: E402
+from pyexec.mining.resultStore import ResultStore  # noqa: E402
+from pyexec.testrunner import runresult  # noqa: E402
+from pyexec.util.csv import CSV  # noqa: E402
+from pyexec.util.dependencies import Dependencies  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(tmp_path.joinpath("results.db"))
+    yield store
+    store.close()
+
+
+def _add(store, run_id, name, **info):
+    package = PackageInfo(name, **info)
+    store.add(run_id, package, CSV().to_stats(package))
+
+
+def test_runs_and_packages(store, tmp_path):
+    run_id = store.start_run(tmp_path)
+    _add(store, run_id, "foo")
+    _add(store, run_id, "bar")
+    runs = store.runs()
+    assert [(row["id"], row["packages"]) for row in runs] == [(run_id, 2)]
+    assert runs[0]["output_dir"] == str(tmp_path)
+    assert len(store.package("foo")) == 1
+
+
+def test_failed_builds_and_timeouts(store, tmp_path):
+    for _ in range(2):
+        run_id = store.start_run(tmp_path)
+        _add(store, run_id, "broken", dockerfile=Dependencies("FROM python:3.8"))
+        _add(
+            store,
+            run_id,
+            "slow",
+            dockerfile=Dependencies("FROM python:3.8"),
+            dockerimage_build=True,
+            timed_out_stage="test",
+            stage_durations={"build": 5.0},
+        )
+    assert [tuple(row) for row in store.failed_builds()] == [("broken", 2)]
+    timeouts = store.timeouts("test")
+    assert [(row["name"], row["stage"]) for row in timeouts] == [("slow", "test")] * 2
+    assert store.timeouts("build") == []
+
+
+def test_tests_are_stored(store, tmp_path):
+    run_id = store.start_run(tmp_path)
+    _add(
+        store,
+        run_id,
+        "foo",
+        test_cases=[
+            runresult.TestCaseResult("test_foo.py::test_a", "passed", 0.5),
+            runresult.TestCaseResult("test_foo.py::test_b", "failed", 9.0, True),
+        ],
+    )
+    rows = store.query("SELECT nodeid, timed_out FROM tests ORDER BY nodeid")
+    assert [tuple(row) for row in rows] == [
+        ("test_foo.py::test_a", 0),
+        ("test_foo.py::test_b", 1),
+    ]
+
+
+def test_export_csv(store, tmp_path):
+    run_id = store.start_run(tmp_path)
+    _add(store, run_id, "foo", project_on_pypi=True)
+    path = tmp_path.joinpath("stats.csv")
+    assert store.export_csv(run_id, path) == 1
+    with open(path, newline="") as f:
+        row = next(csv.DictReader(f))
+    assert row["name"] == "foo"
+    assert row["project_on_pypi"] == "True"
+    assert row["failed"] == "-1"
+
+
+def test_missing_columns_are_added(tmp_path):
+    path = tmp_path.joinpath("results.db")
+    connection = sqlite3.connect(str(path))
+    connection.execute(
+        "CREATE TABLE packages (id INTEGER PRIMARY KEY, run_id INTEGER, name TEXT)"
+    )
+    connection.close()
+    store = ResultStore(path)
+    columns = {row["name"] for row in store.query("PRAGMA table_info(packages)")}
+    store.close()
+    assert {"tests_time", "coverage_time", "network_bytes"} <= columns
+
+
+def test_read_only_store_is_not_written(store, tmp_path):
+    store.start_run(tmp_path)
+    reader = ResultStore(tmp_path.joinpath("results.db"), read_only=True)
+    try:
+        assert len(reader.runs()) == 1
+        with pytest.raises(sqlite3.OperationalError):
+            reader.start_run(tmp_path)
+    finally:
+        reader.close()
+
+
+def test_stage_outcomes(store, tmp_path):
+    run_id = store.start_run(tmp_path)
+    _add(
+        store,
+        run_id,
+        "foo",
+        stage_durations={"clone": 1.0, "build": 20.0},
+        stage_outcomes={"pypi": "failure", "clone": "success", "build": "failure"},
+    )
+    rows = store.stages(outcome="failure")
+    assert [(row["stage"], row["duration"]) for row in rows] == [
+        ("build", 20.0),
+        ("pypi", None),
+    ]
+    assert [row["outcome"] for row in store.stages("clone")] == ["success"]
+
+
+def test_outcome_column_is_added_to_stages(tmp_path):
+    path = tmp_path.joinpath("results.db")
+    connection = sqlite3.connect(str(path))
+    connection.execute(
+        "CREATE TABLE stages (package_id INTEGER NOT NULL, stage TEXT NOT NULL, "
+        "duration REAL, timed_out INTEGER NOT NULL)"
+    )
+    connection.close()
+    store = ResultStore(path)
+    columns = [row["name"] for row in store.query("PRAGMA table_info(stages)")]
+    store.close()
+    assert columns[-1] == "outcome"
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from pyexec.dockerTools.scheduler import Scheduler
+
+
+def _run_concurrently(slot, count):
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def work():
+        with slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return peak[0]
+
+
+def test_runs_are_limited():
+    scheduler = Scheduler(1, 2, max_load=float("inf"), poll_interval=0.01)
+    assert _run_concurrently(scheduler.run_slot, 5) == 2
+
+
+def test_builds_are_limited():
+    scheduler = Scheduler(1, 2, max_load=float("inf"), poll_interval=0.01)
+    assert _run_concurrently(scheduler.build_slot, 3) == 1
+
+
+def test_builds_and_runs_are_admitted_independently():
+    scheduler = Scheduler(1, 1, max_load=float("inf"))
+    with scheduler.build_slot() as build_waited, scheduler.run_slot() as run_waited:
+        assert build_waited < 1.0
+        assert run_waited < 1.0
+
+
+def test_work_is_admitted_on_a_busy_host_if_nothing_runs():
+    scheduler = Scheduler(1, 1, max_load=-1.0, poll_interval=0.01)
+    with scheduler.run_slot():
+        pass
+    assert scheduler.summary()["run_admitted"] == 1
+
+
+def test_summary_counts_admitted_work():
+    scheduler = Scheduler(2, 2, max_load=float("inf"))
+    for _ in range(3):
+        with scheduler.build_slot():
+            pass
+    summary = scheduler.summary()
+    assert summary["build_admitted"] == 3
+    assert summary["run_admitted"] == 0
+    assert summary["build_waited"] >= 0.0
+
+
+def test_container_limits():
+    scheduler = Scheduler(cpus=1.5, memory=2 ** 30)
+    assert scheduler.cpus == 1.5
+    assert scheduler.memory == 2 ** 30
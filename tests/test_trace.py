@@ -0,0 +1,31 @@
+import json
+
+from pyexec.util.trace import Tracer
+
+
+def test_spans_are_written_as_complete_events(tmp_path):
+    path = tmp_path.joinpath("trace.json")
+    tracer = Tracer(path)
+    with tracer.span("docker build", "docker", tag="pyexec:foo"):
+        pass
+    tracer.close()
+    events = json.loads(path.read_text())
+    assert [e["ph"] for e in events] == ["M", "X"]
+    span = events[1]
+    assert span["name"] == "docker build"
+    assert span["cat"] == "docker"
+    assert span["args"] == {"tag": "pyexec:foo"}
+    assert span["dur"] >= 0
+    assert events[0]["tid"] == span["tid"]
+
+
+def test_unclosed_trace_is_readable(tmp_path):
+    path = tmp_path.joinpath("trace.json")
+    tracer = Tracer(path, buffer_size=3)
+    for name in ["clone", "build", "test"]:
+        tracer.add(name, "stage", 0.0, 1.0)
+    # A crash leaves out the closing bracket, which the format allows
+    text = path.read_text()
+    events = json.loads(text + "]")
+    assert [e["name"] for e in events] == ["thread_name", "clone", "build"]
+    tracer.close()
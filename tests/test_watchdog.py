@@ -0,0 +1,67 @@
+import pytest
+
+from pyexec.util.exceptions import TimeoutException
+from pyexec.util.watchdog import Deadlines, Watchdog
+
+
+def test_unlimited_stages_have_no_timeout():
+    watchdog = Watchdog(Deadlines())
+    assert watchdog.timeout("build") is None
+    assert watchdog.deadline is None
+
+
+def test_stage_timeout_is_bounded_by_the_package():
+    watchdog = Watchdog(Deadlines(build=600.0, test=1.0, package=60.0))
+    assert 59.0 < watchdog.timeout("build") <= 60.0
+    assert watchdog.timeout("test") == 1.0
+    assert 59.0 < watchdog.timeout("clone") <= 60.0
+
+
+def test_stage_records_duration_and_outcome():
+    watchdog = Watchdog(Deadlines(build=10.0))
+    with watchdog.stage("build") as timeout:
+        assert timeout == 10.0
+    with pytest.raises(RuntimeError):
+        with watchdog.stage("test"):
+            raise RuntimeError()
+    assert watchdog.outcomes == {"build": "success", "test": "failure"}
+    assert set(watchdog.durations) == {"build", "test"}
+    assert watchdog.timed_out_stage is None
+
+
+def test_stage_without_time_left_times_out():
+    watchdog = Watchdog(Deadlines(package=0.0))
+    with pytest.raises(TimeoutException):
+        with watchdog.stage("clone"):
+            pass
+    assert watchdog.timed_out_stage == "clone"
+
+
+def test_first_timed_out_stage_is_kept():
+    watchdog = Watchdog(Deadlines())
+    for stage in ["build", "test"]:
+        with pytest.raises(TimeoutException):
+            with watchdog.stage(stage):
+                raise TimeoutException("Timeout", stage)
+    assert watchdog.timed_out_stage == "build"
+    assert watchdog.outcomes == {"build": "timeout", "test": "timeout"}
+
+
+def test_split_moves_time_between_stages():
+    watchdog = Watchdog(Deadlines())
+    with watchdog.stage("test"):
+        pass
+    test = watchdog.durations["test"]
+    watchdog.split("test", "build", 2.0)
+    assert watchdog.durations["test"] == pytest.approx(test - 2.0)
+    assert watchdog.durations["build"] == 2.0
+
+
+def test_bytes_and_usage_accumulate():
+    watchdog = Watchdog(Deadlines())
+    watchdog.add_bytes("clone", 10)
+    watchdog.add_bytes("clone", 5)
+    watchdog.usage("test").cpu_time += 1.0
+    watchdog.usage("test").cpu_time += 1.0
+    assert watchdog.bytes == {"clone": 15}
+    assert watchdog.resource_usage["test"].cpu_time == 2.0
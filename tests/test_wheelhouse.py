@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+pytest.importorskip("plumbum")
+
+from pyexec.dockerTools.wheelhouse import Wheelhouse  # noqa: E402
+
+_USER_AGENT = (
+    'pip/23.0.1 {"installer":{"name":"pip","version":"23.0.1"},'
+    '"python":"3.11.4","implementation":{"name":"CPython"}}'
+)
+
+
+def test_python_version_of_user_agent():
+    assert Wheelhouse._python_version_of(_USER_AGENT) == "3.11"
+    assert Wheelhouse._python_version_of("curl/8.0") is None
+    assert Wheelhouse._python_version_of(None) is None
+
+
+def test_python_versions_of_builds_are_stored(tmp_path):
+    wheelhouse = Wheelhouse(tmp_path, 1024, offline=True)
+    wheel = "foo-1.0-cp38-cp38-manylinux2014_x86_64.whl"
+    tmp_path.joinpath("files", wheel).write_bytes(b"wheel")
+
+    assert wheelhouse._serve_project("foo", "3.11")[0] == 200
+    assert wheelhouse._serve_project("bar", "3.11")[0] == 404
+    wheelhouse.stop()
+
+    with open(tmp_path.joinpath("python-versions.json")) as f:
+        assert json.load(f) == {"3.11": 2}